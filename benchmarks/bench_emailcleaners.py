@@ -0,0 +1,70 @@
+"""
+Benchmark cleaning @-mentions from long email bodies.
+
+Compares the original two-regex ``at_mention_cleaner`` with the current
+single-pass cleaner, on inputs that are hard for the original: long runs
+of punctuation (which the ``[^A-Za-z0-9]+`` prefix backtracks over),
+quoted email threads, and many mentions. Time per megabyte should stay
+flat for the current cleaner as the input grows.
+
+Usage::
+
+    python benchmarks/bench_emailcleaners.py --sizes 0.01 0.1 1 4
+"""
+import argparse
+import re
+import time
+
+from ticgithub.emailcleaners import clean_content
+
+
+def original_cleaner(content):
+    regex = re.compile("(?P<pre>[^A-Za-z0-9]+)@(?P<post>[A-Za-z0-9])")
+    replacement = r"\g<pre>@<!-- -->\g<post>"
+    if not re.fullmatch(regex, content):
+        content = re.sub(regex, replacement, content)
+    at_starts = re.compile("^(?P<pre>)@(?P<post>[A-Za-z0-9])")
+    content = re.sub(at_starts, replacement, content)
+    return content
+
+
+INPUTS = {
+    'punctuation': lambda n: "-" * n,
+    'quoted-thread': lambda n: ("> > > On Monday, @someone wrote:\n" * n)[:n],
+    'mentions': lambda n: (" @user" * n)[:n],
+}
+
+
+def time_it(func, content):
+    start = time.perf_counter()
+    result = func(content)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=float, nargs="+",
+                        default=[0.01, 0.1, 1, 4],
+                        help="input sizes in MB")
+    parser.add_argument("--original-max", type=float, default=0.03,
+                        help="largest size (MB) to run the original on")
+    opts = parser.parse_args()
+
+    print(f"{'input':<15}{'MB':>8}{'original s':>12}{'current s':>12}"
+          f"{'current s/MB':>14}")
+    for name, make in INPUTS.items():
+        for size in opts.sizes:
+            content = make(int(size * 1e6))
+            new_time, new = time_it(clean_content, content)
+            if size <= opts.original_max:
+                orig_time, orig = time_it(original_cleaner, content)
+                assert orig == new
+                orig_str = f"{orig_time:>12.3f}"
+            else:
+                orig_str = f"{'(skipped)':>12}"
+            print(f"{name:<15}{size:>8.2f}{orig_str}{new_time:>12.3f}"
+                  f"{new_time / size:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
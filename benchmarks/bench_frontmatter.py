@@ -0,0 +1,64 @@
+"""
+Benchmark parsing the ticket frontmatter of issue bodies.
+
+Compares the original approach (``yaml.load_all`` with the pure-Python
+``FullLoader``, over the whole body) with :meth:`.Issue._get_frontmatter`.
+
+Usage::
+
+    python benchmarks/bench_frontmatter.py --issues 2000 --body-lines 200
+"""
+import argparse
+import time
+from datetime import datetime
+
+import yaml
+
+from ticgithub.issues import Issue, FrontmatterLoader
+
+
+def make_body(n, body_lines):
+    frontmatter = {
+        'ticket_id': f"<message-{n}@example.com>",
+        'From': f"Someone {n} <someone{n}@example.com>",
+        'Date': str(datetime(2023, 1, 1, 10, n % 60)),
+        'Subject': f"Question number {n}",
+    }
+    email = "\n".join(
+        f"> line {i} of a long quoted email thread: key: value, [x], {{y}}"
+        for i in range(body_lines)
+    )
+    return yaml.dump(frontmatter) + "\n---\n" + email
+
+
+def original_frontmatter(body):
+    for frontmatter in yaml.load_all(body, Loader=yaml.FullLoader):
+        break
+    return frontmatter
+
+
+def time_it(func, bodies):
+    start = time.perf_counter()
+    ids = [func(body)['ticket_id'] for body in bodies]
+    return time.perf_counter() - start, ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--issues", type=int, default=2000)
+    parser.add_argument("--body-lines", type=int, default=200)
+    opts = parser.parse_args()
+
+    bodies = [make_body(n, opts.body_lines) for n in range(opts.issues)]
+    print(f"{opts.issues} bodies, {opts.body_lines} lines of email each; "
+          f"loader: {FrontmatterLoader.__name__}")
+    orig_time, orig_ids = time_it(original_frontmatter, bodies)
+    new_time, new_ids = time_it(Issue._get_frontmatter, bodies)
+    assert orig_ids == new_ids
+    print(f"{'original':<12}{orig_time:>10.3f} s")
+    print(f"{'current':<12}{new_time:>10.3f} s")
+    print(f"speedup: {orig_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
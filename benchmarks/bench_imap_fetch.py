@@ -0,0 +1,52 @@
+"""
+Benchmark per-message vs. batched IMAP FETCH against a local fake server.
+
+The fake server sleeps for ``--latency`` seconds before answering each
+command, which stands in for the network round trip to a real IMAP server.
+
+Usage::
+
+    python benchmarks/bench_imap_fetch.py --messages 300 --latency 0.005
+"""
+import argparse
+import os
+import time
+
+from ticgithub.inbox import Inbox
+from ticgithub.gmail import GMailInbox
+from ticgithub.tests.fakeimap import FakeIMAPServer, make_raw_email, plain_inbox
+
+
+def run_once(server, inbox_cls, batch_size):
+    server.state.reset_counters()
+    inbox = plain_inbox(inbox_cls, server, batch_size=batch_size)
+    start = time.perf_counter()
+    emails = inbox.get_emails()
+    elapsed = time.perf_counter() - start
+    return len(emails), len(server.state.commands), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--batch-sizes", type=int, nargs="+",
+                        default=[1, 50, 100, 500])
+    opts = parser.parse_args()
+
+    os.environ.setdefault("FAKE_IMAP_PASSWORD", "password")
+    messages = [make_raw_email(n) for n in range(opts.messages)]
+    print(f"{opts.messages} messages, {opts.latency * 1000:.1f} ms/command")
+    print(f"{'inbox':<12}{'batch':>8}{'commands':>10}{'seconds':>10}")
+    with FakeIMAPServer(messages, latency=opts.latency) as server:
+        for inbox_cls in [Inbox, GMailInbox]:
+            for batch_size in opts.batch_sizes:
+                n_msgs, n_cmds, elapsed = run_once(server, inbox_cls,
+                                                   batch_size)
+                assert n_msgs == opts.messages
+                print(f"{inbox_cls.__name__:<12}{batch_size:>8}"
+                      f"{n_cmds:>10}{elapsed:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark parsing large multipart messages in a pool of processes.
+
+Each synthetic message is an HTML newsletter with a plain-text
+alternative and a binary attachment. The baseline parses each message in
+this process and extracts its content with :meth:`.Message.get_content`;
+the pool runs use :class:`.ParserPool` with increasing numbers of workers.
+
+Usage::
+
+    python benchmarks/bench_mime_parsing.py --messages 500 --workers 1 2 4
+"""
+import argparse
+import os
+import time
+from email.message import EmailMessage
+
+from ticgithub.inbox import Message
+from ticgithub.parsing import ParserPool
+
+
+def make_message(n, html_kb, attachment_kb):
+    msg = EmailMessage()
+    msg["From"] = f"Newsletter {n} <news{n}@example.com>"
+    msg["To"] = "inbox@example.com"
+    msg["Subject"] = f"Issue {n} of the newsletter"
+    msg["Date"] = "Mon, 02 Jan 2023 10:00:00 +0000"
+    msg["Message-ID"] = f"<newsletter-{n}@example.com>"
+    paragraph = f"<p>Paragraph of newsletter {n}, with <b>markup</b>.</p>\n"
+    html = paragraph * (html_kb * 1024 // len(paragraph))
+    msg.set_content(f"Plain text version of newsletter {n}\n" * 50)
+    msg.add_alternative(f"<html><body>{html}</body></html>",
+                        subtype="html")
+    msg.add_attachment(os.urandom(attachment_kb * 1024),
+                       maintype="application", subtype="pdf",
+                       filename=f"issue-{n}.pdf")
+    return msg.as_bytes()
+
+
+def serial(raws):
+    return [Message(b"", raw).get_content() for raw in raws]
+
+
+def pooled(raws, workers):
+    pool = ParserPool(workers)
+    try:
+        pool.map(raws[:workers])  # start the worker processes
+        start = time.perf_counter()
+        records = pool.map(raws)
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.shutdown()
+    return [record.get_content(["text/plain", "text/html"])
+            for record in records], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--html-kb", type=int, default=200)
+    parser.add_argument("--attachment-kb", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=[1, 2, 4, 8])
+    opts = parser.parse_args()
+
+    raws = [make_message(n, opts.html_kb, opts.attachment_kb)
+            for n in range(opts.messages)]
+    total_mb = sum(len(raw) for raw in raws) / 1e6
+    print(f"{opts.messages} messages, {total_mb:.1f} MB; "
+          f"{os.cpu_count()} CPUs")
+
+    start = time.perf_counter()
+    expected = serial(raws)
+    serial_time = time.perf_counter() - start
+    print(f"{'workers':<10}{'seconds':>10}{'speedup':>10}")
+    print(f"{'serial':<10}{serial_time:>10.3f}{1:>10.1f}")
+    for workers in opts.workers:
+        contents, elapsed = pooled(raws, workers)
+        assert contents == expected
+        print(f"{workers:<10}{elapsed:>10.3f}"
+              f"{serial_time / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
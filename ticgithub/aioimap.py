@@ -0,0 +1,336 @@
+# asyncio-based IMAP backend that pipelines commands
+import asyncio
+import collections
+import imaplib
+import itertools
+import re
+import ssl
+import threading
+
+from .inbox import Inbox, uid_sequence_set, split_fetch_response, _chunks
+from .gmail import GMailInbox
+
+import logging
+_logger = logging.getLogger(__name__)
+
+__all__ = ["AsyncIMAPConnection", "PipelinedIMAP", "AsyncInbox",
+           "AsyncGMailInbox"]
+
+_LITERAL = re.compile(rb"\{(?P<size>\d+)\}$")
+_TAGGED = re.compile(rb"(?P<tag>[A-Za-z0-9]+) (?P<type>[A-Z]+)( (?P<data>.*))?$",
+                     re.DOTALL)
+_UNTAGGED_STATUS = re.compile(
+    rb"\* (?P<data>\d+) (?P<type>[A-Z-]+)( (?P<data2>.*))?$", re.DOTALL
+)
+_UNTAGGED = re.compile(rb"\* (?P<type>[A-Z-]+)( (?P<data>.*))?$", re.DOTALL)
+_RESPONSE_CODE = re.compile(rb"\[(?P<type>[A-Z-]+)( (?P<data>[^\]]*))?\]")
+
+
+def _first_line(items):
+    first = items[0]
+    return first[0] if isinstance(first, tuple) else first
+
+
+def _replace_first_line(items, line):
+    first = items[0]
+    items[0] = (line, first[1]) if isinstance(first, tuple) else line
+
+
+class AsyncIMAPConnection:
+    """Minimal asyncio IMAP4rev1 client that allows pipelining.
+
+    Any number of commands can be in flight at once. Untagged responses are
+    attributed to the oldest command that hasn't completed yet, which is
+    correct because servers process pipelined FETCH, STORE, and SEARCH
+    commands in order.
+
+    Response data has the same format as in imaplib: a list of bytes, with
+    ``(header, literal)`` tuples for responses that include literals.
+    """
+    def __init__(self, host, port=993, ssl_context=None):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.untagged = collections.defaultdict(list)
+        self._tags = (f"A{n:04d}".encode() for n in itertools.count(1))
+        self._pending = collections.deque()
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._error = None
+
+    async def open(self):
+        self._reader, self._writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl_context
+        )
+        self._dispatch(await self._read_response())  # greeting
+        self._read_task = asyncio.ensure_future(self._read_loop())
+
+    async def _readline(self):
+        line = await self._reader.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("socket error: EOF")
+        return line[:-2] if line.endswith(b"\r\n") else line.rstrip(b"\n")
+
+    async def _read_response(self):
+        line = await self._readline()
+        items = []
+        while match := _LITERAL.search(line):
+            size = int(match.group('size'))
+            items.append((line, await self._reader.readexactly(size)))
+            line = await self._readline()
+        items.append(line)
+        return items
+
+    def _dispatch(self, items):
+        line = _first_line(items)
+        if line.startswith(b"+"):
+            raise imaplib.IMAP4.abort("unexpected continuation request")
+
+        if not line.startswith(b"* "):
+            match = _TAGGED.match(line)
+            if not match:
+                raise imaplib.IMAP4.abort(f"unexpected response: {line!r}")
+            tag = match.group('tag')
+            for pending in self._pending:
+                if pending[0] == tag:
+                    break
+            else:
+                raise imaplib.IMAP4.abort(f"unexpected tag {tag!r}")
+            self._pending.remove(pending)
+            _, future, untagged = pending
+            if not future.done():
+                typ = match.group('type').decode()
+                future.set_result((typ, [match.group('data') or b""],
+                                   untagged))
+            return
+
+        if match := _UNTAGGED_STATUS.match(line):
+            data = match.group('data')
+            if match.group('data2'):
+                data += b" " + match.group('data2')
+        else:
+            match = _UNTAGGED.match(line)
+            data = match.group('data') or b""
+        typ = match.group('type').decode()
+        _replace_first_line(items, data)
+
+        untagged = self._pending[0][2] if self._pending else self.untagged
+        untagged[typ].extend(items)
+        if typ in ("OK", "NO", "BAD", "PREAUTH", "BYE"):
+            if code := _RESPONSE_CODE.match(data):
+                untagged[code.group('type').decode()].append(
+                    code.group('data') or b""
+                )
+
+    async def _read_loop(self):
+        try:
+            while True:
+                self._dispatch(await self._read_response())
+        except (imaplib.IMAP4.abort, OSError,
+                asyncio.IncompleteReadError) as e:
+            if not isinstance(e, imaplib.IMAP4.abort):
+                e = imaplib.IMAP4.abort(f"socket error: {e}")
+            self._fail(e)
+
+    def _fail(self, error):
+        self._error = error
+        while self._pending:
+            _, future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    async def command(self, name, *args):
+        """Send a command and wait for it to complete.
+
+        Returns
+        -------
+        Tuple[str, List[bytes], Dict[str, List]] :
+            the status (e.g., ``"OK"``), the text of the tagged response,
+            and the untagged responses received for this command
+        """
+        if self._error is not None:
+            raise self._error
+
+        tag = next(self._tags)
+        future = asyncio.get_running_loop().create_future()
+        # register before writing, so that commands are answered in the
+        # order they were registered
+        self._pending.append((tag, future, collections.defaultdict(list)))
+        parts = [tag, name.encode()]
+        parts += [arg.encode() if isinstance(arg, str) else arg
+                  for arg in args]
+        self._writer.write(b" ".join(parts) + b"\r\n")
+        await self._writer.drain()
+        return await future
+
+    async def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+        self._fail(imaplib.IMAP4.abort("connection closed"))
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+
+
+class PipelinedIMAP:
+    """Blocking, imaplib-like interface to :class:`.AsyncIMAPConnection`.
+
+    The connection runs on an event loop in a background thread. The
+    methods used by :class:`.Inbox` behave like their imaplib equivalents;
+    :meth:`.uid_pipelined` keeps several commands in flight at once.
+
+    Parameters
+    ----------
+    depth : int
+        maximum number of pipelined commands in flight
+    """
+    def __init__(self, host, port=993, ssl_context=None, depth=4):
+        self.depth = depth
+        self._untagged = collections.defaultdict(list)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        daemon=True)
+        # wait until the loop runs, so that _submit can rely on is_running
+        started = threading.Event()
+        self._loop.call_soon(started.set)
+        self._thread.start()
+        started.wait()
+        self._conn = AsyncIMAPConnection(host, port, ssl_context)
+        try:
+            self._call(self._conn.open())
+        except Exception:
+            self._stop()
+            raise
+
+    def _submit(self, coro):
+        if not self._loop.is_running():
+            coro.close()
+            raise imaplib.IMAP4.abort("connection closed")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _call(self, coro):
+        return self._submit(coro).result()
+
+    def _stop(self):
+        if self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        self._loop.close()
+
+    def _result(self, name, response, untagged_name):
+        typ, data, untagged = response
+        if typ == "BAD":
+            raise imaplib.IMAP4.error(f"{name} command error: {typ} {data}")
+        result = untagged.pop(untagged_name, [None])
+        for key, value in untagged.items():
+            self._untagged[key].extend(value)
+        if typ == "NO":
+            return typ, data
+        return typ, result
+
+    def _simple(self, name, *args):
+        response = self._call(self._conn.command(name, *args))
+        return self._result(name, response, name)
+
+    def login(self, user, password):
+        quoted = password.replace("\\", "\\\\").replace('"', '\\"')
+        typ, data = self._simple("LOGIN", user, f'"{quoted}"')
+        if typ != "OK":
+            raise imaplib.IMAP4.error(data[-1])
+        return typ, data
+
+    def select(self, mailbox="INBOX"):
+        self._untagged.clear()
+        return self._simple("SELECT", mailbox)[0], self._untagged["EXISTS"]
+
+    def response(self, code):
+        return code, self._untagged.pop(code, [None])
+
+    def noop(self):
+        return self._simple("NOOP")
+
+    @staticmethod
+    def _uid_response_name(command):
+        command = command.upper()
+        return command if command in ("SEARCH", "SORT", "THREAD") else "FETCH"
+
+    def uid(self, command, *args):
+        response = self._call(self._conn.command("UID", command, *args))
+        return self._result(command, response,
+                            self._uid_response_name(command))
+
+    def uid_pipelined(self, command, arg_lists):
+        """Send several UID commands, keeping up to ``depth`` in flight.
+
+        Yields ``(typ, data)`` for each command, in order, as soon as it
+        completes, so the caller can handle one response while the
+        following ones are still arriving.
+        """
+        name = self._uid_response_name(command)
+        in_flight = collections.deque()
+        for args in arg_lists:
+            if len(in_flight) >= self.depth:
+                yield self._result(command, in_flight.popleft().result(),
+                                   name)
+            in_flight.append(
+                self._submit(self._conn.command("UID", command, *args))
+            )
+        while in_flight:
+            yield self._result(command, in_flight.popleft().result(), name)
+
+    def logout(self):
+        try:
+            self._call(self._conn.command("LOGOUT"))
+        except imaplib.IMAP4.abort:
+            pass
+        finally:
+            self.shutdown()
+        return "BYE", [b""]
+
+    def shutdown(self):
+        if self._loop.is_running():
+            self._call(self._conn.close())
+        if not self._loop.is_closed():
+            self._stop()
+
+
+class PipelinedInboxMixin:
+    """Use a :class:`.PipelinedIMAP` connection for an :class:`.Inbox`.
+
+    Batched FETCHes and label STOREs are sent ``pipeline_depth`` at a time
+    over the connection, instead of waiting for each one to complete
+    before sending the next.
+    """
+    def __init__(self, *args, pipeline_depth=4, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pipeline_depth = pipeline_depth
+
+    def _connect(self):
+        return PipelinedIMAP(self.host, self.ssl_port,
+                             ssl_context=ssl.create_default_context(),
+                             depth=self.pipeline_depth)
+
+    def _iter_fetch_uids(self, imap, uids, fetch_str):
+        batch_size = self.batch_size or len(uids) or 1
+        args = [(uid_sequence_set(chunk), fetch_str)
+                for chunk in _chunks(uids, batch_size)]
+        for typ, data in self.progress(imap.uid_pipelined("FETCH", args)):
+            yield split_fetch_response(data)
+
+    def _store_many(self, imap, stores):
+        args = [self._store_args(uids, labels, direction)
+                for uids, labels, direction in stores]
+        for _ in imap.uid_pipelined("STORE", args):
+            pass
+
+
+class AsyncInbox(PipelinedInboxMixin, Inbox):
+    TYPE = "imap-async"
+
+
+class AsyncGMailInbox(PipelinedInboxMixin, GMailInbox):
+    TYPE = "gmail-async"
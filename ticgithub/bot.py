@@ -1,24 +1,171 @@
 import os
 import warnings
+import contextlib
 import smtplib
+import threading
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
 
+import yaml
 import github
 
-from .issues import Issue, NonTicketIssueError
+from .issues import Issue, NonTicketIssueError, TimelineEvent
+from .ratelimit import RateLimitScheduler
+
+import logging
+_logger = logging.getLogger(__name__)
 
 __all__ = ["SMTP", "Bot"]
 
+OPEN_ISSUES_QUERY = """
+query($owner: String!, $name: String!, $cursor: String,
+      $filterBy: IssueFilters, $pageSize: Int!) {
+  repository(owner: $owner, name: $name) {
+    issues(states: OPEN, first: $pageSize, after: $cursor,
+           filterBy: $filterBy) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number title body url createdAt updatedAt
+        assignees(first: 100) { nodes { login } }
+        labels(first: 100) { nodes { name } }
+        timelineItems(itemTypes: [ASSIGNED_EVENT, LABELED_EVENT],
+                      last: 100) {
+          totalCount
+          nodes {
+            __typename
+            ... on AssignedEvent { createdAt }
+            ... on LabeledEvent { createdAt label { name } }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+_GRAPHQL_EVENT_TYPES = {
+    'AssignedEvent': "assigned",
+    'LabeledEvent': "labeled",
+}
+
+
+def _parse_github_datetime(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _issue_from_graphql(node, ticket_label=None, get_timeline=None):
+    """Create an :class:`.Issue` from an issue node of OPEN_ISSUES_QUERY.
+
+    ``get_timeline`` takes an issue number and returns the issue's REST
+    timeline events; it is used if the issue needs its full timeline (when
+    the node doesn't include all events, or after :meth:`.Issue.refresh`).
+    """
+    number = node['number']
+    issue_data = SimpleNamespace(
+        number=number,
+        title=node['title'],
+        body=node['body'],
+        html_url=node['url'],
+        created_at=_parse_github_datetime(node['createdAt']),
+        updated_at=_parse_github_datetime(node['updatedAt']),
+        assignees=[SimpleNamespace(login=user['login'])
+                   for user in node['assignees']['nodes']],
+        labels=[SimpleNamespace(name=label['name'])
+                for label in node['labels']['nodes']],
+    )
+    if get_timeline is not None:
+        issue_data.get_timeline = lambda: get_timeline(number)
+
+    items = node['timelineItems']
+    if items['totalCount'] > len(items['nodes']):
+        # too many events to be sure we have the latest ones; the Issue
+        # will get its timeline from the REST API
+        return Issue(issue_data, ticket_label=ticket_label)
+
+    timeline = [
+        TimelineEvent(
+            event=_GRAPHQL_EVENT_TYPES[item['__typename']],
+            created_at=_parse_github_datetime(item['createdAt']),
+            label=(item.get('label') or {}).get('name'),
+        )
+        for item in items['nodes']
+    ]
+    return Issue(issue_data, timeline=timeline, ticket_label=ticket_label)
+
 class SMTP:
+    """Sendmail account for the bot.
+
+    By default, each call to :meth:`.sendmail` logs in on a new connection.
+    Within a :meth:`.session`, one authenticated connection is kept open and
+    reused (and reopened if the server drops it).
+    """
     def __init__(self, user, host, secret, port=465):
         self.user = user
         self.host = host
         self.secret = secret
         self.port = port
+        self._smtp = None
+        self._sessions = 0
+        self._lock = threading.RLock()
+
+    def _open(self):
+        return smtplib.SMTP_SSL(self.host, self.port)
+
+    def _connect(self):
+        smtp = self._open()
+        smtp.login(self.user, os.environ.get(self.secret))
+        return smtp
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPServerDisconnected:
+                pass
+            self._smtp = None
+
+    @contextlib.contextmanager
+    def session(self):
+        """Reuse a single connection for all mail sent in this context."""
+        with self._lock:
+            self._sessions += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._sessions -= 1
+                if self._sessions == 0:
+                    self._close()
+
+    def _send(self, email, recipients):
+        for attempt in range(2):
+            if self._smtp is None:
+                self._smtp = self._connect()
+            try:
+                self._smtp.sendmail(self.user, recipients, email.as_string())
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._smtp = None
+                if attempt:
+                    raise
+                _logger.info("SMTP connection dropped; reconnecting")
 
     def sendmail(self, email, recipients):
-        with smtplib.SMTP_SSL(self.host, self.port) as smtp:
-            smtp.login(self.user, os.environ.get(self.secret))
-            smtp.sendmail(self.user, recipients, email.as_string())
+        # one connection can only send one message at a time
+        with self._lock, self.session():
+            self._send(email, recipients)
+
+    def send_batch(self, emails):
+        """Send several emails over one connection.
+
+        Parameters
+        ----------
+        emails : Iterable[Tuple[email.message.Message, List[str]]]
+            each email with its list of recipients
+        """
+        with self.session():
+            for email, recipients in emails:
+                self.sendmail(email, recipients)
 
     def __repr__(self):
         return (f"{self.__class__.__name__}('{self.user}:"
@@ -26,11 +173,29 @@ class SMTP:
 
 
 class Bot:
-    def __init__(self, token_secret, repo, smtp=None):
+    """GitHub account of the bot, with its optional sendmail account.
+
+    All requests to the GitHub API go through ``rate_limit``, a
+    :class:`.RateLimitScheduler` that paces writes and retries requests
+    that hit rate limits.
+
+    If ``ticket_label`` is given, the email tickets are the issues with
+    that label, and listing them is filtered by GitHub.
+    """
+    def __init__(self, token_secret, repo, smtp=None, rate_limit=None,
+                 base_url="https://api.github.com", ticket_label=None):
         self.token_secret = token_secret
         self.reponame = repo
+        self.ticket_label = ticket_label
+        self.base_url = base_url
         self._github = None
+        self._repo = None
         self.smtp = smtp
+        if rate_limit is None:
+            rate_limit = RateLimitScheduler()
+        self.rate_limit = rate_limit
+        # GitHub asks that requests that create content be made serially
+        self._write_lock = threading.Lock()
 
     def __repr__(self):
         return f"{self.__class__.__name__}('{self.reponame}', {self.smtp})"
@@ -42,40 +207,186 @@ class Bot:
         else:
             smtp = None
 
+        rate_limit = RateLimitScheduler.from_config(
+            config.get('rate-limit', {})
+        )
+        kwargs = {}
+        if base_url := config.get('base_url'):
+            kwargs['base_url'] = base_url
+
         return cls(token_secret=config['token_name'],
                    repo=config['repo'],
-                   smtp=smtp)
+                   smtp=smtp,
+                   rate_limit=rate_limit,
+                   ticket_label=config.get('ticket-label'),
+                   **kwargs)
 
     @property
-    def repo(self):
+    def client(self):
         if self._github is None:
-            self._github = github.Github(os.environ[self.token_secret])
-        return self._github.get_repo(self.reponame)
+            # pacing and retries are left to self.rate_limit
+            token = github.Auth.Token(os.environ[self.token_secret])
+            self._github = github.Github(auth=token,
+                                         base_url=self.base_url,
+                                         retry=None,
+                                         seconds_between_requests=None,
+                                         seconds_between_writes=None)
+            self.rate_limit.install(self._github.requester)
+        return self._github
+
+    def remaining_requests(self):
+        """Number of GitHub API requests left before the rate limit resets.
+
+        None if no request has been made yet. Tasks can use this to do the
+        most important work first.
+        """
+        return self.rate_limit.budget()
 
-    def create_issue(self, title, content):
-        return Issue(self.repo.create_issue(title, content))
+    @property
+    def repo(self):
+        # resolve the repository once, rather than with a request on every
+        # access
+        if self._repo is None:
+            self._repo = self.client.get_repo(self.reponame)
+        return self._repo
+
+    def graphql(self, query, variables=None):
+        """Run a GraphQL query, returning the ``data`` of the response."""
+        _, response = self.client.requester.graphql_query(query,
+                                                          variables or {})
+        return response['data']
+
+    def _issue(self, issue):
+        return Issue(issue, ticket_label=self.ticket_label)
+
+    def create_issue(self, title, content, labels=None):
+        kwargs = {'labels': labels} if labels else {}
+        with self._write_lock:
+            return self._issue(self.repo.create_issue(title, content,
+                                                      **kwargs))
 
     def get_issue(self, issue_num):
-        return Issue(self.repo.get_issue(issue_num))
+        return self._issue(self.repo.get_issue(issue_num))
 
-    def make_comment(self, issue_num, content):
-        issue = self.repo.get_issue(issue_num)
-        issue.create_comment(content)
+    def _github_issue(self, issue):
+        """PyGithub issue for an :class:`.Issue` or an issue number.
 
-    def get_unassigned_issues(self):
-        return (
-            Issue(iss)
-            for iss in self.repo.get_issues(state="open")
-            if not iss.assignees
-        )
+        An :class:`.Issue` that wraps a PyGithub issue is used directly,
+        without looking the issue up again.
+        """
+        if isinstance(issue, Issue) and hasattr(issue._issue,
+                                                "create_comment"):
+            return issue._issue
+        number = issue.number if isinstance(issue, Issue) else issue
+        return self.repo.get_issue(number)
+
+    def make_comment(self, issue, content):
+        """Comment on an issue, given as an :class:`.Issue` or a number."""
+        gh_issue = self._github_issue(issue)
+        with self._write_lock:
+            gh_issue.create_comment(content)
+
+    def add_labels(self, issue, labels):
+        """Add labels to an issue, given as an :class:`.Issue` or a number.
+        """
+        gh_issue = self._github_issue(issue)
+        with self._write_lock:
+            gh_issue.add_to_labels(*labels)
+
+    def _get_timeline(self, issue_num):
+        # PyGithub's get_issue doesn't request the issue itself
+        return self.repo.get_issue(issue_num).get_timeline()
+
+    def _get_open_issues_graphql(self, filter_by=None, page_size=50):
+        """Get open issues, including their timelines, with GraphQL.
+
+        This takes one request per ``page_size`` issues, instead of one
+        request per issue each time its timeline is needed.
+        """
+        owner, name = self.reponame.split("/")
+        variables = {
+            'owner': owner,
+            'name': name,
+            'cursor': None,
+            'filterBy': filter_by,
+            'pageSize': page_size,
+        }
+        while True:
+            data = self.graphql(OPEN_ISSUES_QUERY, variables)
+            issues = data['repository']['issues']
+            for node in issues['nodes']:
+                yield _issue_from_graphql(node, self.ticket_label,
+                                          self._get_timeline)
+
+            if not issues['pageInfo']['hasNextPage']:
+                break
+            variables['cursor'] = issues['pageInfo']['endCursor']
+
+    def _get_open_issues(self, timeline=False, assignee=None, since=None,
+                         labels=None):
+        """Get open issues, with the filtering done by GitHub.
+
+        Parameters
+        ----------
+        timeline : bool
+            whether to load each issue's timeline with GraphQL
+        assignee : str
+            ``"none"`` for unassigned issues, ``"*"`` for issues with any
+            assignee, or a user login; None for all issues
+        since : datetime
+            only get issues updated at or after this time
+        labels : List[str]
+            only get issues with all of these labels
+        """
+        if timeline:
+            filter_by = {}
+            if assignee is not None:
+                # GraphQL uses null (rather than "none") for unassigned
+                filter_by['assignee'] = (None if assignee == "none"
+                                         else assignee)
+            if since is not None:
+                filter_by['since'] = since.isoformat()
+            if labels:
+                filter_by['labels'] = list(labels)
+            return self._get_open_issues_graphql(filter_by or None)
+
+        kwargs = {}
+        if assignee is not None:
+            kwargs['assignee'] = assignee
+        if since is not None:
+            kwargs['since'] = since
+        if labels:
+            kwargs['labels'] = list(labels)
+        return (self._issue(iss)
+                for iss in self.repo.get_issues(state="open", **kwargs))
 
-    def get_open_issues(self):
-        return (Issue(iss) for iss in self.repo.get_issues(state="open"))
+    def get_unassigned_issues(self, timeline=False, since=None, labels=None):
+        return self._get_open_issues(timeline, assignee="none", since=since,
+                                     labels=labels)
 
-    def get_all_issues(self):
-        return (Issue(iss) for iss in self.repo.get_issues(state="all"))
+    def get_assigned_issues(self, timeline=False, since=None, labels=None):
+        return self._get_open_issues(timeline, assignee="*", since=since,
+                                     labels=labels)
+
+    def get_open_issues(self, timeline=False, since=None, labels=None):
+        """Get all open issues.
+
+        If ``timeline``, use GraphQL to also load each issue's assignment
+        and label history in bulk.
+        """
+        return self._get_open_issues(timeline, since=since, labels=labels)
+
+    def get_all_issues(self, since=None, labels=None):
+        kwargs = {'since': since} if since is not None else {}
+        if labels:
+            kwargs['labels'] = list(labels)
+        return (self._issue(iss)
+                for iss in self.repo.get_issues(state="all", **kwargs))
 
     def get_all_email_ticket_issues(self, nonticket="warn"):
+        # tickets are found by body, not by ticket label: this is used to
+        # avoid duplicates, so it must also find tickets made before the
+        # label was set (or that had it removed)
         for iss in self.get_all_issues():
             try:
                 iss.unique_id
@@ -86,3 +397,105 @@ class Bot:
                     raise
             else:
                 yield iss
+
+    def _search_ticket_ids(self, ticket_ids, ids_per_query,
+                           queries_per_request):
+        """Use GraphQL issue search to find which ticket IDs have issues.
+
+        Each search query ORs together several ticket IDs (GitHub allows at
+        most 5 operators per query), and several searches are sent in each
+        GraphQL request as aliases. Search is fuzzy, so the frontmatter of
+        each result is checked for an exact match.
+
+        Returns
+        -------
+        found : Set[str]
+            ticket IDs that have issues
+        truncated : Set[str]
+            ticket IDs from searches with more results than were returned,
+            which may have issues that weren't seen
+        """
+        ticket_ids = sorted(ticket_ids)
+        searches = []
+        for start in range(0, len(ticket_ids), ids_per_query):
+            chunk = ticket_ids[start:start + ids_per_query]
+            terms = " OR ".join('"' + tid.replace('"', '') + '"'
+                                for tid in chunk)
+            searches.append(
+                (f"repo:{self.reponame} is:issue in:body {terms}", chunk)
+            )
+
+        found = set()
+        truncated = set()
+        for start in range(0, len(searches), queries_per_request):
+            batch = searches[start:start + queries_per_request]
+            params = ", ".join(f"$q{i}: String!" for i in range(len(batch)))
+            aliases = "\n".join(
+                f"q{i}: search(query: $q{i}, type: ISSUE, first: 100) "
+                "{ issueCount nodes { ... on Issue { number body } } }"
+                for i in range(len(batch))
+            )
+            query = f"query({params}) {{\n{aliases}\n}}"
+            variables = {f"q{i}": search
+                         for i, (search, _) in enumerate(batch)}
+            data = self.graphql(query, variables)
+            for i, (_, chunk) in enumerate(batch):
+                result = data[f"q{i}"]
+                if result['issueCount'] > len(result['nodes']):
+                    truncated.update(chunk)
+                for node in result['nodes']:
+                    if not node.get('body'):
+                        continue
+                    try:
+                        frontmatter = Issue._get_frontmatter(node['body'])
+                    except yaml.YAMLError:
+                        continue
+                    found.add(frontmatter.get('ticket_id'))
+
+        found &= set(ticket_ids)
+        return found, truncated - found
+
+    def find_existing_ticket_ids(self, ticket_ids, ids_per_query=6,
+                                 queries_per_request=10,
+                                 index_lag=timedelta(hours=1)):
+        """Find which of the given ticket IDs already have issues.
+
+        This uses the search API instead of listing every issue. Newly
+        created issues may not be in the search index yet, so any IDs that
+        weren't found are also checked against issues updated within
+        ``index_lag``. If the search fails, this falls back to a full scan
+        of all issues; IDs whose search returned too many results to see
+        them all are also checked with a full scan.
+        """
+        ticket_ids = set(ticket_ids)
+        if not ticket_ids:
+            return set()
+
+        try:
+            found, truncated = self._search_ticket_ids(ticket_ids,
+                                                       ids_per_query,
+                                                       queries_per_request)
+        except github.GithubException as e:
+            warnings.warn(f"Ticket search failed ({e}); falling back to "
+                          "a scan of all issues")
+            existing = {iss.unique_id
+                        for iss in self.get_all_email_ticket_issues()}
+            return existing & ticket_ids
+
+        if truncated:
+            _logger.warning(f"Ticket search results were truncated for "
+                            f"{len(truncated)} ticket IDs; checking them "
+                            "with a scan of all issues")
+            found |= truncated & {
+                iss.unique_id for iss in self.get_all_email_ticket_issues()
+            }
+
+        if missing := ticket_ids - found - truncated:
+            since = datetime.now(tz=timezone.utc) - index_lag
+            for iss in self.get_all_issues(since=since):
+                if iss.is_ticket_issue and iss.unique_id in missing:
+                    found.add(iss.unique_id)
+
+        _logger.info(f"Found {len(found)} of {len(ticket_ids)} ticket IDs "
+                     "with existing issues")
+        return found
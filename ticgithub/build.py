@@ -23,6 +23,38 @@ def get_workflow_template(template_name):
     return template
 
 
+CACHE_STEP_TEMPLATE = """\
+      - name: Restore ticgithub cache
+        uses: actions/cache@v3
+        with:
+          path: |
+{paths}
+          key: ticgithub-{name}-${{{{ github.run_id }}}}
+          restore-keys: ticgithub-{name}-"""
+
+
+def cache_paths(config):
+    """List the on-disk caches that should persist between workflow runs.
+    """
+    paths = []
+    if inbox_cache := config['config']['inbox'].get('cache'):
+        paths.append(inbox_cache['path'])
+    if sync_state := config['config']['inbox'].get('sync_state'):
+        paths.append(sync_state)
+    emails_to_issues = config['workflows'].get('emails-to-issues') or {}
+    if index_path := emails_to_issues.get('ticket-lookup', {}).get('path'):
+        paths.append(index_path)
+
+    return paths
+
+
+def build_cache_step(name, paths):
+    if not paths:
+        return ""
+    path_lines = "\n".join(" " * 12 + path for path in paths)
+    return CACHE_STEP_TEMPLATE.format(paths=path_lines, name=name)
+
+
 def build_substitutions(ticgithub_dict, builder_dict, config):
     dry = " --dry" if ticgithub_dict.get("force-dry") else ""
     if suffix := ticgithub_dict.get("suffix", ""):
@@ -39,9 +71,15 @@ def build_substitutions(ticgithub_dict, builder_dict, config):
         "DRY": dry,
     }
 
+    if builder_dict.get('cache', False):
+        cache_step = build_cache_step(name, cache_paths(config))
+    else:
+        cache_step = ""
+
     workflow_builder_sub = {
         "NAME": name,
         "RUN_CMD": builder_dict['run-command'],
+        "CACHE_STEP": cache_step,
     }
 
     secrets = {
@@ -0,0 +1,236 @@
+import re
+import json
+import time
+import pathlib
+from datetime import timedelta
+
+from .utils.files import write_json_atomic
+
+import logging
+_logger = logging.getLogger(__name__)
+
+__all__ = ["MessageCache"]
+
+
+def _header_block(contents):
+    """Return the header block (including the blank line) of raw email."""
+    for sep in (b"\r\n\r\n", b"\n\n"):
+        idx = contents.find(sep)
+        if idx != -1:
+            return contents[:idx + len(sep)]
+    return contents
+
+
+class MailboxCache:
+    """Cached messages for a single mailbox with a given UIDVALIDITY.
+
+    Each entry stores the fetch envelope (``extra``), the message headers,
+    and (if it has been downloaded) the full raw message. Files are stored
+    as ``<uid>.headers`` and ``<uid>.eml``, with metadata in
+    ``index.json``.
+    """
+    INDEX = "index.json"
+
+    def __init__(self, directory, uidvalidity):
+        self.directory = pathlib.Path(directory)
+        self.uidvalidity = uidvalidity
+        self.entries = {}
+        self._load()
+
+    def _load(self):
+        index_file = self.directory / self.INDEX
+        if not index_file.exists():
+            return
+
+        with open(index_file) as f:
+            index = json.load(f)
+
+        if index.get('uidvalidity') != self.uidvalidity:
+            _logger.info(f"UIDVALIDITY changed for {self.directory}; "
+                         "clearing message cache")
+            self.clear()
+            return
+
+        self.entries = {int(uid): entry
+                        for uid, entry in index['entries'].items()}
+
+    def _path(self, uid, suffix):
+        return self.directory / f"{uid}.{suffix}"
+
+    def clear(self):
+        if self.directory.exists():
+            for path in self.directory.iterdir():
+                path.unlink()
+        self.entries = {}
+
+    def __contains__(self, uid):
+        return int(uid) in self.entries
+
+    @property
+    def highest_uid(self):
+        """Largest UID in the cache (0 if the cache is empty)"""
+        return max(self.entries, default=0)
+
+    def has(self, uid, need_body=True, fields=None):
+        """Whether :meth:`.get` can load this message (without reading it)
+
+        If ``fields`` is given, a headers-only entry only counts if it was
+        stored with (at least) those header fields.
+        """
+        entry = self.entries.get(int(uid))
+        if entry is None:
+            return False
+        if entry['complete']:
+            return True
+        if need_body:
+            return False
+        if fields is None:
+            return True
+        stored = {name.lower() for name in entry.get('fields') or ()}
+        return {name.lower() for name in fields} <= stored
+
+    def get(self, uid, need_body=True):
+        """Load a cached message.
+
+        Returns
+        -------
+        Tuple[bytes, bytes, bool] | None :
+            ``(extra, contents, complete)``, where ``contents`` is the full
+            message if ``complete`` is True and only the headers otherwise,
+            or None if the UID is not in cache (or if ``need_body`` and the
+            body was never downloaded).
+        """
+        uid = int(uid)
+        entry = self.entries.get(uid)
+        if entry is None or (need_body and not entry['complete']):
+            return None
+
+        suffix = "eml" if entry['complete'] else "headers"
+        try:
+            contents = self._path(uid, suffix).read_bytes()
+        except FileNotFoundError:
+            del self.entries[uid]
+            return None
+
+        entry['used'] = time.time()
+        return entry['extra'].encode("utf-8"), contents, entry['complete']
+
+    def put(self, uid, extra, contents, complete, fields=None):
+        """Store a message; ``complete`` if ``contents`` is the full email.
+
+        For headers-only messages, ``fields`` are the header fields that
+        were fetched.
+        """
+        uid = int(uid)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        headers = _header_block(contents) if complete else contents
+        self._path(uid, "headers").write_bytes(headers)
+        size = len(headers)
+        if complete:
+            self._path(uid, "eml").write_bytes(contents)
+            size += len(contents)
+
+        now = time.time()
+        if isinstance(extra, bytes):
+            extra = extra.decode("utf-8", "replace")
+        self.entries[uid] = {
+            'extra': extra,
+            'complete': complete,
+            'fields': None if complete else list(fields or ()),
+            'size': size,
+            'stored': now,
+            'used': now,
+        }
+
+    def _remove(self, uid):
+        for suffix in ["headers", "eml"]:
+            path = self._path(uid, suffix)
+            if path.exists():
+                path.unlink()
+        del self.entries[uid]
+
+    def evict(self, max_entries=None, max_bytes=None, max_age=None):
+        """Remove old entries, then least-recently-used entries over limit.
+        """
+        if max_age is not None:
+            cutoff = time.time() - max_age.total_seconds()
+            for uid in [uid for uid, entry in self.entries.items()
+                        if entry['stored'] < cutoff]:
+                self._remove(uid)
+
+        by_use = sorted(self.entries, key=lambda u: self.entries[u]['used'])
+        total = sum(entry['size'] for entry in self.entries.values())
+        while by_use and (
+            (max_entries is not None and len(self.entries) > max_entries)
+            or (max_bytes is not None and total > max_bytes)
+        ):
+            uid = by_use.pop(0)
+            total -= self.entries[uid]['size']
+            self._remove(uid)
+
+    def save(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        index = {
+            'uidvalidity': self.uidvalidity,
+            'entries': {str(uid): entry
+                        for uid, entry in self.entries.items()},
+        }
+        write_json_atomic(self.directory / self.INDEX, index)
+
+
+class MessageCache:
+    """On-disk cache of downloaded messages.
+
+    Messages are keyed by mailbox, UIDVALIDITY, and UID. If the server
+    reports a new UIDVALIDITY for a mailbox, all cached messages for that
+    mailbox are discarded.
+
+    Parameters
+    ----------
+    path : str
+        directory to store the cache in; to keep the cache between GitHub
+        Actions runs, this directory should be saved with ``actions/cache``
+    max_entries : int
+        maximum number of messages to keep per mailbox
+    max_bytes : int
+        maximum total size of cached files per mailbox
+    max_age : timedelta
+        messages stored longer ago than this are evicted
+    """
+    def __init__(self, path, max_entries=None, max_bytes=None,
+                 max_age=None):
+        self.path = pathlib.Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._mailboxes = {}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self.path}')"
+
+    @classmethod
+    def from_config(cls, config):
+        max_age = config.get('max-age')
+        if max_age is not None:
+            max_age = timedelta(**max_age)
+
+        return cls(path=config['path'],
+                   max_entries=config.get('max-entries'),
+                   max_bytes=config.get('max-bytes'),
+                   max_age=max_age)
+
+    def mailbox(self, name, uidvalidity):
+        """Get the :class:`.MailboxCache` for the given mailbox name.
+        """
+        key = (name, uidvalidity)
+        if key not in self._mailboxes:
+            dirname = re.sub(r"[^A-Za-z0-9._-]", "_", name)
+            self._mailboxes[key] = MailboxCache(self.path / dirname,
+                                                uidvalidity)
+        return self._mailboxes[key]
+
+    def save(self, mailbox_cache):
+        mailbox_cache.evict(max_entries=self.max_entries,
+                            max_bytes=self.max_bytes,
+                            max_age=self.max_age)
+        mailbox_cache.save()
@@ -1,23 +1,91 @@
 import re
+import functools
+
+# Cleaners make email content safe to post on GitHub. A cleaner is any
+# callable that takes the content and returns the cleaned content.
+# PatternCleaners (a regex and its replacement) can be combined, so that
+# several of them run in a single pass over the content.
+
+
+class PatternCleaner:
+    """Replace every match of a regular expression.
+
+    Parameters
+    ----------
+    name : str
+        identifier for this cleaner; must be a valid regex group name
+    pattern : str
+        regular expression to replace; should not contain named groups
+    replacement : str
+        text to replace each match with
+    """
+    def __init__(self, name, pattern, replacement):
+        self.name = name
+        self.pattern = pattern
+        self.replacement = replacement
+        self.regex = re.compile(pattern)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self.name}')"
+
+    def __call__(self, content):
+        return self.regex.sub(self.replacement, content)
+
+
+class CombinedCleaner:
+    """Apply several :class:`.PatternCleaner` s in one pass.
+
+    Matches are found left to right; where patterns match at the same
+    place, the earlier cleaner wins.
+    """
+    def __init__(self, cleaners):
+        self.cleaners = tuple(cleaners)
+        self.regex = re.compile("|".join(
+            f"(?P<{cleaner.name}>{cleaner.pattern})"
+            for cleaner in self.cleaners
+        ))
+        self._replacements = {cleaner.name: cleaner.replacement
+                              for cleaner in self.cleaners}
+
+    def __call__(self, content):
+        return self.regex.sub(self._replace, content)
+
+    def _replace(self, match):
+        return self._replacements[match.lastgroup]
+
+
+@functools.lru_cache(maxsize=None)
+def _combine(cleaners):
+    if len(cleaners) == 1:
+        return cleaners[0]
+    return CombinedCleaner(cleaners)
+
 
 # consider https://github.com/shinnn/github-username-regex
-def at_mention_cleaner(content):
-    regex = re.compile("(?P<pre>[^A-Za-z0-9]+)@(?P<post>[A-Za-z0-9])")
-    replacement = r"\g<pre>@<!-- -->\g<post>"
-    if not re.fullmatch(regex, content):
-        content = re.sub(regex, replacement, content)
-    at_starts = re.compile("^(?P<pre>)@(?P<post>[A-Za-z0-9])")
-    content = re.sub(at_starts, replacement, content)
-    return content
+# An @ that isn't preceded by a letter or digit (so not an email address),
+# followed by a letter or digit. The lookarounds keep this a single linear
+# scan, with no backtracking over the text before the @.
+at_mention_cleaner = PatternCleaner(
+    "at_mention",
+    r"(?<![A-Za-z0-9])@(?=[A-Za-z0-9])",
+    "@<!-- -->",
+)
 
 DEFAULT_CLEANERS = (
     at_mention_cleaner,
 )
 
 def clean_content(content, cleaners=DEFAULT_CLEANERS):
-    for cleaner in cleaners:
-        content = cleaner(content)
+    # consecutive PatternCleaners share a single scan of the content
+    pending = []
+    for cleaner in list(cleaners) + [None]:
+        if isinstance(cleaner, PatternCleaner):
+            pending.append(cleaner)
+            continue
+        if pending:
+            content = _combine(tuple(pending))(content)
+            pending = []
+        if cleaner is not None:
+            content = cleaner(content)
 
     return content
-
-
@@ -0,0 +1,318 @@
+# Filters for emails that should not become issues
+import re
+import functools
+import collections
+from email.utils import getaddresses
+
+import logging
+_logger = logging.getLogger(__name__)
+
+__all__ = ["AddressFilter", "SenderFilter", "RuleFilter", "FilterEngine"]
+
+
+def normalize_address(address):
+    return address.strip().lower()
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_addresses(header):
+    """Normalized email addresses in a header such as From or To."""
+    return frozenset(normalize_address(address)
+                     for _, address in getaddresses([header or ""])
+                     if address)
+
+
+class AddressFilter:
+    """Exclude messages from any of the given addresses.
+
+    If ``unless_to`` is given, messages that were sent directly to that
+    address (i.e., it is in the To header) are kept.
+    """
+    COST = 1
+    needs_body = False
+
+    def __init__(self, name, addresses, unless_to=None):
+        self.name = name
+        self.addresses = frozenset(normalize_address(address)
+                                   for address in addresses if address)
+        self.unless_to = (normalize_address(unless_to)
+                          if unless_to is not None else None)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self.name}')"
+
+    def __call__(self, msg):
+        if self.addresses.isdisjoint(parse_addresses(msg.get("From"))):
+            return False
+        if self.unless_to is not None:
+            return self.unless_to not in parse_addresses(msg.get("To"))
+        return True
+
+
+class SenderFilter:
+    """Exclude messages from any of a (possibly long) list of senders.
+
+    Entries that are full addresses (``someone@example.com``) or domains
+    (``@example.com``) are matched against the parsed sender address with
+    set lookups. Any other entry is matched as a substring of the From
+    header, with all such entries combined into one regular expression.
+    Matching ignores case.
+    """
+    COST = 2
+    needs_body = False
+    _ADDRESS = re.compile(r"[^@\s<>]*@[^@\s<>]+")
+
+    def __init__(self, name, senders):
+        self.name = name
+        addresses = set()
+        domains = set()
+        substrings = []
+        for sender in senders:
+            if self._ADDRESS.fullmatch(sender):
+                local, domain = normalize_address(sender).split("@")
+                if local:
+                    addresses.add(f"{local}@{domain}")
+                else:
+                    domains.add(domain)
+            else:
+                substrings.append(sender)
+
+        self.addresses = frozenset(addresses)
+        self.domains = frozenset(domains)
+        if substrings:
+            self.pattern = re.compile(
+                "|".join(re.escape(s) for s in substrings), re.IGNORECASE
+            )
+        else:
+            self.pattern = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self.name}')"
+
+    def __call__(self, msg):
+        from_header = msg.get("From") or ""
+        senders = parse_addresses(from_header)
+        if not self.addresses.isdisjoint(senders):
+            return True
+        if self.domains and any(address.rpartition("@")[2] in self.domains
+                                for address in senders):
+            return True
+        return bool(self.pattern and self.pattern.search(from_header))
+
+
+# RULES
+#
+# Declarative filters: a rule excludes a message if all of its conditions
+# match. Each condition has a rough relative cost, used to order the
+# conditions in a rule and the filters in a FilterEngine.
+
+class HeaderCondition:
+    """A header is present (or absent), or equals a value."""
+    COST = 1
+    needs_body = False
+
+    def __init__(self, header, equals=None, present=True):
+        self.header = header
+        self.equals = equals
+        self.present = present
+
+    @property
+    def headers(self):
+        return [self.header]
+
+    def _matches(self, value):
+        if self.equals is not None:
+            return value.strip() == self.equals
+        return self.present
+
+    def __call__(self, msg):
+        value = msg.get(self.header)
+        if value is None:
+            return not self.present
+        return self._matches(str(value))
+
+
+class RegexHeaderCondition(HeaderCondition):
+    """A header matches a regex."""
+    COST = 2
+
+    def __init__(self, header, regex):
+        super().__init__(header)
+        self.regex = re.compile(regex)
+
+    def _matches(self, value):
+        return bool(self.regex.search(value))
+
+
+class SizeCondition:
+    """The full message is larger (or smaller) than a number of bytes."""
+    COST = 0.5
+    needs_body = False
+    headers = []
+
+    def __init__(self, over=None, under=None):
+        self.over = over
+        self.under = under
+
+    def __call__(self, msg):
+        size = msg.size
+        if size is None:
+            return False
+        return ((self.over is None or size > self.over)
+                and (self.under is None or size < self.under))
+
+
+class LabelCondition:
+    """The message has a GMail label."""
+    COST = 1
+    needs_body = False
+    headers = []
+
+    def __init__(self, label):
+        self.label = label
+
+    def __call__(self, msg):
+        return self.label in (getattr(msg, "labels", None) or [])
+
+
+class BodyCondition:
+    """The text of the message matches a regex."""
+    COST = 10
+    needs_body = True
+    headers = []
+
+    def __init__(self, regex):
+        self.regex = re.compile(regex)
+
+    def __call__(self, msg):
+        return bool(self.regex.search(msg.get_content()))
+
+
+def condition_from_config(config):
+    if 'header' in config and 'regex' in config:
+        return RegexHeaderCondition(config['header'], config['regex'])
+    if 'header' in config:
+        return HeaderCondition(config['header'],
+                               equals=config.get('equals'),
+                               present=config.get('present', True))
+    if 'size-over' in config or 'size-under' in config:
+        return SizeCondition(over=config.get('size-over'),
+                             under=config.get('size-under'))
+    if 'label' in config:
+        return LabelCondition(config['label'])
+    if 'body' in config:
+        return BodyCondition(config['body'])
+
+    raise ValueError(f"Unknown filter rule condition: {config}")
+
+
+class RuleFilter:
+    """Exclude messages that match all of the given conditions."""
+    def __init__(self, name, conditions):
+        self.name = name
+        self.conditions = sorted(conditions, key=lambda cond: cond.COST)
+        self.COST = sum(cond.COST for cond in self.conditions)
+        self.needs_body = any(cond.needs_body for cond in self.conditions)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self.name}')"
+
+    @classmethod
+    def from_config(cls, config):
+        conditions = [condition_from_config(cond)
+                      for cond in config['match']]
+        return cls(config.get('rule-name', "rule"), conditions)
+
+    @property
+    def headers(self):
+        """Headers that the conditions need"""
+        return [header for cond in self.conditions
+                for header in cond.headers]
+
+    def __call__(self, msg):
+        return all(cond(msg) for cond in self.conditions)
+
+
+class FilterEngine:
+    """Apply a list of filters to messages, counting hits per filter.
+
+    A message is excluded by the first filter that matches it; that filter
+    gets the hit. Filters that need the message body are only applied
+    when requested (see :meth:`.filter`), so that the others can run
+    before bodies are downloaded.
+
+    Every ``reorder_every`` messages, the filters are reordered so that
+    those that are cheap and often match run first (by ``COST`` divided by
+    the observed match rate).
+    """
+    def __init__(self, filters, reorder_every=50):
+        self.filters = list(filters)
+        self.reorder_every = reorder_every
+        self.hits = collections.Counter()
+        self.checked = 0
+        self.evaluated = collections.Counter()
+        self.matched = collections.Counter()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.filters})"
+
+    def __len__(self):
+        return len(self.filters)
+
+    def __iter__(self):
+        return iter(self.filters)
+
+    @property
+    def needs_body(self):
+        return any(filt.needs_body for filt in self.filters)
+
+    def _score(self, filt):
+        # match rate with a prior of 1 match in 2 evaluations
+        rate = (self.matched[filt] + 1) / (self.evaluated[filt] + 2)
+        return filt.COST / rate
+
+    def reorder(self):
+        self.filters.sort(key=self._score)
+
+    def excluded_by(self, msg, needs_body=None):
+        """Name of the filter that excludes this message, or None.
+
+        If ``needs_body`` is given, only filters that do (or don't) need
+        the message body are used.
+        """
+        for filt in self.filters:
+            if needs_body is not None and filt.needs_body != needs_body:
+                continue
+            self.evaluated[filt] += 1
+            if filt(msg):
+                self.matched[filt] += 1
+                return filt.name
+        return None
+
+    def filter(self, messages, needs_body=False):
+        """Yield the messages that no filter excludes.
+
+        Only the filters that need the message body (if ``needs_body``) or
+        that don't need it (otherwise) are applied.
+        """
+        for msg in messages:
+            self.checked += 1
+            if self.reorder_every and self.checked % self.reorder_every == 0:
+                self.reorder()
+            if (name := self.excluded_by(msg, needs_body)) is not None:
+                _logger.debug(f"Filtered message by filter '{name}'")
+                self.hits[name] += 1
+            else:
+                yield msg
+
+    def filter_batch(self, messages, needs_body=False):
+        """Return the list of messages that no filter excludes."""
+        return list(self.filter(messages, needs_body))
+
+    def log_stats(self):
+        counts = ", ".join(
+            f"{filt.name}: {self.matched[filt]}/{self.evaluated[filt]}"
+            for filt in self.filters
+        )
+        _logger.info(f"Filtered {sum(self.hits.values())} emails "
+                     f"(matched/checked by filter: {counts})")
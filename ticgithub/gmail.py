@@ -1,13 +1,18 @@
 # Gmail-specific extensions
 import shlex
 import re
+import collections
 
-from .inbox import Message, Inbox
+from .inbox import Message, Inbox, uid_sequence_set, _chunks, _UNSET
+
+import logging
+_logger = logging.getLogger(__name__)
 
 __all__ = ["GMailInbox", "GMessage"]
 
 LABEL_PATTERN = re.compile(".*X-GM-LABELS \((?P<labels>[^)]*)\)")
 MSGID_PATTERN = re.compile(".*X-GM-MSGID (?P<msgid>[0-9]+)")
+UID_PATTERN = re.compile(".*UID (?P<uid>[0-9]+)")
 
 
 def extract_from_pattern(string, pattern, pattern_name):
@@ -23,36 +28,66 @@ def extract_from_pattern(string, pattern, pattern_name):
 
 
 class GMessage(Message):
+    __slots__ = ("_labels",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._labels = None
+
     @property
     def unique_id(self):
-        return extract_from_pattern(self._extra, MSGID_PATTERN, "msgid")
+        if self._unique_id is _UNSET:
+            self._unique_id = extract_from_pattern(self._extra, MSGID_PATTERN,
+                                                   "msgid")
+        return self._unique_id
 
     @property
     def labels(self):
-        label_str = extract_from_pattern(self._extra, LABEL_PATTERN,
-                                         "labels")
-        return shlex.split(label_str)
+        if self._labels is None:
+            label_str = extract_from_pattern(self._extra, LABEL_PATTERN,
+                                             "labels")
+            self._labels = tuple(shlex.split(label_str))
+        return list(self._labels)
 
 
 class GMailInbox(Inbox):
     FETCH_STR = "(RFC822 X-GM-LABELS X-GM-MSGID)"
+    HEADER_FETCH_ITEMS = ("UID", "RFC822.SIZE", "X-GM-LABELS", "X-GM-MSGID")
     MESSAGE_CLASS = GMessage
     TYPE = "gmail"
 
-    def _toggle_labels(self, gm_msg_id, labels, direction):
+    @staticmethod
+    def _uid_for_msgid(imap, gm_msg_id):
+        typ, data = imap.uid("SEARCH", f"X-GM-MSGID {gm_msg_id}")
+        return str(data[0], 'utf-8')
+
+    @staticmethod
+    def _store_args(uid, labels, direction):
         if direction not in ("+", "-"):
             raise ValueError(f"direction must be '+' or '-', not "
                              f"{direction}")
 
+        labels_arg = f"({' '.join(labels)})"
+        return (f"{uid} {direction}X-GM-LABELS {labels_arg}",)
+
+    @classmethod
+    def _store_labels(cls, imap, uid, labels, direction):
+        imap.uid("STORE", *cls._store_args(uid, labels, direction))
+
+    def _store_many(self, imap, stores):
+        """Apply several ``(uids, labels, direction)`` label changes."""
+        for uids, labels, direction in stores:
+            self._store_labels(imap, uids, labels, direction)
+
+    def _toggle_labels(self, gm_msg_id, labels, direction):
         with self.connection() as imap:
-            labels_arg = f"({' '.join(labels)})"
-            typ, data = imap.uid("SEARCH", f"X-GM-MSGID {gm_msg_id}")
-            num = str(data[0], 'utf-8')
-            store_args = f"{num} {direction}X-GM-LABELS {labels_arg}"
-            imap.uid("STORE", store_args)
+            uid = self._uid_for_msgid(imap, gm_msg_id)
+            self._store_labels(imap, uid, labels, direction)
 
     def get_email(self, unique_id):
-        msgs = self._get_emails(search_string=f"X-GM-MSGID {unique_id}")
+        # labels may have changed since a message was cached
+        msgs = self._get_emails(search_string=f"X-GM-MSGID {unique_id}",
+                                use_cache=False)
         if len(msgs) != 1:
             raise RuntimeError("More than 1 message for unique ID "
                                f"'{unique_id}'")
@@ -64,10 +99,115 @@ class GMailInbox(Inbox):
     def _remove_labels(self, gm_msg_id, labels):
         return self._toggle_labels(gm_msg_id, labels, "-")
 
-    def set_labels(self, gm_msg_id, labels):
-        msg = self.get_email(gm_msg_id)
-        to_remove = set(msg.labels) - set(labels)
-        to_add = set(labels) - set(msg.labels)
+    @staticmethod
+    def _msgid_search(gm_msg_ids):
+        """Search criteria matching any of the given X-GM-MSGIDs."""
+        criteria = [f"X-GM-MSGID {msgid}" for msgid in gm_msg_ids]
+        return "OR " * (len(criteria) - 1) + " ".join(criteria)
+
+    def _current_labels(self, imap, gm_msg_ids):
+        """Get the UID and labels of each of the given messages.
+
+        Uses one SEARCH and one FETCH (of only the labels) per
+        ``batch_size`` messages.
+
+        Returns
+        -------
+        Dict[str, Tuple[int, List[str]]] :
+            maps X-GM-MSGID to ``(uid, labels)``; messages that aren't in
+            the mailbox are omitted
+        """
+        batch_size = self.batch_size or len(gm_msg_ids) or 1
+        current = {}
+        for chunk in _chunks(gm_msg_ids, batch_size):
+            uids = self._search_uids(imap, self._msgid_search(chunk))
+            if not uids:
+                continue
+
+            typ, data = imap.uid("FETCH", uid_sequence_set(uids),
+                                 "(UID X-GM-MSGID X-GM-LABELS)")
+            for item in data:
+                if isinstance(item, tuple):
+                    item = item[0]
+                if not item:
+                    continue
+                msgid = extract_from_pattern(item, MSGID_PATTERN, "msgid")
+                uid = extract_from_pattern(item, UID_PATTERN, "uid")
+                if msgid and uid:
+                    labels = extract_from_pattern(item, LABEL_PATTERN,
+                                                  "labels")
+                    current[msgid] = (int(uid), shlex.split(labels))
+
+        return current
+
+    def sync_labels(self, labels_by_msgid, managed=None, dry=False,
+                    missing="warn"):
+        """Set the labels on many messages at once.
+
+        Current labels for all messages are read with a label-only FETCH,
+        and the differences are applied with one UID STORE per label over
+        all messages that need that label added (or removed).
+
+        Parameters
+        ----------
+        labels_by_msgid : Dict[str, Iterable[str]]
+            maps X-GM-MSGID to the labels that message should have
+        managed : Iterable[str]
+            if given, only these labels are added or removed; other labels
+            on the messages are left alone. If None, any label not in the
+            desired labels is removed.
+        dry : bool
+            if True, only work out the changes; don't store them
+        missing : str
+            what to do about messages that aren't in the mailbox: "warn"
+            (and skip them) or "error" (raise a RuntimeError before any
+            change is made)
+
+        Returns
+        -------
+        Dict[str, Tuple[Set[str], Set[str]]] :
+            ``(added, removed)`` labels for each message that changed
+        """
+        desired = {str(msgid): set(labels)
+                   for msgid, labels in labels_by_msgid.items()}
+        if managed is not None:
+            managed = set(managed)
 
-        self._add_labels(gm_msg_id, to_add)
-        self._remove_labels(gm_msg_id, to_remove)
+        with self.connection() as imap:
+            current = self._current_labels(imap, list(desired))
+            if not_found := set(desired) - set(current):
+                msg = f"Messages not found in mailbox: {sorted(not_found)}"
+                if missing == "error":
+                    raise RuntimeError(msg)
+                _logger.warning(msg)
+
+            changes = {}
+            to_add = collections.defaultdict(list)
+            to_remove = collections.defaultdict(list)
+            for msgid, (uid, labels) in current.items():
+                labels = set(labels)
+                wanted = desired[msgid]
+                if managed is not None:
+                    wanted = (labels - managed) | (wanted & managed)
+
+                added = wanted - labels
+                removed = labels - wanted
+                for label in added:
+                    to_add[label].append(uid)
+                for label in removed:
+                    to_remove[label].append(uid)
+                if added or removed:
+                    changes[msgid] = (added, removed)
+
+            if not dry:
+                self._store_many(imap, [
+                    (uid_sequence_set(uids), [label], direction)
+                    for direction, uids_by_label in [("+", to_add),
+                                                     ("-", to_remove)]
+                    for label, uids in sorted(uids_by_label.items())
+                ])
+
+        return changes
+
+    def set_labels(self, gm_msg_id, labels):
+        self.sync_labels({gm_msg_id: labels}, missing="error")
@@ -1,4 +1,9 @@
 import os
+import re
+import time
+import threading
+import functools
+import itertools
 import collections
 import contextlib
 
@@ -8,31 +13,203 @@ from email.utils import parsedate_to_datetime
 from email.header import decode_header
 from email.contentmanager import raw_data_manager
 
+from .cache import MessageCache
+from .syncstate import SyncState
+from .parsing import ParserPool, parse_record, record_from_message
+
+import logging
+_logger = logging.getLogger(__name__)
+
 __all__ = ["Message", "Inbox"]
 
+UID_PATTERN = re.compile(rb"UID (?P<uid>[0-9]+)")
+SIZE_PATTERN = re.compile(rb"RFC822\.SIZE (?P<size>[0-9]+)")
+_FETCH_START = re.compile(rb"^[0-9]+ \(")
+
+
+def uid_sequence_set(uids):
+    """Compact a list of UIDs into an IMAP sequence set.
+
+    Runs of consecutive UIDs are collapsed into ranges, e.g., ``[1, 2, 3,
+    5]`` becomes ``"1:3,5"``.
+    """
+    uids = sorted(int(uid) for uid in uids)
+    ranges = []
+    for uid in uids:
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+
+    return ",".join(
+        str(start) if start == stop else f"{start}:{stop}"
+        for start, stop in ranges
+    )
+
+
+def _extract_uid(extra):
+    if isinstance(extra, str):
+        extra = extra.encode("utf-8")
+    if match := UID_PATTERN.search(extra):
+        return int(match.group("uid"))
+    return None
+
+
+def _extract_size(extra):
+    if isinstance(extra, str):
+        extra = extra.encode("utf-8")
+    if match := SIZE_PATTERN.search(extra):
+        return int(match.group('size'))
+    return None
+
+
+def _chunks(sequence, size):
+    for start in range(0, len(sequence), size):
+        yield sequence[start:start + size]
+
+
+def split_fetch_response(data):
+    """Split the data from a multi-message FETCH into per-message pairs.
+
+    imaplib returns a flat list where each message starts with a tuple of
+    ``(envelope, literal)``; any trailing bytes (the closing parenthesis, or
+    items the server sent after the literal) belong to the envelope of the
+    preceding message.
+
+    Returns
+    -------
+    List[Tuple[bytes, bytes]] :
+        ``(extra, contents)`` for each message in the response
+    """
+    messages = []
+    for item in data:
+        if isinstance(item, tuple):
+            if _FETCH_START.match(item[0]) or not messages:
+                messages.append([item[0], item[1]])
+            else:
+                # additional literal for the same message
+                messages[-1][0] += item[0]
+                messages[-1][1] += item[1]
+        elif item and messages:
+            messages[-1][0] += item
+
+    return [tuple(msg) for msg in messages]
+
+@functools.lru_cache(maxsize=None)
+def _lowercase_names(names):
+    return frozenset(name.lower() for name in names)
+
+
+_UNSET = object()
+
+
 class Message:
-    def __init__(self, extra, contents):
+    """A single email message.
+
+    If ``loader`` is given, ``contents`` only contains the headers listed in
+    ``prefetched``; the full message is downloaded by calling
+    ``loader(self)`` the first time it is needed.
+
+    If ``record`` (a :class:`.MessageRecord` parsed from ``contents``) is
+    given, only the headers and the extracted body parts are kept, instead
+    of the whole MIME tree; see also :meth:`.compact`.
+
+    Decoded values (subject, date, headers, IDs) are computed the first
+    time they are needed and then kept.
+    """
+    __slots__ = ("_extra", "_msg", "_loader", "_prefetched", "_record",
+                 "_uid", "_unique_id", "_subject", "_date", "_headers",
+                 "_size")
+
+    def __init__(self, extra, contents, loader=None, prefetched=None,
+                 record=None):
         self._extra = extra
-        self._msg = email.message_from_bytes(contents)
+        self._uid = _UNSET
+        self._unique_id = _UNSET
+        self._set_message(contents, record)
+        self._loader = loader
+        self._size = len(contents) if loader is None else _extract_size(extra)
+        self._prefetched = _lowercase_names(tuple(prefetched or ()))
+
+    def _set_message(self, contents, record):
+        self._record = record
+        if record is None:
+            self._msg = email.message_from_bytes(contents)
+        else:
+            self._msg = record.header_message()
+        self._subject = _UNSET
+        self._date = _UNSET
+        self._headers = {}
+
+    @property
+    def hydrated(self):
+        """Whether the full message (not just headers) is available"""
+        return self._loader is None
+
+    def _set_contents(self, contents, record=None):
+        self._set_message(contents, record)
+        self._loader = None
+        self._size = len(contents)
+
+    def hydrate(self):
+        """Download the full message, if only the headers are loaded."""
+        if not self.hydrated:
+            self._loader(self)
+
+    def compact(self):
+        """Extract the body parts, then drop the MIME tree.
+
+        Afterwards, the message only keeps its headers and the decoded
+        text parts used by :meth:`.get_content`.
+        """
+        self.hydrate()
+        if self._record is None:
+            self._record = record_from_message(self._msg)
+            self._msg = self._record.header_message()
 
     @property
     def unique_id(self):
-        return self._msg["Message-ID"]
+        if self._unique_id is _UNSET:
+            self._unique_id = self._msg["Message-ID"]
+        return self._unique_id
+
+    @property
+    def uid(self):
+        """IMAP UID of this message (None if not known)"""
+        if self._uid is _UNSET:
+            self._uid = _extract_uid(self._extra)
+        return self._uid
+
+    @property
+    def size(self):
+        """Size of the full message in bytes (None if not known)"""
+        return self._size
 
     @property
     def date(self):
-        return parsedate_to_datetime(self._msg["Date"])
+        if self._date is _UNSET:
+            self._date = parsedate_to_datetime(self._msg["Date"])
+        return self._date
 
     @property
     def subject(self):
-        output, encoding = decode_header(self._msg['subject'])[0]
-        if isinstance(output, bytes):
-            output = output.decode(encoding)
+        if self._subject is _UNSET:
+            output, encoding = decode_header(self._msg['subject'])[0]
+            if isinstance(output, bytes):
+                output = output.decode(encoding)
+            self._subject = output
 
-        return output
+        return self._subject
 
     def get(self, key):
-        return self._msg.get(key)
+        lower = key.lower()
+        if not self.hydrated and lower not in self._prefetched:
+            self.hydrate()
+        try:
+            return self._headers[lower]
+        except KeyError:
+            value = self._headers[lower] = self._msg.get(key)
+            return value
 
     def _group_messages_by_content_type(self):
         messages = collections.defaultdict(list)
@@ -54,6 +231,10 @@ class Message:
         if content_type_order is None:
             content_type_order = ["text/plain", "text/html"]
 
+        self.hydrate()
+        if self._record is not None:
+            return self._record.get_content(content_type_order)
+
         messages_by_content_type = self._group_messages_by_content_type()
         message = self._get_desired_message(messages_by_content_type,
                                             content_type_order)
@@ -64,6 +245,10 @@ class Message:
 class Inbox:
     MESSAGE_CLASS = Message
     FETCH_STR = "RFC822"
+    HEADER_FIELDS = ("From", "To", "Subject", "Date", "Message-ID")
+    # items to fetch along with the headers when not downloading bodies
+    HEADER_FETCH_ITEMS = ("UID", "RFC822.SIZE")
+    BODY_FETCH_STR = "(UID RFC822)"
     TYPE = "imap"
 
     def __init__(
@@ -73,12 +258,34 @@ class Inbox:
         secret,
         mailbox="INBOX",
         ssl_port=993,
+        batch_size=100,
+        lazy_bodies=False,
+        cache=None,
+        sync_state=None,
+        keepalive=60,
+        parse_workers=0,
+        compact_messages=False,
     ):
         self.host = host
         self.user = user
         self.secret = secret
         self.mailbox = mailbox
         self.ssl_port = ssl_port
+        self.batch_size = batch_size
+        self.lazy_bodies = lazy_bodies
+        self.cache = cache
+        self.sync_state = sync_state
+        self.keepalive = keepalive
+        self.parse_workers = parse_workers
+        self._parser = ParserPool(parse_workers) if parse_workers else None
+        self.compact_messages = compact_messages
+        self.header_fields = self.HEADER_FIELDS
+        self._session_depth = 0
+        self._session_imap = None
+        self._session_last_used = None
+        self._session_lock = threading.RLock()
+        self.uidvalidity = None
+        self.highestmodseq = None
         self.progress = lambda x: x
 
     def __repr__(self):
@@ -88,39 +295,365 @@ class Inbox:
     @classmethod
     def from_config(cls, config):
         kwargs = {k: v for k, v in config.items() if k != "type"}
+        if cache_config := kwargs.get('cache'):
+            kwargs['cache'] = MessageCache.from_config(cache_config)
+        if sync_file := kwargs.get('sync_state'):
+            kwargs['sync_state'] = SyncState(sync_file)
         return cls(**kwargs)
 
-    @contextlib.contextmanager
-    def connection(self):
-        """Get a connection to the IMAP server (use as context manager)."""
+    def _connect(self):
+        return imaplib.IMAP4_SSL(self.host, port=self.ssl_port)
+
+    def _login(self):
         password = os.environ.get(self.secret)
-        imap = imaplib.IMAP4_SSL(self.host, port=self.ssl_port)
+        imap = self._connect()
         imap.login(self.user, password)
-        imap.select(self.mailbox)
+        self._select(imap)
+        return imap
+
+    @contextlib.contextmanager
+    def session(self):
+        """Share one IMAP connection among all operations in this context.
+
+        The connection is opened the first time it is needed. If it has
+        been idle for more than ``keepalive`` seconds, it is checked with a
+        NOOP before reuse, and reopened if the server has dropped it.
+        """
+        self._session_depth += 1
+        try:
+            yield self
+        finally:
+            self._session_depth -= 1
+            if self._session_depth == 0 and self._parser is not None:
+                self._parser.shutdown()
+            if self._session_depth == 0 and self._session_imap is not None:
+                imap, self._session_imap = self._session_imap, None
+                try:
+                    imap.logout()
+                except (imaplib.IMAP4.abort, OSError):
+                    pass
+
+    def _session_connection(self):
+        imap = self._session_imap
+        idle = (time.monotonic() - self._session_last_used
+                if imap is not None else 0)
+        if imap is not None and idle > self.keepalive:
+            try:
+                imap.noop()
+            except (imaplib.IMAP4.abort, OSError):
+                _logger.info("IMAP connection dropped; reconnecting")
+                imap = None
+
+        if imap is None:
+            imap = self._session_imap = self._login()
+
+        self._session_last_used = time.monotonic()
+        return imap
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Get a connection to the IMAP server (use as context manager).
+
+        Inside a :meth:`.session`, this is the session's shared connection.
+        """
+        if self._session_depth:
+            # imaplib connections can't be shared between threads
+            with self._session_lock:
+                try:
+                    yield self._session_connection()
+                except imaplib.IMAP4.abort:
+                    # make sure the next operation gets a new connection
+                    self._session_imap = None
+                    raise
+            return
+
+        imap = self._login()
         yield imap
         imap.logout()
 
-    def _create_message(self, fetched):
-        return self.MESSAGE_CLASS(*fetched[1][0])
+    def _select(self, imap):
+        imap.select(self.mailbox)
+        typ, data = imap.response("UIDVALIDITY")
+        self.uidvalidity = int(data[0]) if data and data[0] else None
+        # only reported by servers that support CONDSTORE
+        typ, data = imap.response("HIGHESTMODSEQ")
+        self.highestmodseq = int(data[0]) if data and data[0] else None
+
+    @property
+    def _mailbox_key(self):
+        return f"{self.user}@{self.host}/{self.mailbox}"
+
+    def _mailbox_cache(self):
+        """Cache for the current mailbox, or None if not caching"""
+        if self.cache is None or self.uidvalidity is None:
+            return None
+        return self.cache.mailbox(self._mailbox_key, self.uidvalidity)
+
+    def _store_cached(self, fetched, complete):
+        if mailbox_cache := self._mailbox_cache():
+            fields = None if complete else self.header_fields
+            for extra, contents in fetched:
+                mailbox_cache.put(_extract_uid(extra), extra, contents,
+                                  complete, fields=fields)
+            self.cache.save(mailbox_cache)
+
+    def _create_message(self, fetched, record=None):
+        extra, contents = fetched
+        return self.MESSAGE_CLASS(extra, contents, record=record)
+
+    def _parse_records(self, contents):
+        """Parse full messages in the parser pool, if there is one.
+
+        Returns a list with a :class:`.MessageRecord` for each message. If
+        there is no pool, the records are made in this process if
+        ``compact_messages``; otherwise, the list is all None, and each
+        message keeps its full MIME tree.
+        """
+        if self._parser is not None and len(contents) > 1:
+            return self._parser.map(contents)
+        if self.compact_messages:
+            return [parse_record(raw) for raw in contents]
+        return [None] * len(contents)
+
+    @property
+    def header_fetch_str(self):
+        """FETCH items to get only the headers in ``header_fields``"""
+        return (f"({' '.join(self.HEADER_FETCH_ITEMS)} "
+                f"BODY.PEEK[HEADER.FIELDS ({' '.join(self.header_fields)})])")
+
+    def prefetch_headers(self, names):
+        """Also download these headers when only downloading headers."""
+        known = {name.lower() for name in self.header_fields}
+        self.header_fields += tuple(
+            name for name in dict.fromkeys(names) if name.lower() not in known
+        )
+
+    def _create_lazy_message(self, fetched, prefetched=None):
+        extra, headers = fetched
+        return self.MESSAGE_CLASS(extra, headers,
+                                  loader=self._load_body,
+                                  prefetched=prefetched or self.header_fields)
+
+    def _load_body(self, msg):
+        if not self.hydrate([msg]):
+            raise RuntimeError(f"Message with UID {msg.uid} disappeared "
+                               "from the server")
+
+    def hydrate(self, messages):
+        """Download the full contents of header-only messages.
+
+        All messages that still need their bodies are fetched together, so
+        this should be called on the whole set of messages that survived
+        filtering, rather than letting each message load itself.
+
+        Returns
+        -------
+        List[Message] :
+            the messages that now have their full contents; messages that
+            are no longer on the server (e.g., expunged since their headers
+            were downloaded) are left out
+        """
+        messages = list(messages)
+        pending = {msg.uid: msg for msg in messages if not msg.hydrated}
+        if not pending:
+            return messages
 
-    def _get_emails(self, search_string="ALL"):
         with self.connection() as imap:
-            typ, data = imap.search(None, search_string)
-            fetch_msgs = [
-                imap.fetch(num, self.FETCH_STR)
-                for num in self.progress(data[0].split())
-            ]
+            fetched = self._fetch_uids(imap, list(pending),
+                                       self.BODY_FETCH_STR)
 
-        msgs = [self._create_message(m) for m in fetch_msgs]
-        return msgs
+        records = self._parse_records([contents for _, contents in fetched])
+        loaded = []
+        for (extra, contents), record in zip(fetched, records):
+            msg = pending.pop(_extract_uid(extra))
+            msg._set_contents(contents, record)
+            loaded.append((msg._extra, contents))
 
-    def get_emails(self, since=None):
-        if since is None:
-            search_string = "ALL"
+        self._store_cached(loaded, complete=True)
+
+        if pending:
+            _logger.warning(f"Messages with UIDs {sorted(pending)} "
+                            "disappeared from the server; skipping them")
+        return [msg for msg in messages if msg.uid not in pending]
+
+    @staticmethod
+    def _search_uids(imap, search_string):
+        typ, data = imap.uid("SEARCH", search_string)
+        return [int(uid) for uid in data[0].split()]
+
+    def _search_new_uids(self, imap, search_string):
+        """Search for messages that arrived after the last saved sync.
+
+        If the mailbox's HIGHESTMODSEQ hasn't changed, nothing has
+        changed, and we don't need to search at all.
+        """
+        mark = self.sync_state.get(self._mailbox_key)
+        if mark and mark['uidvalidity'] == self.uidvalidity:
+            last_uid = mark['last_uid']
+            if (self.highestmodseq is not None
+                    and mark.get('highestmodseq') == self.highestmodseq):
+                _logger.info("Mailbox unchanged since last sync")
+                uids = []
+            else:
+                # UID n:* always includes the newest message, even if its
+                # UID is less than n
+                search = f"UID {last_uid + 1}:* {search_string}"
+                uids = [uid for uid in self._search_uids(imap, search)
+                        if uid > last_uid]
         else:
-            since_date = since.strftime("%d-%b-%Y")
-            search_string = f"(SINCE {since_date})"
-        return self._get_emails(search_string)
+            last_uid = 0
+            uids = self._search_uids(imap, search_string)
+
+        self.sync_state.update(self._mailbox_key,
+                               uidvalidity=self.uidvalidity,
+                               last_uid=max(uids, default=last_uid),
+                               highestmodseq=self.highestmodseq)
+        _logger.info(f"Found {len(uids)} messages since last sync")
+        return uids
+
+    def save_sync_state(self):
+        """Record that all messages returned so far have been handled.
+
+        Only meaningful if ``sync_state`` is set; after this, future calls
+        to :meth:`.get_emails` will only return newer messages.
+        """
+        if self.sync_state is not None:
+            self.sync_state.save()
+
+    def _iter_fetch_uids(self, imap, uids, fetch_str):
+        """Fetch the given UIDs, using one FETCH per ``batch_size`` UIDs.
+
+        Yields
+        ------
+        List[Tuple[bytes, bytes]] :
+            ``(extra, contents)`` for each message in a batch
+        """
+        batch_size = self.batch_size or len(uids) or 1
+        for chunk in self.progress(list(_chunks(uids, batch_size))):
+            typ, data = imap.uid("FETCH", uid_sequence_set(chunk), fetch_str)
+            yield split_fetch_response(data)
+
+    def _fetch_uids(self, imap, uids, fetch_str):
+        """Fetch the given UIDs, using one FETCH per ``batch_size`` UIDs.
+
+        Returns
+        -------
+        List[Tuple[bytes, bytes]] :
+            ``(extra, contents)`` for each fetched message
+        """
+        return list(itertools.chain.from_iterable(
+            self._iter_fetch_uids(imap, uids, fetch_str)
+        ))
+
+    def _iter_emails(self, search_string="ALL", use_cache=True,
+                     incremental=False):
+        """Yield messages in UID order as they are downloaded.
+
+        Messages are downloaded ``batch_size`` at a time, so at most a batch
+        of downloaded messages is held here at once.
+        """
+        complete = not self.lazy_bodies
+        fetch_str = self.FETCH_STR if complete else self.header_fetch_str
+
+        with self.connection() as imap:
+            if incremental and self.sync_state is not None:
+                uids = self._search_new_uids(imap, search_string)
+            else:
+                uids = self._search_uids(imap, search_string)
+
+            mailbox_cache = self._mailbox_cache() if use_cache else None
+            cached = set()
+            if mailbox_cache:
+                # headers cached before a prefetch_headers call are missing
+                # fields; those are fetched again with the other headers
+                fields = None if complete else self.header_fields
+                cached = {uid for uid in uids
+                          if mailbox_cache.has(uid, need_body=complete,
+                                               fields=fields)}
+                _logger.info(f"Loading {len(cached)} of {len(uids)} "
+                             "messages from cache")
+
+            to_fetch = [uid for uid in uids if uid not in cached]
+            batches = self._iter_fetch_uids(imap, to_fetch, fetch_str)
+            fetched = {}
+            for uid in uids:
+                entry = None
+                if uid in cached:
+                    entry = mailbox_cache.get(uid, need_body=complete)
+                    if entry is None:  # cache file went missing
+                        batch = self._fetch_uids(imap, [uid], fetch_str)
+                        fetched.update(self._index_batch(batch, use_cache,
+                                                         complete))
+
+                while entry is None and uid not in fetched:
+                    batch = next(batches, None)
+                    if batch is None:
+                        break
+                    fetched.update(self._index_batch(batch, use_cache,
+                                                     complete))
+
+                if entry is None:
+                    if uid not in fetched:
+                        _logger.warning(f"Message with UID {uid} "
+                                        "disappeared from the server")
+                        continue
+                    yield fetched.pop(uid)
+                    continue
+
+                extra, contents, is_complete = entry
+                if is_complete:
+                    record = self._parse_records([contents])[0]
+                    yield self._create_message((extra, contents), record)
+                else:
+                    yield self._create_lazy_message((extra, contents))
+
+    def _index_batch(self, batch, use_cache, complete):
+        """Create the messages for a fetched batch, keyed by UID."""
+        if use_cache:
+            self._store_cached(batch, complete)
+        if complete:
+            records = self._parse_records([contents for _, contents in batch])
+            msgs = [self._create_message(fetched, record)
+                    for fetched, record in zip(batch, records)]
+        else:
+            msgs = [self._create_lazy_message(fetched) for fetched in batch]
+        return {msg.uid: msg for msg in msgs}
+
+    def _get_emails(self, search_string="ALL", use_cache=True,
+                    incremental=False):
+        return list(self._iter_emails(search_string, use_cache=use_cache,
+                                      incremental=incremental))
+
+    @staticmethod
+    def _search_string(since):
+        if since is None:
+            return "ALL"
+        since_date = since.strftime("%d-%b-%Y")
+        return f"(SINCE {since_date})"
+
+    def iter_emails(self, since=None, incremental=False):
+        """Iterate over emails from the inbox as they are downloaded.
+
+        Takes the same parameters as :meth:`.get_emails`, but holds at most
+        one batch of downloaded messages at a time, and the first messages
+        are available before the rest have been downloaded.
+        """
+        return self._iter_emails(self._search_string(since),
+                                 incremental=incremental)
+
+    def get_emails(self, since=None, incremental=False):
+        """Get emails from the inbox.
+
+        Parameters
+        ----------
+        since : datetime
+            only get emails since this date (rounded down to the day)
+        incremental : bool
+            if True and the inbox has a ``sync_state``, only get emails
+            that are newer than the last call to :meth:`.save_sync_state`
+        """
+        return self._get_emails(self._search_string(since),
+                                incremental=incremental)
 
     def get_email(self, unique_id):
         for email in self.get_emails():
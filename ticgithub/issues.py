@@ -1,17 +1,64 @@
+import re
 import yaml
+import collections
 from datetime import datetime
 
 import github
 
+try:
+    from yaml import CSafeLoader as FrontmatterLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as FrontmatterLoader
+
+# a YAML document separator: '---' at the start of a line
+_DOCUMENT_SEPARATOR = re.compile(r"^---(?=\s|$)", re.MULTILINE)
+
 class NonTicketIssueError(Exception):
     pass
 
+
+# the parts of a timeline event that we use; label is None for events that
+# aren't about labels
+TimelineEvent = collections.namedtuple("TimelineEvent",
+                                       ["event", "created_at", "label"])
+
+
 class Issue:
     """
     Simple wrapper around github.Issue to define our supported API.
+
+    If ``timeline`` (a list of :class:`.TimelineEvent`) is given, it is used
+    instead of downloading the issue's timeline from GitHub. Otherwise, the
+    timeline is downloaded once, the first time it is needed. Use
+    :meth:`.refresh` to discard cached data.
+
+    If ``ticket_label`` is given, issues with that label are the email
+    tickets (see :attr:`.is_ticket_issue`).
     """
-    def __init__(self, issue: github.Issue):
+    ticket_label = None
+
+    def __init__(self, issue: github.Issue, timeline=None,
+                 ticket_label=None):
         self._issue = issue
+        self._timeline = timeline
+        self.ticket_label = ticket_label
+        self._clear_cache()
+
+    def _clear_cache(self):
+        # maps event type -> latest time, and label name -> latest time
+        # that label was added
+        self._latest_event = None
+        self._latest_labeled = None
+        self._assignees = None
+        self._labels = None
+        self._unique_id = None
+
+    def refresh(self):
+        """Reload the issue from GitHub and discard any cached data."""
+        if update := getattr(self._issue, "update", None):
+            update()
+        self._timeline = None
+        self._clear_cache()
 
     @staticmethod
     def issue_body_from_message(message):
@@ -26,11 +73,20 @@ class Issue:
 
     @staticmethod
     def _get_frontmatter(body):
-        for frontmatter in yaml.load_all(body, Loader=yaml.FullLoader):
-            break
+        # Only parse the first YAML document; the rest of the body is the
+        # email, which may be long and isn't necessarily valid YAML.
+        start = 0
+        separator = _DOCUMENT_SEPARATOR.search(body)
+        if separator and not body[:separator.start()].strip():
+            # body starts with an explicit separator; skip it
+            start = separator.end()
+            separator = _DOCUMENT_SEPARATOR.search(body, start)
+        end = separator.start() if separator else len(body)
+
+        frontmatter = yaml.load(body[start:end], Loader=FrontmatterLoader)
         if not isinstance(frontmatter, dict):
             frontmatter = {}
-        if 'Date' in frontmatter:
+        if isinstance(frontmatter.get('Date'), str):
             frontmatter['Date'] = datetime.fromisoformat(frontmatter['Date'])
         return frontmatter
 
@@ -42,7 +98,8 @@ class Issue:
         return Issue._get_frontmatter(body)['ticket_id']
 
     @property
-    def is_ticket_issue(self):
+    def has_ticket_id(self):
+        """Whether the issue body has a ticket ID in its frontmatter."""
         try:
             self.unique_id
         except NonTicketIssueError:
@@ -50,27 +107,76 @@ class Issue:
         else:
             return True
 
+    @property
+    def is_ticket_issue(self):
+        """Whether this issue is an email ticket.
+
+        With a ``ticket_label``, this checks for the label instead of
+        parsing the issue body.
+        """
+        if self.ticket_label is not None:
+            return self.ticket_label in self.labels
+        return self.has_ticket_id
+
     @property
     def unique_id(self):
-        try:
-            return self._unique_id_from_body(self._issue.body)
-        except (yaml.YAMLError, KeyError):
-            raise NonTicketIssueError(
-                f"Issue {self.number} does not have a ticket ID"
-            )
+        if self._unique_id is None:
+            try:
+                self._unique_id = self._unique_id_from_body(self._issue.body)
+            except (yaml.YAMLError, KeyError):
+                self._unique_id = NonTicketIssueError(
+                    f"Issue {self.number} does not have a ticket ID"
+                )
+            except NonTicketIssueError as e:
+                self._unique_id = e
+
+        if isinstance(self._unique_id, NonTicketIssueError):
+            raise NonTicketIssueError(str(self._unique_id))
+
+        return self._unique_id
 
     @property
     def date_created(self):
         return self._issue.created_at
 
+    @property
+    def date_updated(self):
+        return self._issue.updated_at
+
+    def _timeline_events(self):
+        if self._timeline is None:
+            self._timeline = [
+                TimelineEvent(
+                    event=event.event,
+                    created_at=event.created_at,
+                    label=(event.raw_data.get('label') or {}).get('name'),
+                )
+                for event in self._issue.get_timeline()
+            ]
+        return self._timeline
+
+    def _index_timeline(self):
+        if self._latest_event is not None:
+            return
+
+        def set_latest(latest, key, time):
+            if key not in latest or time > latest[key]:
+                latest[key] = time
+
+        latest_event = {}
+        latest_labeled = {}
+        for event in self._timeline_events():
+            set_latest(latest_event, event.event, event.created_at)
+            if event.event == "labeled":
+                set_latest(latest_labeled, event.label, event.created_at)
+
+        self._latest_event = latest_event
+        self._latest_labeled = latest_labeled
+
     @property
     def date_last_assigned(self):
-        assigns = [
-            event for event in self._issue.get_timeline()
-            if event.event == "assigned"
-        ]
-        last_assignment = sorted(assigns, key=lambda x: x.created_at)[-1]
-        return last_assignment.created_at
+        self._index_timeline()
+        return self._latest_event['assigned']
 
     @property
     def number(self):
@@ -86,25 +192,23 @@ class Issue:
 
     @property
     def assignees(self):
-        return [assignee.login for assignee in self._issue.assignees]
+        if self._assignees is None:
+            self._assignees = [assignee.login
+                               for assignee in self._issue.assignees]
+        return self._assignees
 
     @property
     def labels(self):
-        return set(l.name for l in self._issue.labels)
+        if self._labels is None:
+            self._labels = set(l.name for l in self._issue.labels)
+        return self._labels
 
     def label_added(self, label):
         if not label in self.labels:
             return None
 
-        label_adds = [
-            event for event in self._issue.get_timeline()
-            if (
-                event.event == "labeled"
-                and event.raw_data['label']['name'] == label
-            )
-        ]
-        last_added = sorted(label_adds, key=lambda x: x.created_at)[-1]
-        return last_added.created_at
+        self._index_timeline()
+        return self._latest_labeled[label]
 
 
 class NoIssue(Issue):
@@ -0,0 +1,89 @@
+# Parsing of raw messages in a pool of processes
+import collections
+import email
+import email.message
+from email.contentmanager import raw_data_manager
+from concurrent.futures import ProcessPoolExecutor
+
+__all__ = ["MessageRecord", "parse_record", "record_from_message",
+           "ParserPool"]
+
+# body parts that are extracted in the worker processes
+CONTENT_TYPES = ("text/plain", "text/html")
+
+
+class MessageRecord(collections.namedtuple("MessageRecord",
+                                           ["headers", "contents", "size"])):
+    """Pre-extracted parts of a message, cheap to send between processes.
+
+    Attributes
+    ----------
+    headers : List[Tuple[str, str]]
+        the top-level headers of the message
+    contents : Dict[str, str]
+        the decoded content of the first part of each type in
+        ``CONTENT_TYPES``
+    size : int
+        size of the raw message in bytes (None if not known)
+    """
+    __slots__ = ()
+
+    def header_message(self):
+        """Build an ``email.message.Message`` with only the headers."""
+        msg = email.message.Message()
+        for name, value in self.headers:
+            msg[name] = value
+        return msg
+
+    def get_content(self, content_type_order):
+        for content_type in content_type_order:
+            if content_type in self.contents:
+                return self.contents[content_type]
+
+        raise ValueError("Message has no parts with content type in "
+                         f"{content_type_order}")
+
+
+def record_from_message(msg, size=None):
+    """Extract a :class:`.MessageRecord` from an ``email.message.Message``.
+    """
+    parts = {}
+    for part in msg.walk():
+        content_type = part.get_content_type()
+        if content_type in CONTENT_TYPES and content_type not in parts:
+            try:
+                parts[content_type] = raw_data_manager.get_content(part)
+            except LookupError:  # unknown charset
+                pass
+
+    return MessageRecord(list(msg.items()), parts, size)
+
+
+def parse_record(contents):
+    """Parse a raw message into a :class:`.MessageRecord`."""
+    return record_from_message(email.message_from_bytes(contents),
+                               len(contents))
+
+
+class ParserPool:
+    """Pool of processes that parse raw messages into records.
+
+    The processes are started the first time they are needed, and kept
+    until :meth:`.shutdown`.
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+
+    def map(self, contents):
+        """Parse a list of raw messages; returns a list of records."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        chunksize = max(1, len(contents) // (4 * self.workers))
+        return list(self._executor.map(parse_record, contents,
+                                       chunksize=chunksize))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,196 @@
+# Scheduling of GitHub API requests around the rate limits
+import functools
+import itertools
+import random
+import threading
+import time
+
+import logging
+_logger = logging.getLogger(__name__)
+
+__all__ = ["RateLimitScheduler"]
+
+WRITE_VERBS = ("POST", "PATCH", "PUT", "DELETE")
+# GitHub asks to wait at least a minute after a secondary rate limit error
+# that doesn't say how long to wait
+SECONDARY_LIMIT_WAIT = 60
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class RateLimitScheduler:
+    """Pace and retry GitHub API requests based on the rate limits.
+
+    The scheduler keeps track of the primary rate limit from the
+    ``X-RateLimit-*`` headers of each response. It holds requests while the
+    budget is spent (down to ``reserve`` requests) until the limit resets,
+    starts each write at least ``write_interval`` seconds after the previous
+    write completed, and retries requests that hit a secondary rate limit
+    (after ``Retry-After``, or with backoff) or that failed with a server
+    error (GET only).
+
+    Backoff is exponential from ``backoff`` seconds up to ``max_backoff``,
+    with random jitter so that parallel workers don't retry together.
+
+    Parameters
+    ----------
+    write_interval : float
+        minimum number of seconds between requests that create content
+    max_retries : int
+        maximum number of retries for each request
+    backoff : float
+        base delay in seconds for retries without a ``Retry-After``
+    max_backoff : float
+        maximum delay in seconds for a single retry
+    reserve : int
+        number of requests of the primary rate limit to keep unused
+    """
+    def __init__(self, write_interval=1.0, max_retries=5, backoff=1.0,
+                 max_backoff=300.0, reserve=0):
+        self.write_interval = write_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.reserve = reserve
+        self.remaining = None
+        self.limit = None
+        self.reset = None  # epoch time when the primary limit resets
+        self.retries = 0
+        self._last_write = None  # time.monotonic() at end of last write
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        # held from the wait before a write until its response arrives
+        self._write_lock = threading.Lock()
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(remaining={self.remaining}, "
+                f"limit={self.limit})")
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(write_interval=config.get('write-interval', 1.0),
+                   max_retries=config.get('max-retries', 5),
+                   backoff=config.get('backoff', 1.0),
+                   max_backoff=config.get('max-backoff', 300.0),
+                   reserve=config.get('reserve', 0))
+
+    def budget(self):
+        """Number of requests that can be made before the limit resets.
+
+        This excludes the ``reserve``. Returns None until a response has
+        reported the rate limit.
+        """
+        if self.remaining is None:
+            return None
+        return max(self.remaining - self.reserve, 0)
+
+    def _backoff(self, attempt):
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return random.uniform(delay / 2, delay)
+
+    def _delay_before(self):
+        """Time to wait for the rate limits before sending a request."""
+        with self._lock:
+            now = time.time()
+            start = max(now, self._blocked_until)
+            if (self.remaining is not None and self.reset is not None
+                    and self.remaining <= self.reserve and self.reset > now):
+                start = max(start, self.reset)
+                _logger.warning(
+                    f"GitHub rate limit budget spent ({self.remaining} "
+                    f"remaining); waiting {self.reset - now:.0f}s for reset"
+                )
+            return start - now
+
+    def _update(self, headers):
+        with self._lock:
+            if 'x-ratelimit-remaining' in headers:
+                self.remaining = int(float(headers['x-ratelimit-remaining']))
+            if 'x-ratelimit-limit' in headers:
+                self.limit = int(float(headers['x-ratelimit-limit']))
+            if 'x-ratelimit-reset' in headers:
+                self.reset = int(float(headers['x-ratelimit-reset']))
+
+    def _retry_delay(self, verb, status, headers, output, attempt):
+        """Seconds to wait before retrying a request, or None to not retry.
+        """
+        if status in (403, 429):
+            if 'retry-after' in headers:
+                delay = float(headers['retry-after'])
+            elif headers.get('x-ratelimit-remaining') == "0":
+                reset = float(headers.get('x-ratelimit-reset', 0))
+                delay = max(reset - time.time(), 0) + 1
+            elif "secondary rate limit" in str(output).lower():
+                delay = max(self._backoff(attempt), SECONDARY_LIMIT_WAIT)
+            else:
+                return None  # permissions, not rate limits
+
+            # add jitter, and hold all other requests for as long
+            delay += random.uniform(0, self.backoff)
+            with self._lock:
+                self._blocked_until = max(self._blocked_until,
+                                          time.time() + delay)
+            return delay
+
+        if status in RETRY_STATUSES and verb == "GET":
+            return self._backoff(attempt)
+
+        return None
+
+    def _write(self, request, *args, **kwargs):
+        """Send a write, at least ``write_interval`` after the last one.
+
+        The interval is measured from the end of the previous write to the
+        actual start of this one, so a late wakeup can't shorten it.
+        """
+        with self._write_lock:
+            if self._last_write is not None:
+                wait = self._last_write + self.write_interval
+                if (delay := wait - time.monotonic()) > 0:
+                    time.sleep(delay)
+            try:
+                return request(*args, **kwargs)
+            finally:
+                self._last_write = time.monotonic()
+
+    def wrap(self, request, graphql_url=None):
+        """Schedule calls to a PyGithub ``Requester.requestJson``.
+
+        GraphQL requests (POSTs to ``graphql_url``) are queries, so they
+        aren't paced like writes.
+        """
+        @functools.wraps(request)
+        def scheduled(verb, url, *args, **kwargs):
+            is_write = verb in WRITE_VERBS and url != graphql_url
+            for attempt in itertools.count():
+                if (delay := self._delay_before()) > 0:
+                    time.sleep(delay)
+                if is_write:
+                    status, headers, output = self._write(
+                        request, verb, url, *args, **kwargs
+                    )
+                else:
+                    status, headers, output = request(verb, url, *args,
+                                                      **kwargs)
+                self._update(headers)
+                if attempt >= self.max_retries:
+                    break
+                delay = self._retry_delay(verb, status, headers, output,
+                                          attempt)
+                if delay is None:
+                    break
+                self.retries += 1
+                _logger.warning(f"{verb} {url} failed with status {status}; "
+                                f"retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+            return status, headers, output
+
+        return scheduled
+
+    def install(self, requester):
+        """Schedule all JSON requests made by a PyGithub ``Requester``.
+
+        This covers REST calls (including pagination) and GraphQL queries.
+        """
+        requester.requestJson = self.wrap(requester.requestJson,
+                                          requester.graphql_url)
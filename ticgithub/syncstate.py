@@ -0,0 +1,54 @@
+import json
+import pathlib
+
+from .utils.files import write_json_atomic
+
+__all__ = ["SyncState"]
+
+
+class SyncState:
+    """High-water marks for incremental mailbox synchronization.
+
+    For each mailbox, this records the UIDVALIDITY, the last UID that has
+    been seen, and (for servers supporting CONDSTORE) the HIGHESTMODSEQ.
+    New marks are held as pending until :meth:`.save` is called, so that a
+    run that fails partway will look at the same messages again next time.
+
+    Parameters
+    ----------
+    path : str
+        JSON file to store the state in
+    """
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self._pending = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self._marks = json.load(f)
+        else:
+            self._marks = {}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self.path}')"
+
+    def get(self, mailbox):
+        """Last saved mark for a mailbox (None if never synced)"""
+        return self._marks.get(mailbox)
+
+    def update(self, mailbox, uidvalidity, last_uid, highestmodseq=None):
+        """Record a new (pending) mark for a mailbox."""
+        self._pending[mailbox] = {
+            'uidvalidity': uidvalidity,
+            'last_uid': last_uid,
+            'highestmodseq': highestmodseq,
+        }
+
+    def save(self):
+        """Commit pending marks and write them to disk."""
+        if not self._pending:
+            return
+
+        self._marks.update(self._pending)
+        self._pending = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.path, self._marks)
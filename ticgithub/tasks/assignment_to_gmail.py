@@ -4,6 +4,25 @@ _logger = logging.getLogger(__name__)
 
 from .task import Task
 
+
+def gmail_labels_for_assignees(assignees, team):
+    """Get the GMail labels for the team members among the assignees.
+
+    Warns about any assignees who aren't on the team.
+    """
+    assignees = set(assignees)
+    ghuser_to_gmail_label = {
+        mem.github: mem.label for mem in team
+    }
+
+    # figure out who isn't on the team
+    non_team = assignees - set(ghuser_to_gmail_label)
+    if non_team:
+        warnings.warn("No GMail labels for the following assignees: "
+                      f"{non_team}")
+
+    return [ghuser_to_gmail_label[user] for user in assignees - non_team]
+
 class AssignmentToGMail(Task):
     CONFIG = 'assignment-to-gmail'
 
@@ -33,20 +52,8 @@ class AssignmentToGMail(Task):
                          f"issue {issue_number}")
             return
 
-        assignees = set(issue.assignees)
-        ghuser_to_gmail_label = {
-            mem.github: mem.label for mem in self.team
-        }
-
-        # figure out who isn't on the team
-        non_team = assignees - set(ghuser_to_gmail_label)
-        if non_team:
-            warnings.warn("No GMail labels for the following assignees: "
-                          f"{non_team}")
-
-        labels_to_assign = [
-            ghuser_to_gmail_label[user] for user in assignees - non_team
-        ]
+        labels_to_assign = gmail_labels_for_assignees(issue.assignees,
+                                                      self.team)
         _logger.info(f"FOR TICKET '{issue.unique_id}' ASSIGNING LABELS "
                      f"{labels_to_assign}")
         if not dry:
@@ -0,0 +1,44 @@
+import logging
+_logger = logging.getLogger(__name__)
+
+from .task import Task
+
+
+class BackfillTicketLabel(Task):
+    """Add the bot's ``ticket-label`` to existing email ticket issues.
+
+    Run this once after setting ``ticket-label``, so that tickets created
+    before then are also found by their label. Tickets are recognized by
+    the ticket ID in the issue body.
+    """
+    CONFIG = 'backfill-ticket-label'
+
+    @classmethod
+    def from_config(cls, cfg_dict):
+        # a one-off migration: run even without an entry under workflows
+        task = super().from_config(cfg_dict)
+        task.config = task.config or {'active': True}
+        return task
+
+    def _build_config(self):
+        return self.config
+
+    def _run(self, config, dry):
+        label = self.bot.ticket_label
+        if not label:
+            raise RuntimeError("The bot has no ticket-label to backfill")
+
+        n_labeled = 0
+        for issue in self.bot.get_all_issues():
+            if label in issue.labels or not issue.has_ticket_id:
+                continue
+            _logger.info(f"ADDING LABEL '{label}' TO ISSUE {issue.number}")
+            if not dry:
+                self.bot.add_labels(issue, [label])
+            n_labeled += 1
+
+        _logger.info(f"LABELED {n_labeled} TICKET ISSUES")
+
+
+if __name__ == "__main__":
+    BackfillTicketLabel.run_cli()
@@ -1,6 +1,9 @@
 import itertools
+import contextlib
 import string
-from datetime import timedelta, datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta, datetime, timezone
 from email.mime.text import MIMEText
 
 import logging
@@ -10,13 +13,17 @@ from ..issues import Issue, NoIssue
 from .task import Task
 from ..utils.datafiles import text_template
 from ..emailcleaners import clean_content
+from ..ticketindex import TicketIndex
+from ..filters import AddressFilter, SenderFilter, RuleFilter, FilterEngine
 
 
 # FILTERS
 #
 # Filters are designed to identify emails that should not be made into GitHub issues.
-# The filter returns a Callable[[Message], bool]. This callable should return True if
-# the Message should be excluded from the messages to turn into issues.
+# Each filter builder returns a filter from ticgithub.filters: a callable that takes a
+# Message and returns True if the Message should be excluded from the messages to turn
+# into issues. The filters are compiled from the config once, and are applied by a
+# FilterEngine, which keeps count of how many emails each filter excluded.
 
 def _log_emails(emails):
     for email in emails:
@@ -25,40 +32,45 @@ def _log_emails(emails):
         yield email
 
 def message_from_bot(inbox, bot, team, config):
-    def bot_filter_inner(msg):
-        _logger.debug("Checking message for bot senders")
-        if bot.smtp and bot.smtp.user in msg.get("From"):
-            _logger.debug("Filtered bot sender")
-            return True
-        else:
-            return False
-
-    return bot_filter_inner
+    addresses = [bot.smtp.user] if bot.smtp else []
+    return AddressFilter("bot", addresses)
 
 def message_from_team_not_to(inbox, bot, team, config):
-    def team_filter_inner(msg):
-        _logger.debug("Checking message for team senders")
-        is_team = any(mem.email in msg.get("From") for mem in team)
-        is_to = inbox.user in msg.get("To")
-        if is_team and not is_to:
-            _logger.debug("Filtered team sender")
-            return True
-        else:
-            return False
-
-    return team_filter_inner
+    return AddressFilter("team", [mem.email for mem in team],
+                         unless_to=inbox.user)
 
 def message_from_specified(inbox, bot, team, config):
-    def message_from_specified_inner(msg):
-        _logger.debug("Checking message for specified senders")
-        for sender in config['senders']:
-            if sender in msg.get("From"):
-                _logger.debug("Filtered specified sender")
-                return True
-            else:
-                return False
+    return SenderFilter("omit-senders", config['senders'])
+
+def message_matches_rule(inbox, bot, team, config):
+    rule = RuleFilter.from_config(config)
+    # download the headers the rule needs along with the standard ones, so
+    # the rule can run before message bodies are downloaded
+    inbox.prefetch_headers(rule.headers)
+    return rule
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
 
-    return message_from_specified_inner
+
+def _date_order(msg):
+    """Sort key for emails by date.
+
+    Naive dates (from a ``-0000`` zone) are taken as UTC; emails with a
+    missing or unparsable Date header go last.
+    """
+    try:
+        date = msg.date
+    except (TypeError, ValueError):
+        date = None
+    if not isinstance(date, datetime):
+        return datetime.max.replace(tzinfo=timezone.utc)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date
 
 
 def _reply_template(config):
@@ -79,27 +91,67 @@ class EmailsToIssues(Task):
         'bot': message_from_bot,
         'team': message_from_team_not_to,
         'omit-senders': message_from_specified,
+        'rule': message_matches_rule,
     }
+    TICKET_LOOKUPS = ("scan", "index", "search")
 
     def _build_filters(self, filt_config):
         filters = []
+        n_rules = 0
         for filt in filt_config:
+            if filt['name'] == 'rule':
+                # unnamed rules get distinct names, so hits are counted
+                # separately for each rule
+                n_rules += 1
+                filt = {'rule-name': f"rule-{n_rules}", **filt}
             if not filt.get("active", True):
                 continue
             filter_builder = self.FILTERS[filt['name']]
             new_filter = filter_builder(self.inbox, self.bot, self.team, filt)
             filters.append(new_filter)
-        return filters
+        return FilterEngine(filters)
 
     def _build_config(self):
         config_dict = self.config
-        filter_config = config_dict.get("filters")
+        filter_config = config_dict.get("filters") or []
         filters = self._build_filters(filter_config)
         recent = timedelta(**config_dict.get("recent", {'hours': 48}))
 
+        lookup_config = config_dict.get("ticket-lookup", {})
+        lookup = lookup_config.get("engine", "scan")
+        if lookup not in self.TICKET_LOOKUPS:
+            raise ValueError(f"Unknown ticket-lookup engine '{lookup}'")
+
         config = {
             'filters': filters,
             'recent': recent,
+            'ticket_lookup': lookup,
+            'min_budget': config_dict.get("min-budget"),
+        }
+        if lookup == "index":
+            config['ticket_index'] = TicketIndex(lookup_config['path'])
+        elif lookup == "search":
+            index_lag = lookup_config.get("index-lag", {'hours': 1})
+            config['ticket_search'] = {
+                'ids_per_query': lookup_config.get("ids-per-query", 6),
+                'queries_per_request': lookup_config.get(
+                    "queries-per-request", 10
+                ),
+                'index_lag': timedelta(**index_lag),
+            }
+
+        streaming = config_dict.get("streaming", {})
+        if streaming.get("active", bool(streaming)):
+            config['streaming'] = {
+                'batch_size': streaming.get("batch-size", 20),
+            }
+        else:
+            config['streaming'] = None
+
+        concurrency = config_dict.get("concurrency", {})
+        config['concurrency'] = {
+            'workers': concurrency.get("workers", 1),
+            'ordered': concurrency.get("ordered", True),
         }
 
         if reply_config := config_dict.get("reply-inbox"):
@@ -116,7 +168,10 @@ class EmailsToIssues(Task):
         contents = clean_content(contents)
 
         if not dry:
-            issue = self.bot.create_issue(msg.subject, contents)
+            # mark the issue as a ticket, so it can be found by its label
+            labels = [self.bot.ticket_label] if self.bot.ticket_label else None
+            issue = self.bot.create_issue(msg.subject, contents,
+                                          labels=labels)
             _logger.info(f"CREATED ISSUE {issue.number}")
         else:
             # used in dry run only
@@ -144,35 +199,207 @@ class EmailsToIssues(Task):
         if not dry:
             self.bot.smtp.sendmail(reply_email, [self.inbox.user])
 
+    def _existing_ticket_ids(self, config, candidates):
+        """Ticket IDs that already have issues in the repository.
+
+        Depending on the lookup engine, this may only include IDs from
+        ``candidates``.
+        """
+        if index := config.get('ticket_index'):
+            index.update(self.bot)
+            index.save()
+            return index.ticket_ids
+
+        if search_kwargs := config.get('ticket_search'):
+            return self.bot.find_existing_ticket_ids(candidates,
+                                                     **search_kwargs)
+
+        issues = self.bot.get_all_email_ticket_issues()
+        return {iss.unique_id for iss in issues}
+
+    def _create_issue(self, msg, config, dry):
+        issue = self.single_email_to_issue(msg, dry)
+        if (index := config.get('ticket_index')) and not dry:
+            with self._index_lock:
+                index.add(issue)
+                index.save()
+        return issue
+
+    def _reply(self, msg, issue, config, dry):
+        if template := config.get('reply_template'):
+            self.send_reply_email(msg, issue, template, dry)
+
+    def _create_issue_and_reply(self, msg, config, dry):
+        issue = self._create_issue(msg, config, dry)
+        self._reply(msg, issue, config, dry)
+
+    def _add_new_emails(self, messages, config, dry):
+        """Create issues and send replies; return a list of failures."""
+        concurrency = config['concurrency']
+        self._index_lock = threading.Lock()
+        failures = []
+        with ThreadPoolExecutor(max_workers=concurrency['workers']) as pool:
+            futures = {}
+            if concurrency['ordered']:
+                for msg in sorted(messages, key=_date_order):
+                    try:
+                        issue = self._create_issue(msg, config, dry)
+                    except Exception as e:
+                        failures.append((msg, e))
+                        continue
+                    future = pool.submit(self._reply, msg, issue, config,
+                                         dry)
+                    futures[future] = msg
+            else:
+                for msg in messages:
+                    future = pool.submit(self._create_issue_and_reply, msg,
+                                         config, dry)
+                    futures[future] = msg
+
+            for future in as_completed(futures):
+                if (exc := future.exception()) is not None:
+                    failures.append((futures[future], exc))
+
+        for msg, exc in failures:
+            _logger.error(f"FAILED ON EMAIL {msg.unique_id} "
+                          f"('{msg.subject}'): {exc!r}")
+
+        return failures
+
+    def add_new_emails(self, messages, config, dry):
+        """Create issues (and send replies) for new emails.
+
+        Work is spread over ``workers`` threads. The bot makes its GitHub
+        writes one at a time (as GitHub requires to avoid secondary rate
+        limits), so the gain is in overlapping replies and other work with
+        issue creation. If ``ordered``, issues are created in order of email
+        date, and only the replies run in parallel.
+
+        A failure for one email does not stop work on the others; an error
+        is raised after all emails have been tried.
+        """
+        failures = self._add_new_emails(messages, config, dry)
+        if failures:
+            raise RuntimeError(f"Failed to handle {len(failures)} of "
+                               f"{len(messages)} new emails")
+
+    def _filtered_emails(self, emails, config):
+        return config['filters'].filter(_log_emails(emails))
+
+    def _hydrate_and_filter(self, messages, config):
+        """Get bodies for new messages, then apply filters that need them.
+        """
+        # if the inbox only downloaded headers, get bodies for the survivors
+        messages = self.inbox.hydrate(messages)
+        if config['filters'].needs_body:
+            messages = config['filters'].filter_batch(messages,
+                                                      needs_body=True)
+        return messages
+
+    def _smtp_session(self, config, dry):
+        if config.get('reply_template') and not dry:
+            return self.bot.smtp.session()
+        return contextlib.nullcontext()
+
+    def _run_streaming(self, config, dry, since):
+        """Handle new emails in batches as they are downloaded.
+
+        Each batch of ``batch_size`` emails that pass the filters is checked
+        against the existing tickets, and issues are created for its new
+        emails before the next batch is downloaded. Memory use is bounded by
+        the batch size rather than by the number of emails.
+
+        Returns False if it stopped early because the GitHub rate limit
+        budget was low, so the remaining emails are left for the next run.
+        """
+        batch_size = config['streaming']['batch_size']
+        emails = self.inbox.iter_emails(since=since, incremental=True)
+        # the search engine looks up candidates; the others get all IDs
+        per_batch_lookup = config['ticket_lookup'] == "search"
+        if not per_batch_lookup:
+            existing_ids = self._existing_ticket_ids(config, set())
+
+        seen = set()
+        n_kept = n_new = 0
+        failures = []
+        complete = True
+        with self._smtp_session(config, dry):
+            for batch in _batched(self._filtered_emails(emails, config),
+                                  batch_size):
+                if self.budget_low(config['min_budget']):
+                    self._log_deferred()
+                    complete = False
+                    break
+
+                n_kept += len(batch)
+                candidates = {}
+                for msg in batch:
+                    if msg.unique_id not in seen:
+                        seen.add(msg.unique_id)
+                        candidates[msg.unique_id] = msg
+
+                if per_batch_lookup:
+                    existing_ids = self._existing_ticket_ids(
+                        config, set(candidates)
+                    )
+
+                new_messages = [msg for id_, msg in candidates.items()
+                                if id_ not in existing_ids]
+                new_messages = self._hydrate_and_filter(new_messages,
+                                                        config)
+                n_new += len(new_messages)
+                failures += self._add_new_emails(new_messages, config, dry)
+
+        config['filters'].log_stats()
+        _logger.info(f"Kept {n_kept} emails after filtering")
+        _logger.info(f"Added {n_new} new messages")
+        if failures:
+            raise RuntimeError(f"Failed to handle {len(failures)} of "
+                               f"{n_new} new emails")
+        return complete
+
+    def _log_deferred(self):
+        _logger.warning(f"Only {self.bot.remaining_requests()} GitHub "
+                        "requests left; leaving new emails for the next run")
+
     def _run(self, config, dry):
         _logger.debug(f"CONFIG: {config}")
+        if config.get('reply_template') and not self.bot.smtp:
+            raise RuntimeError(
+                "SMTP must be defined for bot to send replies."
+            )
+
         since = datetime.now() - config['recent']
-        emails = self.inbox.get_emails(since=since)
-        filtered = itertools.filterfalse(
-            lambda x: any(f(x) for f in config['filters']),
-            _log_emails(emails)
-        )
+        if config['streaming']:
+            complete = self._run_streaming(config, dry, since)
+            if complete and not dry:
+                self.inbox.save_sync_state()
+            return
 
+        emails = self.inbox.get_emails(since=since, incremental=True)
+        filtered = self._filtered_emails(emails, config)
 
-        issues = self.bot.get_all_email_ticket_issues()
         id_to_message = {msg.unique_id: msg for msg in filtered}
-        id_to_issue = {iss.unique_id: iss for iss in issues}
+        existing_ids = self._existing_ticket_ids(config, set(id_to_message))
 
-        ids_to_add = set(id_to_message) - set(id_to_issue)
+        ids_to_add = set(id_to_message) - existing_ids
         _logger.info(f"Downloaded {len(emails)} emails")
         _logger.info(f"Kept {len(id_to_message)} after filtering")
-        _logger.info(f"Adding {len(ids_to_add)} new messages")
-        for id_ in ids_to_add:
-            msg = id_to_message[id_]
-            issue = self.single_email_to_issue(msg, dry)
-            if template := config.get('reply_template'):
-                if not self.bot.smtp:
-                    # TODO: fail faster on this; validate config
-                    raise RuntimeError(
-                        "SMTP must be defined for bot to send replies."
-                    )
 
-                self.send_reply_email(msg, issue, template, dry)
+        new_messages = [id_to_message[id_] for id_ in ids_to_add]
+        new_messages = self._hydrate_and_filter(new_messages, config)
+        config['filters'].log_stats()
+        if new_messages and self.budget_low(config['min_budget']):
+            # without saving the sync state, these emails come back next run
+            self._log_deferred()
+            return
+
+        _logger.info(f"Adding {len(new_messages)} new messages")
+        with self._smtp_session(config, dry):
+            self.add_new_emails(new_messages, config, dry)
+
+        if not dry:
+            self.inbox.save_sync_state()
 
 if __name__ == "__main__":
     EmailsToIssues.run_cli()
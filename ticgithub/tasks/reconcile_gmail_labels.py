@@ -0,0 +1,45 @@
+import logging
+_logger = logging.getLogger(__name__)
+
+from .task import Task
+from .assignment_to_gmail import gmail_labels_for_assignees
+
+
+class ReconcileGMailLabels(Task):
+    """Re-sync the GMail labels of all open tickets from GitHub assignees.
+
+    This does in one pass what ``assignment-to-gmail`` does for a single
+    issue, e.g., to catch up after assignment events were missed. Only the
+    team members' labels are changed.
+    """
+    CONFIG = 'reconcile-gmail-labels'
+
+    def _build_config(self):
+        return self.config
+
+    def _run(self, config, dry):
+        _logger.info("LOADING OPEN TICKET ISSUES")
+        labels_by_ticket = {}
+        # with a ticket label, GitHub only lists the tickets
+        labels = [self.bot.ticket_label] if self.bot.ticket_label else None
+        for issue in self.bot.get_open_issues(labels=labels):
+            if not issue.is_ticket_issue:
+                continue
+            labels_by_ticket[issue.unique_id] = gmail_labels_for_assignees(
+                issue.assignees, self.team
+            )
+
+        _logger.info(f"SYNCING LABELS FOR {len(labels_by_ticket)} TICKETS")
+        managed = [mem.label for mem in self.team]
+        changes = self.inbox.sync_labels(labels_by_ticket, managed=managed,
+                                         dry=dry)
+        for ticket_id, (added, removed) in changes.items():
+            _logger.info(f"FOR TICKET '{ticket_id}' ADDING LABELS "
+                         f"{sorted(added)}, REMOVING LABELS "
+                         f"{sorted(removed)}")
+
+        _logger.info(f"UPDATED LABELS ON {len(changes)} TICKETS")
+
+
+if __name__ == "__main__":
+    ReconcileGMailLabels.run_cli()
@@ -21,6 +21,18 @@ class ReminderTask(Task):
             for label, snooze_time in snoozes.items():
                 snoozes[label] = timedelta(**snooze_time)
 
+        # adding a snooze label updates the issue, so an issue can go
+        # without updates for the delay plus the longest snooze
+        if updated_within := config.get('updated-within'):
+            quiet = config['delay'] + max((snoozes or {}).values(),
+                                          default=timedelta(0))
+            if timedelta(**updated_within) <= quiet:
+                raise ValueError(
+                    f"updated-within must be longer than the delay plus "
+                    f"the longest snooze ({quiet}), or some issues will "
+                    "never get a reminder"
+                )
+
         with open(template_file_name, 'r') as f:
             config['template'] = string.Template(f.read())
 
@@ -50,6 +62,11 @@ class ReminderTask(Task):
         # delay time is about the initial delay after a message is posted;
         # snooze time is about any snoozes that have been applied
         delay_time = self._extract_date(issue, config) + config['delay']
+        if now <= delay_time:
+            # no need to look up snoozes
+            _logger.debug(f"{delay_time=} not reached")
+            return
+
         # snooze_time set to date_created if no snoozes hav been applied;
         # this will be earlier than any other time (including `now`)
         snooze_time = self._get_snooze_time(issue, config)
@@ -67,11 +84,29 @@ class ReminderTask(Task):
             )
             _logger.info("COMMENT CONTENTS:\n" + comment)
             if not dry:
-                self.bot.make_comment(issue.number, comment)
+                self.bot.make_comment(issue, comment)
+
+    def updated_since(self):
+        """Earliest update time of issues to check, or None for all."""
+        if updated_within := self.config.get('updated-within'):
+            now = datetime.now(tz=timezone.utc)
+            return now - timedelta(**updated_within)
+        return None
+
+    def ticket_labels(self):
+        """Labels for GitHub to filter the issues by, or None.
+
+        If only email tickets are relevant and the bot marks tickets with a
+        label, only issues with that label need to be listed.
+        """
+        if self.config['email-ticket-only'] and self.bot.ticket_label:
+            return [self.bot.ticket_label]
+        return None
 
     def get_relevant_issues(self):
         issues = self._get_relevant_issues()
         if self.config['email-ticket-only']:
+            # with a ticket label, this checks labels rather than bodies
             issues = (iss for iss in issues if iss.is_ticket_issue)
         return issues
 
@@ -88,9 +123,41 @@ class ReminderTask(Task):
         else:
             return issue.date_created
 
+    @staticmethod
+    def _earliest_trigger(issue, config):
+        """Lower bound on the time a reminder can trigger for the issue.
+
+        The delay starts no earlier than the issue's creation, and a
+        reminder can't trigger before the delay ends, so this doesn't need
+        the issue's timeline.
+        """
+        return issue.date_created + config['delay']
+
     def _run(self, config, dry):
         # force now to be tz-unaware, but in UTC (appears to be what
         # PyGithub returns)
         now = datetime.now(tz=timezone.utc)
-        for issue in self.get_relevant_issues():
+        issues = sorted(self.get_relevant_issues(),
+                        key=lambda iss: self._earliest_trigger(iss, config))
+        n_checked = n_deferred = 0
+        for issue in issues:
+            if self._earliest_trigger(issue, config) >= now:
+                # this and all later issues were created too recently
+                break
+            if self.budget_low(config.get('min-budget')):
+                # reminders can wait; keep the requests for other workflows
+                n_deferred = sum(
+                    1 for iss in issues[n_checked:]
+                    if self._earliest_trigger(iss, config) < now
+                )
+                _logger.warning(
+                    f"Only {self.bot.remaining_requests()} GitHub requests "
+                    f"left; leaving {n_deferred} issues for the next run"
+                )
+                break
             self._single_issue_check(issue, config, now, dry)
+            n_checked += 1
+
+        _logger.info(f"Checked {n_checked} issues; skipped "
+                     f"{len(issues) - n_checked - n_deferred} created within "
+                     "the delay")
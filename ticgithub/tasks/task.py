@@ -5,11 +5,14 @@ import yaml
 
 from ..inbox import Inbox
 from ..gmail import GMailInbox
+from ..aioimap import AsyncInbox, AsyncGMailInbox
 from ..bot import Bot
 from ..team import TeamMember
 
 BOXTYPE_DISPATCH = {
-    'gmail': GMailInbox
+    'gmail': GMailInbox,
+    'gmail-async': AsyncGMailInbox,
+    'imap-async': AsyncInbox,
 }
 
 class Task:
@@ -81,6 +84,16 @@ class Task:
     def _run(self, config, dry):
         raise NotImplementedError()
 
+    def budget_low(self, min_budget):
+        """Whether fewer than ``min_budget`` GitHub requests are left.
+
+        Always False if ``min_budget`` is None or the budget isn't known yet.
+        """
+        if min_budget is None:
+            return False
+        budget = self.bot.remaining_requests()
+        return budget is not None and budget < min_budget
+
     def __call__(self, dry=False):
         # skip early if not in config or not active
         if not self.config or not self.config.get("active", True):
@@ -94,4 +107,6 @@ class Task:
                     if k not in {"active", "dry"}}
         cfg = self._build_config()
         _logger.info(f"Running {self} with config {cfg}")
-        self._run(cfg, dry)
+        # all inbox operations in this run share one IMAP connection
+        with self.inbox.session():
+            self._run(cfg, dry)
@@ -9,7 +9,11 @@ class UnassignedReminder(ReminderTask):
 
     def _get_relevant_issues(self):
         # unassigned issues
-        return self.bot.get_unassigned_issues()
+        return self.bot.get_unassigned_issues(
+            timeline=self.config.get('preload-timeline', False),
+            since=self.updated_since(),
+            labels=self.ticket_labels(),
+        )
 
     def _extract_date(self, issue, config):
         # issue creation date
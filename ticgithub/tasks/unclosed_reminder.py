@@ -7,9 +7,12 @@ class UnclosedReminder(ReminderTask):
     CONFIG = "unclosed-reminder"
 
     def _get_relevant_issues(self):
-        for issue in self.bot.get_open_issues():
-            if issue.assignees:
-                yield issue
+        # assigned issues
+        return self.bot.get_assigned_issues(
+            timeline=self.config.get('preload-timeline', False),
+            since=self.updated_since(),
+            labels=self.ticket_labels(),
+        )
 
     def _extract_date(self, issue, config):
         return issue.date_last_assigned
@@ -0,0 +1,145 @@
+"""
+Minimal in-process GitHub REST API for tests.
+
+Serves a single repository with its issues, reports a primary rate limit
+in the response headers, and can be told to answer the next requests with
+errors (e.g., secondary rate limits). Every request is recorded.
+"""
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGitHubState:
+    def __init__(self, repo="owner/repo", limit=5000):
+        self.repo = repo
+        self.limit = limit
+        self.remaining = limit
+        self.reset = int(time.time()) + 3600
+        self.issues = []
+        self.comments = {}
+        # (status, headers, body) to answer the next requests with
+        self.errors = []
+        # (verb, path, time) for every request
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def secondary_limit(self, n=1, retry_after=0):
+        """Answer the next ``n`` requests with secondary rate limit errors.
+        """
+        headers = {} if retry_after is None else {'Retry-After':
+                                                  str(retry_after)}
+        body = {'message': "You have exceeded a secondary rate limit."}
+        self.errors += [(403, headers, body)] * n
+
+
+class _GitHubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    @property
+    def base(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def _issue_json(self, issue):
+        return dict(issue, url=f"{self.base}/repos/{self.state.repo}"
+                                f"/issues/{issue['number']}")
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        with self.state.lock:
+            self.send_header("X-RateLimit-Limit", str(self.state.limit))
+            self.send_header("X-RateLimit-Remaining",
+                             str(self.state.remaining))
+            self.send_header("X-RateLimit-Reset", str(self.state.reset))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, verb):
+        self.state = state = self.server.state
+        path = urllib.parse.urlparse(self.path).path
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        with state.lock:
+            state.requests.append((verb, path, time.monotonic()))
+            state.remaining = max(state.remaining - 1, 0)
+            error = state.errors.pop(0) if state.errors else None
+        if error:
+            status, headers, error_body = error
+            return self._send(status, error_body, headers)
+
+        repo_path = f"/repos/{state.repo}"
+        if verb == "GET" and path == repo_path:
+            owner, name = state.repo.split("/")
+            return self._send(200, {
+                'full_name': state.repo, 'name': name,
+                'owner': {'login': owner}, 'url': self.base + repo_path,
+            })
+        if path == repo_path + "/issues":
+            if verb == "POST":
+                with state.lock:
+                    number = len(state.issues) + 1
+                    issue = {
+                        'number': number, 'title': body['title'],
+                        'body': body.get('body'), 'state': "open",
+                        'assignees': [], 'labels': [],
+                        'html_url': f"https://github.com/{state.repo}"
+                                    f"/issues/{number}",
+                    }
+                    state.issues.append(issue)
+                return self._send(201, self._issue_json(issue))
+            return self._send(200, [self._issue_json(iss)
+                                    for iss in state.issues])
+        if verb == "GET" and path.startswith(repo_path + "/issues/"):
+            number = int(path.split("/")[-1])
+            if 0 < number <= len(state.issues):
+                return self._send(200,
+                                  self._issue_json(state.issues[number - 1]))
+        if verb == "POST" and path.endswith("/comments"):
+            number = int(path.split("/")[-2])
+            with state.lock:
+                state.comments.setdefault(number, []).append(body['body'])
+            return self._send(201, {'id': 1, 'body': body['body']})
+
+        return self._send(404, {'message': "Not Found"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+class FakeGitHubServer:
+    """Fake GitHub API running in a background thread (context manager).
+    """
+    def __init__(self, repo="owner/repo", limit=5000):
+        self.state = FakeGitHubState(repo=repo, limit=limit)
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _GitHubHandler)
+        self._server.daemon_threads = True
+        self._server.state = self.state
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  kwargs={"poll_interval": 0.01},
+                                  daemon=True)
+        thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
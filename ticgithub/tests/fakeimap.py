@@ -0,0 +1,453 @@
+"""
+Minimal in-process IMAP server for tests and benchmarks.
+
+This implements just enough of IMAP4rev1 (plus the GMail X-GM-* extensions)
+for :mod:`imaplib` to talk to it. It is not a general-purpose server: the
+goal is to exercise our inbox code over a real socket, and to count the
+commands (round trips) and connections that the client makes.
+"""
+import re
+import socketserver
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+
+class FakeMessage:
+    def __init__(self, uid, raw, labels=None, gm_msgid=None, modseq=1):
+        self.uid = uid
+        self.raw = raw
+        self.labels = list(labels or [])
+        self.gm_msgid = gm_msgid if gm_msgid is not None else 10000 + uid
+        self.modseq = modseq
+
+    @property
+    def date(self):
+        headers = self.header_fields(["Date"]).decode("utf-8", "replace")
+        _, _, value = headers.partition(":")
+        return parsedate_to_datetime(value.strip())
+
+    def _header_block(self):
+        raw = self.raw.replace(b"\r\n", b"\n")
+        header, _, _ = raw.partition(b"\n\n")
+        return header.split(b"\n")
+
+    def header_fields(self, names):
+        wanted = {name.lower() for name in names}
+        lines = []
+        keep = False
+        for line in self._header_block():
+            if line[:1] in (b" ", b"\t"):
+                if keep:
+                    lines.append(line)
+                continue
+            name = line.split(b":", 1)[0].decode().lower()
+            keep = name in wanted
+            if keep:
+                lines.append(line)
+        return b"\r\n".join(lines + [b"", b""])
+
+
+def make_raw_email(n, sender="someone@example.com", to="inbox@example.com",
+                   subject=None, date="Mon, 02 Jan 2023 10:00:00 +0000",
+                   body=None, extra_headers=None):
+    """Create raw RFC822 bytes for a simple test email."""
+    subject = subject if subject is not None else f"Test message {n}"
+    body = body if body is not None else f"This is the body of message {n}."
+    headers = {
+        "From": sender,
+        "To": to,
+        "Subject": subject,
+        "Date": date,
+        "Message-ID": f"<message-{n}@example.com>",
+    }
+    headers.update(extra_headers or {})
+    lines = [f"{key}: {value}" for key, value in headers.items()]
+    lines += ["", body, ""]
+    return "\r\n".join(lines).encode("utf-8")
+
+
+def _tokenize(line):
+    """Tokenize a command line into atoms, quoted strings, and lists."""
+    tokens = []
+    stack = [tokens]
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if char == " ":
+            i += 1
+        elif char == "(":
+            new = []
+            stack[-1].append(new)
+            stack.append(new)
+            i += 1
+        elif char == ")":
+            stack.pop()
+            i += 1
+        elif char == '"':
+            end = i + 1
+            value = ""
+            while line[end] != '"':
+                if line[end] == "\\":
+                    end += 1
+                value += line[end]
+                end += 1
+            stack[-1].append(value)
+            i = end + 1
+        else:
+            end = i
+            depth = 0
+            while end < len(line):
+                if line[end] == "[":
+                    depth += 1
+                elif line[end] == "]":
+                    depth -= 1
+                elif depth == 0 and line[end] in " ()":
+                    break
+                end += 1
+            stack[-1].append(line[i:end])
+            i = end
+    return tokens
+
+
+def _parse_sequence_set(seqset, maximum):
+    values = set()
+    for part in seqset.split(","):
+        if ":" in part:
+            start, stop = part.split(":")
+            start = maximum if start == "*" else int(start)
+            stop = maximum if stop == "*" else int(stop)
+            start, stop = sorted([start, stop])
+            values.update(range(start, stop + 1))
+        else:
+            values.add(maximum if part == "*" else int(part))
+    return values
+
+
+def _quote_label(label):
+    if re.fullmatch(r"[^\s()\"\\]+", label):
+        return label
+    escaped = label.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+class FakeIMAPState:
+    """Shared state of the fake server: the mailbox and the counters."""
+    def __init__(self, messages=None, latency=0.0, uidvalidity=1,
+                 condstore=False):
+        self.messages = []
+        self.latency = latency
+        self.uidvalidity = uidvalidity
+        self.condstore = condstore
+        self.highestmodseq = 1
+        self.lock = threading.Lock()
+        self.commands = []
+        self.connections = 0
+        self.bytes_sent = 0
+        for raw in messages or []:
+            self.append(raw)
+
+    def append(self, raw, labels=None, gm_msgid=None):
+        uid = self.messages[-1].uid + 1 if self.messages else 1
+        self.highestmodseq += 1
+        msg = FakeMessage(uid, raw, labels=labels, gm_msgid=gm_msgid,
+                          modseq=self.highestmodseq)
+        self.messages.append(msg)
+        return msg
+
+    def reset_counters(self):
+        self.commands = []
+        self.connections = 0
+        self.bytes_sent = 0
+
+    def count(self, name):
+        return sum(1 for cmd in self.commands if cmd == name)
+
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.server.state.bytes_sent += len(data)
+        self.wfile.write(data)
+
+    def send_line(self, line):
+        self.send(line + "\r\n")
+
+    def handle(self):
+        state = self.server.state
+        with state.lock:
+            state.connections += 1
+        caps = "IMAP4rev1 X-GM-EXT-1"
+        if state.condstore:
+            caps += " CONDSTORE"
+        self.send_line(f"* OK [CAPABILITY {caps}] fake IMAP ready")
+        self.capabilities = caps
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            line = line.decode("utf-8").rstrip("\r\n")
+            tag, _, rest = line.partition(" ")
+            tokens = _tokenize(rest)
+            command = tokens[0].upper()
+            args = tokens[1:]
+            uid = False
+            if command == "UID":
+                uid = True
+                command = args[0].upper()
+                args = args[1:]
+            with state.lock:
+                state.commands.append(("UID " if uid else "") + command)
+            if state.latency:
+                time.sleep(state.latency)
+            method = getattr(self, f"do_{command.lower()}", None)
+            if method is None:
+                self.send_line(f"{tag} BAD unknown command {command}")
+                continue
+            with state.lock:
+                result = method(tag, args, uid)
+            if result == "BYE":
+                break
+        self.wfile.flush()
+
+    # individual commands ################################################
+    def do_capability(self, tag, args, uid):
+        self.send_line(f"* CAPABILITY {self.capabilities}")
+        self.send_line(f"{tag} OK CAPABILITY completed")
+
+    def do_login(self, tag, args, uid):
+        self.send_line(f"{tag} OK LOGIN completed")
+
+    def do_noop(self, tag, args, uid):
+        self.send_line(f"{tag} OK NOOP completed")
+
+    def do_logout(self, tag, args, uid):
+        self.send_line("* BYE logging out")
+        self.send_line(f"{tag} OK LOGOUT completed")
+        return "BYE"
+
+    def do_select(self, tag, args, uid):
+        state = self.server.state
+        self.send_line(f"* {len(state.messages)} EXISTS")
+        self.send_line("* 0 RECENT")
+        self.send_line(f"* OK [UIDVALIDITY {state.uidvalidity}] UIDs valid")
+        nextuid = state.messages[-1].uid + 1 if state.messages else 1
+        self.send_line(f"* OK [UIDNEXT {nextuid}] next UID")
+        if state.condstore:
+            self.send_line(f"* OK [HIGHESTMODSEQ {state.highestmodseq}] "
+                           "highest")
+        self.send_line(f"{tag} OK [READ-WRITE] SELECT completed")
+
+    def do_examine(self, tag, args, uid):
+        return self.do_select(tag, args, uid)
+
+    def _matches(self, msg, seq, criteria):
+        """Evaluate criteria (list of tokens) against a message.
+
+        Returns (matched, remaining_tokens).
+        """
+        state = self.server.state
+        key = criteria[0]
+        rest = criteria[1:]
+        if isinstance(key, list):
+            matched = True
+            sub = key
+            while sub:
+                result, sub = self._matches(msg, seq, sub)
+                matched = matched and result
+            return matched, rest
+        key = key.upper()
+        if key == "ALL":
+            return True, rest
+        if key == "SINCE":
+            since = datetime.strptime(rest[0], "%d-%b-%Y").date()
+            return msg.date.date() >= since, rest[1:]
+        if key == "X-GM-MSGID":
+            return msg.gm_msgid == int(rest[0]), rest[1:]
+        if key == "MODSEQ":
+            return msg.modseq > int(rest[0]), rest[1:]
+        if key == "UID":
+            maximum = state.messages[-1].uid if state.messages else 0
+            return msg.uid in _parse_sequence_set(rest[0], maximum), rest[1:]
+        if key == "OR":
+            left, rest = self._matches(msg, seq, rest)
+            right, rest = self._matches(msg, seq, rest)
+            return left or right, rest
+        if key == "NOT":
+            result, rest = self._matches(msg, seq, rest)
+            return not result, rest
+        if re.fullmatch(r"[0-9:*,]+", key):
+            maximum = len(state.messages)
+            return seq in _parse_sequence_set(key, maximum), rest
+        raise ValueError(f"Unsupported search key {key}")
+
+    def do_search(self, tag, args, uid):
+        state = self.server.state
+        found = []
+        for seq, msg in enumerate(state.messages, start=1):
+            criteria = list(args)
+            matched = True
+            while criteria:
+                result, criteria = self._matches(msg, seq, criteria)
+                matched = matched and result
+            if matched:
+                found.append(str(msg.uid if uid else seq))
+        self.send_line("* SEARCH " + " ".join(found)
+                       if found else "* SEARCH")
+        self.send_line(f"{tag} OK SEARCH completed")
+
+    def _select_messages(self, seqset, uid):
+        state = self.server.state
+        if not state.messages:
+            return []
+        if uid:
+            maximum = state.messages[-1].uid
+            wanted = _parse_sequence_set(seqset, maximum)
+            return [(seq, msg) for seq, msg in enumerate(state.messages, 1)
+                    if msg.uid in wanted]
+        wanted = _parse_sequence_set(seqset, len(state.messages))
+        return [(seq, msg) for seq, msg in enumerate(state.messages, 1)
+                if seq in wanted]
+
+    def _fetch_item(self, msg, item):
+        """Return (text, literal) for a single fetch item."""
+        upper = item.upper()
+        if upper == "UID":
+            return f"UID {msg.uid}", None
+        if upper == "X-GM-MSGID":
+            return f"X-GM-MSGID {msg.gm_msgid}", None
+        if upper == "X-GM-LABELS":
+            labels = " ".join(_quote_label(lbl) for lbl in msg.labels)
+            return f"X-GM-LABELS ({labels})", None
+        if upper == "MODSEQ":
+            return f"MODSEQ ({msg.modseq})", None
+        if upper == "RFC822.SIZE":
+            return f"RFC822.SIZE {len(msg.raw)}", None
+        if upper == "FLAGS":
+            return "FLAGS (\\Seen)", None
+        if upper in ("RFC822", "BODY[]", "BODY.PEEK[]"):
+            name = "RFC822" if upper == "RFC822" else "BODY[]"
+            return name, msg.raw
+        if upper.startswith(("BODY.PEEK[HEADER.FIELDS", "BODY[HEADER.FIELDS")):
+            fields = item[item.index("(") + 1:item.index(")")].split()
+            name = "BODY[HEADER.FIELDS (" + " ".join(fields).upper() + ")]"
+            return name, msg.header_fields(fields)
+        raise ValueError(f"Unsupported fetch item {item}")
+
+    def do_fetch(self, tag, args, uid):
+        seqset, items = args[0], args[1]
+        if not isinstance(items, list):
+            items = [items]
+        if uid and not any(str(i).upper() == "UID" for i in items):
+            items = ["UID"] + items
+        for seq, msg in self._select_messages(seqset, uid):
+            parts = [self._fetch_item(msg, item) for item in items]
+            simple = [text for text, literal in parts if literal is None]
+            literals = [(text, lit) for text, lit in parts
+                        if lit is not None]
+            prefix = f"* {seq} FETCH (" + " ".join(simple)
+            if not literals:
+                self.send_line(prefix + ")")
+                continue
+            for text, literal in literals:
+                sep = " " if prefix.strip()[-1] != "(" else ""
+                self.send(f"{prefix}{sep}{text} {{{len(literal)}}}\r\n")
+                self.send(literal)
+                prefix = ""
+            self.send_line(")")
+        self.send_line(f"{tag} OK FETCH completed")
+
+    def do_store(self, tag, args, uid):
+        state = self.server.state
+        seqset, action, labels = args[0], args[1].upper(), args[2]
+        if not isinstance(labels, list):
+            labels = [labels]
+        for seq, msg in self._select_messages(seqset, uid):
+            if action.startswith("+X-GM-LABELS"):
+                msg.labels += [lbl for lbl in labels
+                               if lbl not in msg.labels]
+            elif action.startswith("-X-GM-LABELS"):
+                msg.labels = [lbl for lbl in msg.labels
+                              if lbl not in labels]
+            elif action.startswith("X-GM-LABELS"):
+                msg.labels = list(labels)
+            else:
+                raise ValueError(f"Unsupported store {action}")
+            state.highestmodseq += 1
+            msg.modseq = state.highestmodseq
+            quoted = " ".join(_quote_label(lbl) for lbl in msg.labels)
+            self.send_line(f"* {seq} FETCH (UID {msg.uid} "
+                           f"X-GM-LABELS ({quoted}))")
+        self.send_line(f"{tag} OK STORE completed")
+
+
+class _ThreadedServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeIMAPServer:
+    """Fake IMAP server running in a background thread.
+
+    Use as a context manager; ``host`` and ``port`` give the address to
+    connect to, and ``state`` gives access to the mailbox and counters.
+    """
+    def __init__(self, messages=None, latency=0.0, uidvalidity=1,
+                 condstore=False):
+        self.state = FakeIMAPState(messages, latency=latency,
+                                   uidvalidity=uidvalidity,
+                                   condstore=condstore)
+        self._server = None
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._server = _ThreadedServer(("127.0.0.1", 0), _IMAPHandler)
+        self._server.state = self.state
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs={"poll_interval": 0.01},
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def plain_inbox(inbox_cls, server, secret="FAKE_IMAP_PASSWORD", **kwargs):
+    """Create an inbox of the given class that talks to a fake server.
+
+    The inbox connects with plain (non-SSL) IMAP; the caller must ensure
+    that the environment variable named by ``secret`` is set.
+    """
+    import imaplib
+    from ticgithub.aioimap import PipelinedIMAP, PipelinedInboxMixin
+
+    class PlainInbox(inbox_cls):
+        def _connect(self):
+            if isinstance(self, PipelinedInboxMixin):
+                return PipelinedIMAP(self.host, self.ssl_port,
+                                     depth=self.pipeline_depth)
+            return imaplib.IMAP4(self.host, port=self.ssl_port)
+
+    PlainInbox.__name__ = inbox_cls.__name__
+    return PlainInbox(host=server.host, user="inbox@example.com",
+                      secret=secret, ssl_port=server.port, **kwargs)
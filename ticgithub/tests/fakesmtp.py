@@ -0,0 +1,104 @@
+"""
+Minimal in-process SMTP server for tests.
+
+Accepts any login, records every message it receives, and counts the
+connections that clients open.
+"""
+import socketserver
+import threading
+
+
+class FakeSMTPState:
+    def __init__(self, drop_after=None):
+        self.connections = 0
+        self.messages = []
+        # close the connection after this many messages (to test reconnect)
+        self.drop_after = drop_after
+        self.lock = threading.Lock()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def send_line(self, line):
+        self.wfile.write((line + "\r\n").encode("utf-8"))
+
+    def handle(self):
+        state = self.server.state
+        with state.lock:
+            state.connections += 1
+        n_received = 0
+        self.send_line("220 fake SMTP ready")
+        while line := self.rfile.readline():
+            command = line.decode("utf-8").strip().split(" ")[0].upper()
+            if command == "EHLO":
+                self.send_line("250-fake.example.com")
+                self.send_line("250 AUTH PLAIN")
+            elif command == "HELO":
+                self.send_line("250 fake.example.com")
+            elif command == "AUTH":
+                self.send_line("235 authenticated")
+            elif command in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self.send_line("250 OK")
+            elif command == "DATA":
+                self.send_line("354 go ahead")
+                data = []
+                while (data_line := self.rfile.readline()) != b".\r\n":
+                    data.append(data_line)
+                with state.lock:
+                    state.messages.append(b"".join(data))
+                self.send_line("250 OK")
+                n_received += 1
+                if state.drop_after and n_received >= state.drop_after:
+                    break
+            elif command == "QUIT":
+                self.send_line("221 bye")
+                break
+            else:
+                self.send_line("502 not implemented")
+
+
+class _ThreadedServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeSMTPServer:
+    """Fake SMTP server running in a background thread (context manager).
+    """
+    def __init__(self, drop_after=None):
+        self.state = FakeSMTPState(drop_after=drop_after)
+        self._server = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def __enter__(self):
+        self._server = _ThreadedServer(("127.0.0.1", 0), _SMTPHandler)
+        self._server.state = self.state
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  kwargs={"poll_interval": 0.01},
+                                  daemon=True)
+        thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def plain_smtp(smtp_cls, server, secret="FAKE_SMTP_PASSWORD"):
+    """Create an SMTP of the given class that talks to a fake server."""
+    import smtplib
+
+    class PlainSMTP(smtp_cls):
+        def _open(self):
+            return smtplib.SMTP(self.host, self.port)
+
+    return PlainSMTP(user="bot@example.com", host=server.host,
+                     secret=secret, port=server.port)
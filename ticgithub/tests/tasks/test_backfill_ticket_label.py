@@ -0,0 +1,32 @@
+import pytest
+from unittest.mock import Mock
+
+from ticgithub.tasks.backfill_ticket_label import BackfillTicketLabel
+
+
+def _issue(number, has_ticket_id, labels=()):
+    return Mock(number=number, has_ticket_id=has_ticket_id,
+                labels=set(labels))
+
+
+@pytest.mark.parametrize('dry', [True, False])
+def test_backfill_ticket_label(dry):
+    issues = [
+        _issue(1, True),
+        _issue(2, True, labels=["email-ticket"]),
+        _issue(3, False),
+        _issue(4, True, labels=["bug"]),
+    ]
+    bot = Mock(ticket_label="email-ticket",
+               get_all_issues=Mock(return_value=iter(issues)))
+    task = BackfillTicketLabel(Mock(), bot, [], {})
+    task._run(task._build_config(), dry)
+
+    labeled = [call.args[0].number for call in bot.add_labels.call_args_list]
+    assert labeled == ([] if dry else [1, 4])
+
+
+def test_backfill_requires_label():
+    task = BackfillTicketLabel(Mock(), Mock(ticket_label=None), [], {})
+    with pytest.raises(RuntimeError, match="ticket-label"):
+        task._run(task._build_config(), dry=False)
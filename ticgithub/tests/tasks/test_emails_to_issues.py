@@ -0,0 +1,160 @@
+import pytest
+from unittest.mock import Mock
+import threading
+import time
+
+from datetime import datetime, timezone
+
+from ticgithub.tasks.emails_to_issues import EmailsToIssues
+
+
+def _message(n, day):
+    return Mock(unique_id=f"id-{n}", subject=f"Subject {n}",
+                date=datetime(2023, 1, day),
+                get=Mock(return_value="someone@example.com"),
+                get_content=Mock(return_value=f"Content {n}"))
+
+
+class TestAddNewEmails:
+    def setup_method(self):
+        self.created = []
+
+        def create_issue(title, content, labels=None):
+            self.created.append(title)
+            return Mock(number=len(self.created), html_url="url")
+
+        bot = Mock(create_issue=Mock(side_effect=create_issue),
+                   smtp=Mock(user="bot@example.com"), ticket_label=None)
+        inbox = Mock(user="inbox@example.com")
+        self.config = {
+            'filters': [],
+            'reply-inbox': {'active': True},
+            'concurrency': {'workers': 4},
+        }
+        self.task = EmailsToIssues(inbox, bot, [], self.config)
+        self.messages = [_message(n, day)
+                         for n, day in enumerate([3, 1, 4, 2, 5])]
+
+    @pytest.mark.parametrize('dry', [True, False])
+    def test_ordered(self, dry):
+        config = self.task._build_config()
+        self.task.add_new_emails(self.messages, config, dry)
+        if dry:
+            assert self.created == []
+            assert self.task.bot.smtp.sendmail.call_count == 0
+        else:
+            assert self.created == [f"Subject {n}" for n in [1, 3, 0, 2, 4]]
+            assert self.task.bot.smtp.sendmail.call_count == 5
+
+    def test_ordered_mixed_dates(self):
+        # naive (from a -0000 zone), aware, and missing dates
+        self.messages[0].date = datetime(2023, 1, 3, tzinfo=timezone.utc)
+        self.messages[2].date = None
+        config = self.task._build_config()
+        self.task.add_new_emails(self.messages, config, dry=False)
+        assert self.created == [f"Subject {n}" for n in [1, 3, 0, 4, 2]]
+
+    def test_replies_run_in_parallel(self):
+        active = []
+        max_active = []
+        lock = threading.Lock()
+
+        def sendmail(email, recipients):
+            with lock:
+                active.append(email)
+                max_active.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(email)
+
+        self.task.bot.smtp.sendmail.side_effect = sendmail
+        config = self.task._build_config()
+        self.task.add_new_emails(self.messages, config, dry=False)
+        assert max(max_active) > 1
+
+    def test_ticket_label(self):
+        self.task.bot.ticket_label = "email-ticket"
+        self.task.single_email_to_issue(self.messages[0], dry=False)
+        labels = self.task.bot.create_issue.call_args.kwargs['labels']
+        assert labels == ["email-ticket"]
+
+    @pytest.mark.parametrize('ordered', [True, False])
+    def test_partial_failure(self, ordered, caplog):
+        def create_issue(title, content, labels=None):
+            if title == "Subject 2":
+                raise ValueError("boom")
+            self.created.append(title)
+            return Mock(number=len(self.created), html_url="url")
+
+        self.task.bot.create_issue.side_effect = create_issue
+        self.config['concurrency']['ordered'] = ordered
+        config = self.task._build_config()
+        with pytest.raises(RuntimeError, match="1 of 5"):
+            self.task.add_new_emails(self.messages, config, dry=False)
+
+        assert sorted(self.created) == [f"Subject {n}" for n in [0, 1, 3, 4]]
+        assert self.task.bot.smtp.sendmail.call_count == 4
+        assert "FAILED ON EMAIL id-2" in caplog.text
+
+
+class TestStreaming:
+    def setup_method(self):
+        self.events = []
+        self.messages = [_message(n, n + 1) for n in range(5)]
+        # a duplicate of message 1, which already has an issue
+        self.messages.insert(3, _message(1, 2))
+
+        def iter_emails(since, incremental):
+            for msg in self.messages:
+                self.events.append(f"download {msg.unique_id}")
+                yield msg
+
+        def create_issue(title, content, labels=None):
+            self.events.append(f"create {title}")
+            return Mock(number=1, html_url="url")
+
+        inbox = Mock(user="inbox@example.com",
+                     iter_emails=Mock(side_effect=iter_emails),
+                     hydrate=Mock(side_effect=list))
+        issues = [Mock(unique_id="id-1")]
+        bot = Mock(create_issue=Mock(side_effect=create_issue),
+                   get_all_email_ticket_issues=Mock(return_value=issues),
+                   smtp=None, ticket_label=None)
+        self.config = {
+            'filters': [],
+            'streaming': {'batch-size': 2},
+        }
+        self.task = EmailsToIssues(inbox, bot, [], self.config)
+
+    def test_streaming(self):
+        config = self.task._build_config()
+        self.task._run(config, dry=False)
+        assert self.events == [
+            "download id-0", "download id-1", "create Subject 0",
+            "download id-2", "download id-1", "create Subject 2",
+            "download id-3", "download id-4", "create Subject 3",
+            "create Subject 4",
+        ]
+        self.task.bot.get_all_email_ticket_issues.assert_called_once()
+        assert self.task.inbox.hydrate.call_count == 3
+        self.task.inbox.save_sync_state.assert_called_once()
+
+    def test_streaming_stops_when_budget_low(self, caplog):
+        # each new issue uses 40 requests of a budget of 100
+        def remaining_requests():
+            creates = [e for e in self.events if e.startswith("create")]
+            return 100 - 40 * len(creates)
+
+        self.task.bot.remaining_requests = Mock(side_effect=remaining_requests)
+        self.config['min-budget'] = 30
+        config = self.task._build_config()
+        self.task._run(config, dry=False)
+        assert [e for e in self.events if e.startswith("create")] == [
+            "create Subject 0", "create Subject 2",
+        ]
+        assert "leaving new emails for the next run" in caplog.text
+        self.task.inbox.save_sync_state.assert_not_called()
+
+    def test_streaming_inactive(self):
+        self.config['streaming']['active'] = False
+        assert self.task._build_config()['streaming'] is None
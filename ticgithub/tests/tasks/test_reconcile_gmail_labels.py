@@ -0,0 +1,30 @@
+import pytest
+from unittest.mock import Mock
+
+from ticgithub.team import TeamMember
+from ticgithub.tasks.reconcile_gmail_labels import ReconcileGMailLabels
+
+
+@pytest.mark.parametrize('dry', [True, False])
+def test_reconcile_gmail_labels(dry):
+    team = [TeamMember(github="alice", email="a@example.com",
+                       label="assigned/alice"),
+            TeamMember(github="bob", email="b@example.com",
+                       label="assigned/bob")]
+    issues = [
+        Mock(is_ticket_issue=True, unique_id="1", assignees=["alice"]),
+        Mock(is_ticket_issue=True, unique_id="2", assignees=[]),
+        Mock(is_ticket_issue=False, assignees=["bob"]),
+    ]
+    bot = Mock(get_open_issues=Mock(return_value=iter(issues)),
+               ticket_label="email-ticket")
+    inbox = Mock(sync_labels=Mock(return_value={}))
+    task = ReconcileGMailLabels(inbox, bot, team, {})
+    task._run(task._build_config(), dry)
+
+    bot.get_open_issues.assert_called_once_with(labels=["email-ticket"])
+    inbox.sync_labels.assert_called_once_with(
+        {"1": ["assigned/alice"], "2": []},
+        managed=["assigned/alice", "assigned/bob"],
+        dry=dry,
+    )
@@ -2,7 +2,7 @@ import pytest
 from unittest.mock import Mock
 import logging
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from functools import partial
 
 from ticgithub.tasks.reminder_task import ReminderTask
@@ -133,3 +133,73 @@ class TestReminderTask:
         assert "CREATING COMMENT" not in log_messages
         assert "COMMENT CONTENTS" not in log_messages
         assert self.task.bot.make_comment.call_count == 0
+
+    def test_run_skips_recent_issues(self, caplog):
+        now = datetime.now(tz=timezone.utc)
+        issues = [
+            Mock(number=n, is_ticket_issue=True, labels=set(),
+                 date_created=now - timedelta(hours=hours))
+            for n, hours in [(1, 1), (2, 3), (3, 0.5), (4, 5)]
+        ]
+        self.task._get_relevant_issues = Mock(return_value=iter(issues))
+        self.task._extract_date = Mock(
+            side_effect=lambda issue, config: issue.date_created
+        )
+        with caplog.at_level(logging.INFO):
+            self.task._run(self.config, dry=False)
+
+        # only issues older than the 2-hour delay are checked
+        checked = [call.args[0].number
+                   for call in self.task._extract_date.call_args_list]
+        assert checked == [4, 2]
+        assert self.task.bot.make_comment.call_count == 2
+        assert "Checked 2 issues; skipped 2" in caplog.text
+
+    def test_run_stops_when_budget_low(self, caplog):
+        now = datetime.now(tz=timezone.utc)
+        issues = [
+            Mock(number=n, is_ticket_issue=True, labels=set(),
+                 date_created=now - timedelta(hours=hours))
+            for n, hours in [(1, 1), (2, 3), (3, 4), (4, 5)]
+        ]
+        self.task._get_relevant_issues = Mock(return_value=iter(issues))
+        self.task._extract_date = Mock(
+            side_effect=lambda issue, config: issue.date_created
+        )
+        # each reminder uses up a request
+        self.task.bot.remaining_requests = Mock(
+            side_effect=lambda: 11 - self.task.bot.make_comment.call_count
+        )
+        config = dict(self.config, **{'min-budget': 10})
+        with caplog.at_level(logging.INFO):
+            self.task._run(config, dry=False)
+
+        assert self.task.bot.make_comment.call_count == 2
+        assert "leaving 1 issues for the next run" in caplog.text
+        assert "Checked 2 issues; skipped 1" in caplog.text
+
+    @pytest.mark.parametrize('hours, valid', [(6, False), (7, False),
+                                              (8, True)])
+    def test_updated_within_covers_snoozes(self, hours, valid):
+        config = dict(self.task.config, **{
+            'updated-within': {'hours': hours},
+            'snooze-labels': {'snooze-5-hours': {'hours': 5}},
+        })
+        task = MockReminder(Mock(), Mock(make_comment=Mock()), Mock(), config)
+        if not valid:
+            with pytest.raises(ValueError, match="updated-within"):
+                task._build_config()
+            return
+
+        config = task._build_config()
+        # snooze label added (the last update) 5.5 hours ago, so the snooze
+        # is over and the issue is still listed
+        now = datetime.now(tz=timezone.utc)
+        snoozed_at = now - timedelta(hours=5.5)
+        issue = Mock(number=1, is_ticket_issue=True,
+                     date_created=now - timedelta(days=1),
+                     labels={'snooze-5-hours'},
+                     label_added=Mock(return_value=snoozed_at))
+        assert task.updated_since() < snoozed_at
+        task._single_issue_check(issue, config, now, dry=False)
+        assert task.bot.make_comment.call_count == 1
@@ -0,0 +1,95 @@
+import asyncio
+import imaplib
+import time
+
+import pytest
+
+from ticgithub.inbox import Inbox
+from ticgithub.aioimap import AsyncInbox, PipelinedIMAP
+from ticgithub.tests.fakeimap import FakeIMAPServer, make_raw_email, plain_inbox
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+    messages = [make_raw_email(n) for n in range(7)]
+    with FakeIMAPServer(messages) as server:
+        yield server
+
+
+class TestPipelinedIMAP:
+    def setup_method(self):
+        self.imap = None
+
+    def teardown_method(self):
+        if self.imap is not None:
+            self.imap.shutdown()
+
+    def test_select_response_codes(self, fake_server):
+        self.imap = PipelinedIMAP(fake_server.host, fake_server.port)
+        self.imap.login("inbox@example.com", "password")
+        typ, data = self.imap.select("INBOX")
+        assert typ == "OK"
+        assert data == [b"7"]
+        assert self.imap.response("UIDVALIDITY") == ("UIDVALIDITY", [b"1"])
+        assert self.imap.response("HIGHESTMODSEQ") == ("HIGHESTMODSEQ",
+                                                       [None])
+
+    def test_uid_pipelined(self, fake_server):
+        self.imap = PipelinedIMAP(fake_server.host, fake_server.port,
+                                  depth=2)
+        self.imap.login("inbox@example.com", "password")
+        self.imap.select("INBOX")
+        args = [(str(uid), "(UID RFC822)") for uid in range(1, 8)]
+        results = list(self.imap.uid_pipelined("FETCH", args))
+        assert [typ for typ, _ in results] == ["OK"] * 7
+        for uid, (typ, data) in enumerate(results, start=1):
+            envelope, literal = data[0]
+            assert envelope.startswith(f"{uid} (UID {uid} ".encode())
+            assert literal == fake_server.state.messages[uid - 1].raw
+
+    def test_slow_loop_start(self, fake_server, monkeypatch):
+        run_forever = asyncio.BaseEventLoop.run_forever
+
+        def slow_run_forever(loop):
+            time.sleep(0.05)
+            run_forever(loop)
+
+        monkeypatch.setattr(asyncio.BaseEventLoop, "run_forever",
+                            slow_run_forever)
+        self.imap = PipelinedIMAP(fake_server.host, fake_server.port)
+        assert self.imap.noop()[0] == "OK"
+
+    def test_bad_command(self, fake_server):
+        self.imap = PipelinedIMAP(fake_server.host, fake_server.port)
+        with pytest.raises(imaplib.IMAP4.error):
+            self.imap.uid("FROBNICATE")
+
+    def test_closed_connection(self, fake_server):
+        self.imap = PipelinedIMAP(fake_server.host, fake_server.port)
+        self.imap.shutdown()
+        with pytest.raises(imaplib.IMAP4.abort):
+            self.imap.noop()
+
+
+class TestAsyncInbox:
+    def test_get_emails_matches_imaplib(self, fake_server):
+        expected = plain_inbox(Inbox, fake_server).get_emails()
+        fake_server.state.reset_counters()
+        inbox = plain_inbox(AsyncInbox, fake_server, batch_size=2)
+        emails = inbox.get_emails()
+        assert [e.unique_id for e in emails] == [e.unique_id
+                                                 for e in expected]
+        assert [e.get_content() for e in emails] == [e.get_content()
+                                                     for e in expected]
+        assert inbox.uidvalidity == 1
+        assert fake_server.state.count("UID FETCH") == 4
+
+    def test_lazy_bodies(self, fake_server):
+        inbox = plain_inbox(AsyncInbox, fake_server, batch_size=3,
+                            lazy_bodies=True)
+        emails = inbox.get_emails()
+        assert not any(e.hydrated for e in emails)
+        inbox.hydrate(emails)
+        assert all(e.hydrated for e in emails)
+        assert emails[4].get_content().strip() == "This is the body of message 4."
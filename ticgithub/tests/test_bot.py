@@ -0,0 +1,303 @@
+import pytest
+from unittest.mock import Mock
+
+import github
+from datetime import datetime, timezone
+from email.mime.text import MIMEText
+
+from ticgithub.bot import Bot, SMTP
+from ticgithub.issues import Issue
+from ticgithub.tests.fakesmtp import FakeSMTPServer, plain_smtp
+
+
+def _body(ticket_id):
+    return f"ticket_id: '{ticket_id}'\nSubject: foo\n\n---\ncontent"
+
+
+class TestFindExistingTicketIds:
+    def setup_method(self):
+        self.bot = Bot("TOKEN", "owner/repo")
+        self.queries = []
+
+        def graphql(query, variables):
+            self.queries.append(variables)
+            results = {}
+            for alias, search in variables.items():
+                nodes = [
+                    {'number': 1, 'body': _body(tid)}
+                    for tid in ["id-0", "id-3", "id-9", "not-requested"]
+                    if f'"{tid}"' in search
+                ]
+                # fuzzy search matches that aren't really our ticket
+                nodes.append({'number': 2, 'body': _body("id-1-other")})
+                nodes.append({'number': 3, 'body': None})
+                results[alias] = {'issueCount': len(nodes), 'nodes': nodes}
+            return results
+
+        self.bot.graphql = Mock(side_effect=graphql)
+        self.bot.get_all_issues = Mock(return_value=[])
+
+    def test_batches_queries(self):
+        ids = {f"id-{i}" for i in range(20)}
+        found = self.bot.find_existing_ticket_ids(ids, ids_per_query=3,
+                                                  queries_per_request=2)
+        assert found == {"id-0", "id-3", "id-9"}
+        # 20 IDs / 3 per search = 7 searches; 2 searches per request
+        assert self.bot.graphql.call_count == 4
+        searches = [s for variables in self.queries
+                    for s in variables.values()]
+        assert len(searches) == 7
+        assert all(s.startswith("repo:owner/repo ") for s in searches)
+
+    def test_missing_checks_recent_issues(self):
+        recent = Mock(is_ticket_issue=True, unique_id="id-5")
+        self.bot.get_all_issues.return_value = [recent]
+        found = self.bot.find_existing_ticket_ids({"id-0", "id-5", "id-6"})
+        assert found == {"id-0", "id-5"}
+        assert self.bot.get_all_issues.call_count == 1
+
+    def test_truncated_search_uses_scan(self):
+        graphql = self.bot.graphql.side_effect
+
+        def truncated(query, variables):
+            results = graphql(query, variables)
+            for alias, search in variables.items():
+                if '"id-5"' in search:
+                    results[alias]['issueCount'] = 150
+            return results
+
+        self.bot.graphql.side_effect = truncated
+        issues = [Mock(unique_id="id-5"), Mock(unique_id="id-7")]
+        self.bot.get_all_email_ticket_issues = Mock(return_value=issues)
+        found = self.bot.find_existing_ticket_ids(
+            {"id-0", "id-5", "id-6", "id-7", "id-8"}, ids_per_query=3
+        )
+        # only IDs from the truncated search (id-0, id-5, id-6) are scanned
+        assert found == {"id-0", "id-5"}
+        self.bot.get_all_email_ticket_issues.assert_called_once()
+        assert self.bot.get_all_issues.call_count == 1
+
+    def test_search_failure_falls_back_to_scan(self):
+        self.bot.graphql.side_effect = github.GithubException(502)
+        issues = [Mock(unique_id="id-5"), Mock(unique_id="id-7")]
+        self.bot.get_all_email_ticket_issues = Mock(return_value=issues)
+        with pytest.warns(UserWarning, match="falling back"):
+            found = self.bot.find_existing_ticket_ids({"id-5", "id-6"})
+        assert found == {"id-5"}
+
+    def test_no_ids(self):
+        assert self.bot.find_existing_ticket_ids(set()) == set()
+        assert self.bot.graphql.call_count == 0
+
+
+def _issue_node(number, assignees=(), labels=(), events=(), total=None):
+    nodes = [
+        {'__typename': typename, 'createdAt': created, 'label': label}
+        for typename, created, label in events
+    ]
+    return {
+        'number': number,
+        'title': f"Issue {number}",
+        'body': _body(f"id-{number}"),
+        'url': f"https://github.com/owner/repo/issues/{number}",
+        'createdAt': "2023-01-01T00:00:00Z",
+        'updatedAt': "2023-01-02T00:00:00Z",
+        'assignees': {'nodes': [{'login': user} for user in assignees]},
+        'labels': {'nodes': [{'name': label} for label in labels]},
+        'timelineItems': {
+            'totalCount': len(nodes) if total is None else total,
+            'nodes': nodes,
+        },
+    }
+
+
+class TestOpenIssuesGraphQL:
+    def setup_method(self):
+        self.bot = Bot("TOKEN", "owner/repo")
+        pages = [
+            [_issue_node(
+                1, assignees=["alice"], labels=["snooze"],
+                events=[
+                    ("AssignedEvent", "2023-01-03T00:00:00Z", None),
+                    ("LabeledEvent", "2023-01-04T00:00:00Z", {'name': "snooze"}),
+                    ("AssignedEvent", "2023-01-05T00:00:00Z", None),
+                ],
+            )],
+            [_issue_node(2), _issue_node(3, total=500)],
+        ]
+
+        def graphql(query, variables):
+            page = int(variables['cursor'] or 0)
+            return {'repository': {'issues': {
+                'pageInfo': {'hasNextPage': page + 1 < len(pages),
+                             'endCursor': str(page + 1)},
+                'nodes': pages[page],
+            }}}
+
+        self.bot.graphql = Mock(side_effect=graphql)
+
+    def test_get_open_issues_timeline(self):
+        issues = list(self.bot.get_open_issues(timeline=True))
+        assert [iss.number for iss in issues] == [1, 2, 3]
+        assert self.bot.graphql.call_count == 2
+        first = issues[0]
+        assert first.assignees == ["alice"]
+        assert first.unique_id == "id-1"
+        assert first.date_created.isoformat() == "2023-01-01T00:00:00+00:00"
+        assert first.date_last_assigned.day == 5
+        assert first.label_added("snooze").day == 4
+        assert first.label_added("other") is None
+
+    def test_incomplete_timeline_uses_rest(self):
+        self.bot._github = Mock()
+        gh_issue = self.bot.repo.get_issue.return_value
+        gh_issue.get_timeline.return_value = [
+            Mock(event="assigned", created_at=datetime(2023, 1, 3),
+                 raw_data={}),
+            Mock(event="labeled", created_at=datetime(2023, 1, 4),
+                 raw_data={'label': {'name': "snooze"}}),
+        ]
+        issues = list(self.bot.get_open_issues(timeline=True))
+        assert issues[1]._timeline == []
+        assert issues[2]._timeline is None
+
+        issue = issues[2]
+        issue._issue.labels.append(Mock())
+        issue._issue.labels[-1].name = "snooze"
+        assert issue.date_last_assigned == datetime(2023, 1, 3)
+        assert issue.label_added("snooze") == datetime(2023, 1, 4)
+        self.bot.repo.get_issue.assert_called_once_with(3)
+
+    def test_refresh_graphql_issue(self):
+        self.bot._github = Mock()
+        gh_issue = self.bot.repo.get_issue.return_value
+        gh_issue.get_timeline.return_value = [
+            Mock(event="assigned", created_at=datetime(2023, 1, 9),
+                 raw_data={}),
+        ]
+        issue = list(self.bot.get_open_issues(timeline=True))[0]
+        issue.refresh()
+        assert issue.date_last_assigned == datetime(2023, 1, 9)
+
+    def test_get_unassigned_issues_filter(self):
+        list(self.bot.get_unassigned_issues(timeline=True))
+        variables = self.bot.graphql.call_args[0][1]
+        assert variables['filterBy'] == {'assignee': None}
+
+    def test_get_assigned_issues_filter(self):
+        since = datetime(2023, 1, 1, tzinfo=timezone.utc)
+        list(self.bot.get_assigned_issues(timeline=True, since=since))
+        variables = self.bot.graphql.call_args[0][1]
+        assert variables['filterBy'] == {
+            'assignee': "*", 'since': "2023-01-01T00:00:00+00:00",
+        }
+
+
+class TestOpenIssuesREST:
+    def setup_method(self):
+        self.bot = Bot("TOKEN", "owner/repo")
+        self.bot._github = Mock()
+        self.bot.repo.get_issues.return_value = [Mock(number=1)]
+
+    @pytest.mark.parametrize('method, assignee', [
+        ('get_unassigned_issues', "none"),
+        ('get_assigned_issues', "*"),
+    ])
+    def test_assignee_filter(self, method, assignee):
+        issues = list(getattr(self.bot, method)())
+        assert [iss.number for iss in issues] == [1]
+        self.bot.repo.get_issues.assert_called_once_with(state="open",
+                                                         assignee=assignee)
+
+    def test_ticket_label(self):
+        self.bot.ticket_label = "email-ticket"
+        gh_issue = Mock(number=1, body=_body("id-1"), labels=[Mock()])
+        gh_issue.labels[0].name = "email-ticket"
+        self.bot.repo.get_issues.return_value = [gh_issue]
+        issues = list(self.bot.get_open_issues(labels=["email-ticket"]))
+        assert [iss.unique_id for iss in issues] == ["id-1"]
+        assert issues[0].is_ticket_issue
+        self.bot.repo.get_issues.assert_called_once_with(
+            state="open", labels=["email-ticket"]
+        )
+
+    def test_dedup_finds_unlabelled_tickets(self):
+        # tickets from before the label was set must not be duplicated
+        self.bot.ticket_label = "email-ticket"
+        self.bot.repo.get_issues.return_value = [
+            Mock(number=1, body=_body("id-1"), labels=[])
+        ]
+        issues = list(self.bot.get_all_email_ticket_issues())
+        assert [iss.unique_id for iss in issues] == ["id-1"]
+        self.bot.repo.get_issues.assert_called_once_with(state="all")
+
+    def test_since(self):
+        since = datetime(2023, 1, 1, tzinfo=timezone.utc)
+        list(self.bot.get_open_issues(since=since))
+        self.bot.repo.get_issues.assert_called_once_with(state="open",
+                                                         since=since)
+
+
+class TestRepoCaching:
+    def setup_method(self):
+        self.bot = Bot("TOKEN", "owner/repo")
+        self.bot._github = Mock()
+
+    def test_repo_resolved_once(self):
+        assert self.bot.repo is self.bot.repo
+        self.bot.create_issue("title", "content")
+        assert self.bot.client.get_repo.call_count == 1
+
+    def test_make_comment_on_issue(self):
+        gh_issue = Mock(number=5)
+        self.bot.make_comment(Issue(gh_issue), "hello")
+        gh_issue.create_comment.assert_called_once_with("hello")
+        assert self.bot.client.get_repo.call_count == 0
+
+    def test_make_comment_on_number(self):
+        self.bot.make_comment(5, "hello")
+        self.bot.repo.get_issue.assert_called_once_with(5)
+        gh_issue = self.bot.repo.get_issue.return_value
+        gh_issue.create_comment.assert_called_once_with("hello")
+
+
+class TestSMTP:
+    def _emails(self, n):
+        emails = []
+        for i in range(n):
+            email = MIMEText(f"Reply {i}")
+            email["Subject"] = f"RE: {i}"
+            emails.append((email, ["inbox@example.com"]))
+        return emails
+
+    def test_sendmail_without_session(self, monkeypatch):
+        monkeypatch.setenv("FAKE_SMTP_PASSWORD", "password")
+        with FakeSMTPServer() as server:
+            smtp = plain_smtp(SMTP, server)
+            for email, recipients in self._emails(3):
+                smtp.sendmail(email, recipients)
+
+        assert server.state.connections == 3
+        assert len(server.state.messages) == 3
+
+    def test_session_reuses_connection(self, monkeypatch):
+        monkeypatch.setenv("FAKE_SMTP_PASSWORD", "password")
+        with FakeSMTPServer() as server:
+            smtp = plain_smtp(SMTP, server)
+            with smtp.session():
+                for email, recipients in self._emails(5):
+                    smtp.sendmail(email, recipients)
+            assert smtp._smtp is None
+            smtp.send_batch(self._emails(5))
+
+        assert server.state.connections == 2
+        assert len(server.state.messages) == 10
+
+    def test_reconnect_on_disconnect(self, monkeypatch):
+        monkeypatch.setenv("FAKE_SMTP_PASSWORD", "password")
+        with FakeSMTPServer(drop_after=2) as server:
+            smtp = plain_smtp(SMTP, server)
+            smtp.send_batch(self._emails(5))
+
+        assert len(server.state.messages) == 5
+        assert server.state.connections == 3
@@ -18,3 +18,31 @@ from ticgithub.emailcleaners import *
 ])
 def test_at_mention_cleaner(unclean, cleaned):
     assert at_mention_cleaner(unclean) == cleaned
+
+
+@pytest.mark.parametrize('unclean, cleaned', [
+    ("/@d", "/@<!-- -->d"),
+    ("@a and @b, not c@d", "@<!-- -->a and @<!-- -->b, not c@d"),
+    ("line\n@start", "line\n@<!-- -->start"),
+    ("@@twice", "@@<!-- -->twice"),
+    ("trailing @", "trailing @"),
+])
+def test_at_mention_cleaner_edge_cases(unclean, cleaned):
+    assert at_mention_cleaner(unclean) == cleaned
+
+
+def test_clean_content_chain():
+    hashes = PatternCleaner("issue_ref", r"#(?=[0-9])", "#<!-- -->")
+    calls = []
+
+    def shout(content):
+        calls.append(content)
+        return content.upper()
+
+    content = "see #12 from @bob"
+    cleaners = (at_mention_cleaner, hashes, shout)
+    assert clean_content(content, cleaners) == (
+        "SEE #<!-- -->12 FROM @<!-- -->BOB"
+    )
+    # both pattern cleaners were applied before the plain function
+    assert calls == ["see #<!-- -->12 from @<!-- -->bob"]
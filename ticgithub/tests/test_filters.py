@@ -0,0 +1,172 @@
+import pytest
+from unittest.mock import Mock
+
+from ticgithub.filters import (AddressFilter, SenderFilter, FilterEngine,
+                               RuleFilter, SizeCondition, LabelCondition,
+                               BodyCondition)
+from ticgithub.team import TeamMember
+from ticgithub.tasks.emails_to_issues import EmailsToIssues
+
+
+def _message(sender, to="inbox@example.com"):
+    headers = {"From": sender, "To": to}
+    return Mock(get=Mock(side_effect=headers.get))
+
+
+class TestAddressFilter:
+    @pytest.mark.parametrize('sender, expected', [
+        ("Bot <BOT@example.com>", True),
+        ("bot@example.com", True),
+        ("robot@example.com", False),
+        ("someone@example.com", False),
+    ])
+    def test_matches(self, sender, expected):
+        filt = AddressFilter("bot", ["bot@example.com"])
+        assert filt(_message(sender)) is expected
+
+    @pytest.mark.parametrize('to, expected', [
+        ("Inbox <inbox@example.com>, other@example.com", False),
+        ("other@example.com", True),
+    ])
+    def test_unless_to(self, to, expected):
+        filt = AddressFilter("team", ["alice@example.com"],
+                             unless_to="inbox@example.com")
+        assert filt(_message("Alice <alice@example.com>", to)) is expected
+
+
+class TestSenderFilter:
+    def setup_method(self):
+        self.filt = SenderFilter("omit-senders", [
+            "noreply@service.com", "@spam.example", "newsletter",
+        ])
+
+    @pytest.mark.parametrize('sender, expected', [
+        ("Service <NoReply@service.com>", True),
+        ("someone@spam.example", True),
+        ("someone@notspam.example", False),
+        ("Weekly Newsletter <news@example.com>", True),
+        ("someone@example.com", False),
+    ])
+    def test_matches(self, sender, expected):
+        assert self.filt(_message(sender)) is expected
+
+    def test_checks_every_sender(self):
+        # each configured sender is checked, not only the first
+        filt = SenderFilter("omit-senders", ["a@example.com",
+                                             "b@example.com"])
+        assert filt(_message("b@example.com"))
+
+
+def test_filter_engine_hits():
+    engine = FilterEngine([
+        AddressFilter("bot", ["bot@example.com"]),
+        SenderFilter("omit-senders", ["@spam.example"]),
+    ])
+    messages = [_message(sender) for sender in [
+        "bot@example.com", "a@spam.example", "b@spam.example",
+        "person@example.com",
+    ]]
+    kept = engine.filter_batch(messages)
+    assert kept == messages[3:]
+    assert engine.hits == {"bot": 1, "omit-senders": 2}
+    assert engine.checked == 4
+
+
+def test_emails_to_issues_builds_engine():
+    team = [TeamMember(github="alice", email="alice@example.com",
+                       label="assigned/alice")]
+    bot = Mock(smtp=Mock(user="bot@example.com"))
+    inbox = Mock(user="inbox@example.com")
+    config = {'filters': [
+        {'name': 'bot'},
+        {'name': 'team'},
+        {'name': 'omit-senders', 'senders': ["x@example.com"]},
+        {'name': 'omit-senders', 'senders': ["y@example.com"],
+         'active': False},
+    ]}
+    task = EmailsToIssues(inbox, bot, team, config)
+    engine = task._build_config()['filters']
+    assert [filt.name for filt in engine] == ["bot", "team", "omit-senders"]
+    assert engine.excluded_by(_message("alice@example.com",
+                                       "other@example.com")) == "team"
+    assert engine.excluded_by(_message("alice@example.com")) is None
+
+
+class TestRules:
+    def _message(self, headers, size=100, labels=(), content=""):
+        return Mock(get=Mock(side_effect=headers.get), size=size,
+                    labels=list(labels),
+                    get_content=Mock(return_value=content))
+
+    @pytest.mark.parametrize('match, expected', [
+        ([{'header': "Auto-Submitted", 'regex': "^auto-"}], True),
+        ([{'header': "Auto-Submitted", 'equals': "no"}], False),
+        ([{'header': "List-Unsubscribe"}], True),
+        ([{'header': "Precedence", 'present': False}], True),
+        ([{'size-over': 50}, {'label': "\\Inbox"}], True),
+        ([{'size-over': 500}], False),
+        ([{'size-under': 500}, {'label': "other"}], False),
+        ([{'body': "(?i)out of office"}], True),
+    ])
+    def test_rule(self, match, expected):
+        rule = RuleFilter.from_config({'match': match})
+        msg = self._message({"Auto-Submitted": "auto-replied",
+                             "List-Unsubscribe": "<mailto:x@example.com>"},
+                            labels=["\\Inbox"],
+                            content="I am Out of Office until Monday")
+        assert rule(msg) is expected
+
+    def test_cheap_conditions_first(self):
+        rule = RuleFilter.from_config({'match': [
+            {'body': "x"}, {'header': "Subject", 'regex': "x"},
+            {'size-over': 10}, {'header': "To", 'equals': "x"},
+        ]})
+        assert [type(cond).__name__ for cond in rule.conditions] == [
+            "SizeCondition", "HeaderCondition", "RegexHeaderCondition",
+            "BodyCondition",
+        ]
+        assert rule.needs_body
+        assert rule.headers == ["To", "Subject"]
+
+    def test_body_rules_run_separately(self):
+        header_rule = RuleFilter("big", [SizeCondition(over=1000)])
+        body_rule = RuleFilter("ooo", [BodyCondition("vacation")])
+        engine = FilterEngine([body_rule, header_rule])
+        messages = [self._message({}, size=2000, content="vacation"),
+                    self._message({}, size=10, content="vacation"),
+                    self._message({}, size=10, content="hello")]
+        kept = engine.filter_batch(messages)
+        assert kept == messages[1:]
+        assert not any(msg.get_content.called for msg in messages)
+        assert engine.filter_batch(kept, needs_body=True) == messages[2:]
+
+    def test_reorder(self):
+        rare = RuleFilter("rare", [SizeCondition(over=10**6)])
+        common = RuleFilter("common", [LabelCondition("spam")])
+        engine = FilterEngine([rare, common], reorder_every=10)
+        messages = [self._message({}, labels=["spam"]) for _ in range(20)]
+        engine.filter_batch(messages)
+        assert engine.filters == [common, rare]
+        assert engine.hits == {"common": 20}
+        # after reordering, the rare rule is no longer checked first
+        assert engine.evaluated[rare] < 20
+
+    def test_rule_prefetches_headers(self):
+        inbox = Mock(user="inbox@example.com")
+        config = {'filters': [{'name': 'rule', 'rule-name': "lists",
+                               'match': [{'header': "List-Id"}]}]}
+        task = EmailsToIssues(inbox, Mock(smtp=None), [], config)
+        engine = task._build_config()['filters']
+        assert [filt.name for filt in engine] == ["lists"]
+        inbox.prefetch_headers.assert_called_once_with(["List-Id"])
+
+    def test_unnamed_rules_distinct_names(self):
+        config = {'filters': [
+            {'name': 'rule', 'match': [{'header': "List-Id"}]},
+            {'name': 'rule', 'rule-name': "big",
+             'match': [{'size-over': 1000}]},
+            {'name': 'rule', 'match': [{'label': "spam"}]},
+        ]}
+        task = EmailsToIssues(Mock(), Mock(smtp=None), [], config)
+        engine = task._build_config()['filters']
+        assert [filt.name for filt in engine] == ["rule-1", "big", "rule-3"]
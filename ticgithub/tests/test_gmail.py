@@ -0,0 +1,110 @@
+import pytest
+
+from ticgithub.gmail import GMailInbox
+from ticgithub.aioimap import AsyncGMailInbox
+from ticgithub.tests.fakeimap import FakeIMAPServer, make_raw_email, plain_inbox
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+    messages = [make_raw_email(n) for n in range(5)]
+    with FakeIMAPServer(messages) as server:
+        server.state.messages[2].labels = ["\\Inbox", "assigned/alice"]
+        yield server
+
+
+@pytest.fixture(params=[GMailInbox, AsyncGMailInbox])
+def inbox_cls(request):
+    return request.param
+
+
+class TestGMailInbox:
+    def test_set_labels(self, inbox_cls, fake_server):
+        inbox = plain_inbox(inbox_cls, fake_server)
+        msgid = fake_server.state.messages[2].gm_msgid
+        inbox.set_labels(msgid, ["\\Inbox", "assigned/bob"])
+        assert fake_server.state.messages[2].labels == ["\\Inbox",
+                                                        "assigned/bob"]
+        assert fake_server.state.connections == 1
+        assert fake_server.state.count("UID SEARCH") == 1
+        assert fake_server.state.count("UID STORE") == 2
+
+    def test_set_labels_missing(self, inbox_cls, fake_server):
+        inbox = plain_inbox(inbox_cls, fake_server)
+        with pytest.raises(RuntimeError, match="not found"):
+            inbox.set_labels("123456789", ["assigned/bob"])
+        assert fake_server.state.count("UID STORE") == 0
+
+    def test_session_shares_connection(self, inbox_cls, fake_server):
+        inbox = plain_inbox(inbox_cls, fake_server)
+        state = fake_server.state
+        with inbox.session():
+            emails = inbox.get_emails()
+            inbox.set_labels(emails[0].unique_id, ["assigned/bob"])
+            inbox.set_labels(emails[1].unique_id, ["assigned/bob"])
+            assert state.connections == 1
+
+        assert state.count("LOGIN") == 1
+        assert state.count("LOGOUT") == 1
+        assert state.messages[1].labels == ["assigned/bob"]
+
+    def test_session_keepalive_reconnects(self, inbox_cls, fake_server):
+        inbox = plain_inbox(inbox_cls, fake_server, keepalive=0)
+        with inbox.session():
+            inbox.get_emails()
+            # simulate the server dropping an idle connection
+            inbox._session_imap.shutdown()
+            emails = inbox.get_emails()
+
+        assert len(emails) == 5
+        assert fake_server.state.connections == 2
+        assert fake_server.state.count("NOOP") == 0
+
+    def test_session_keepalive_noop(self, inbox_cls, fake_server):
+        inbox = plain_inbox(inbox_cls, fake_server, keepalive=0)
+        with inbox.session():
+            inbox.get_emails()
+            inbox.get_emails()
+
+        assert fake_server.state.count("NOOP") == 1
+        assert fake_server.state.connections == 1
+
+    def test_sync_labels(self, inbox_cls, fake_server):
+        inbox = plain_inbox(inbox_cls, fake_server)
+        state = fake_server.state
+        state.messages[0].labels = ["\\Inbox", "assigned/alice"]
+        state.messages[1].labels = ["\\Inbox"]
+        wanted = {
+            msg.gm_msgid: ["assigned/bob"] for msg in state.messages[:4]
+        }
+        wanted["12345"] = ["assigned/bob"]  # not in the mailbox
+        changes = inbox.sync_labels(wanted,
+                                    managed=["assigned/alice",
+                                             "assigned/bob"])
+
+        assert [msg.labels for msg in state.messages] == [
+            ["\\Inbox", "assigned/bob"],
+            ["\\Inbox", "assigned/bob"],
+            ["\\Inbox", "assigned/bob"],
+            ["assigned/bob"],
+            [],
+        ]
+        assert changes[str(state.messages[0].gm_msgid)] == (
+            {"assigned/bob"}, {"assigned/alice"}
+        )
+        assert len(changes) == 4
+        assert state.count("UID SEARCH") == 1
+        assert state.count("UID FETCH") == 1
+        # one STORE per label, over all messages needing it
+        assert state.count("UID STORE") == 2
+
+    def test_sync_labels_dry(self, inbox_cls, fake_server):
+        inbox = plain_inbox(inbox_cls, fake_server)
+        msgid = fake_server.state.messages[2].gm_msgid
+        changes = inbox.sync_labels({msgid: []}, dry=True)
+        assert changes == {str(msgid): (set(), {"\\Inbox",
+                                                "assigned/alice"})}
+        assert fake_server.state.count("UID STORE") == 0
+        assert fake_server.state.messages[2].labels == ["\\Inbox",
+                                                        "assigned/alice"]
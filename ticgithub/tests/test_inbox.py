@@ -0,0 +1,319 @@
+import pytest
+
+from ticgithub.inbox import *
+from ticgithub.inbox import uid_sequence_set, split_fetch_response
+from ticgithub.cache import MessageCache
+from ticgithub.syncstate import SyncState
+from ticgithub.gmail import GMailInbox
+from ticgithub.tests.fakeimap import FakeIMAPServer, make_raw_email, plain_inbox
+
+
+@pytest.mark.parametrize('uids, expected', [
+    ([1], "1"),
+    ([1, 2, 3], "1:3"),
+    ([b"1", b"2", b"3", b"5"], "1:3,5"),
+    ([7, 3, 4, 10, 11], "3:4,7,10:11"),
+])
+def test_uid_sequence_set(uids, expected):
+    assert uid_sequence_set(uids) == expected
+
+
+def test_split_fetch_response():
+    data = [
+        (b'1 (UID 4 RFC822 {3}', b'foo'),
+        b' X-GM-LABELS (bar))',
+        (b'2 (UID 5 RFC822 {3}', b'baz'),
+        b')',
+    ]
+    assert split_fetch_response(data) == [
+        (b'1 (UID 4 RFC822 {3} X-GM-LABELS (bar))', b'foo'),
+        (b'2 (UID 5 RFC822 {3})', b'baz'),
+    ]
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+    messages = [make_raw_email(n) for n in range(25)]
+    with FakeIMAPServer(messages) as server:
+        yield server
+
+
+class TestInbox:
+    @pytest.mark.parametrize('inbox_cls', [Inbox, GMailInbox])
+    @pytest.mark.parametrize('batch_size', [1, 10, None])
+    def test_get_emails_batched(self, fake_server, inbox_cls, batch_size):
+        inbox = plain_inbox(inbox_cls, fake_server, batch_size=batch_size)
+        emails = inbox.get_emails()
+        assert [msg.subject for msg in emails] == [
+            f"Test message {n}" for n in range(25)
+        ]
+        assert [msg.uid for msg in emails] == list(range(1, 26))
+        n_fetches = {1: 25, 10: 3, None: 1}[batch_size]
+        assert fake_server.state.count("UID FETCH") == n_fetches
+
+    def test_iter_emails_streams(self, fake_server):
+        inbox = plain_inbox(Inbox, fake_server, batch_size=10)
+        emails = inbox.iter_emails()
+        first = next(emails)
+        assert first.subject == "Test message 0"
+        # only the first batch has been downloaded so far
+        assert fake_server.state.count("UID FETCH") == 1
+        rest = list(emails)
+        assert [msg.uid for msg in rest] == list(range(2, 26))
+        assert fake_server.state.count("UID FETCH") == 3
+
+    def test_get_emails_gmail_extras(self, fake_server):
+        fake_server.state.messages[3].labels = ["assigned/foo", "\\Inbox"]
+        inbox = plain_inbox(GMailInbox, fake_server, batch_size=10)
+        emails = inbox.get_emails()
+        assert emails[3].labels == ["assigned/foo", "\\Inbox"]
+        assert emails[3].unique_id == str(fake_server.state.messages[3].gm_msgid)
+        assert emails[4].labels == []
+
+    @pytest.mark.parametrize('inbox_cls', [Inbox, GMailInbox])
+    def test_lazy_bodies(self, fake_server, inbox_cls):
+        big_body = "x" * 100_000
+        fake_server.state.append(make_raw_email(25, body=big_body))
+        inbox = plain_inbox(inbox_cls, fake_server, lazy_bodies=True)
+        emails = inbox.get_emails()
+        assert fake_server.state.bytes_sent < 100_000
+        assert not any(msg.hydrated for msg in emails)
+        assert emails[25].subject == "Test message 25"
+        assert emails[25].get("From") == "someone@example.com"
+        assert not emails[25].hydrated
+
+        fake_server.state.reset_counters()
+        inbox.hydrate(emails[-2:])
+        assert fake_server.state.count("UID FETCH") == 1
+        assert [msg.hydrated for msg in emails[-3:]] == [False, True, True]
+        assert emails[25].get_content().strip() == big_body
+
+    def test_hydrate_skips_expunged(self, fake_server, caplog):
+        inbox = plain_inbox(Inbox, fake_server, lazy_bodies=True)
+        emails = inbox.get_emails()[:3]
+        # message removed between the header and body downloads
+        del fake_server.state.messages[1]
+        hydrated = inbox.hydrate(emails)
+        assert [msg.uid for msg in hydrated] == [1, 3]
+        assert all(msg.hydrated for msg in hydrated)
+        assert "UIDs [2] disappeared" in caplog.text
+        with pytest.raises(RuntimeError, match="UID 2"):
+            emails[1].get_content()
+
+    def test_prefetch_headers(self, fake_server):
+        raw = make_raw_email(25, extra_headers={"List-Id": "<news.example>"})
+        fake_server.state.append(raw)
+        inbox = plain_inbox(GMailInbox, fake_server, lazy_bodies=True)
+        inbox.prefetch_headers(["list-id", "From"])
+        assert inbox.header_fields[-1] == "list-id"
+        msg = inbox.get_emails()[-1]
+        assert msg.get("List-Id") == "<news.example>"
+        assert msg.size == len(raw)
+        assert not msg.hydrated
+
+    def test_lazy_message_loads_itself(self, fake_server):
+        inbox = plain_inbox(Inbox, fake_server, lazy_bodies=True)
+        msg = inbox.get_emails()[4]
+        assert msg.get_content().strip() == "This is the body of message 4."
+        assert msg.hydrated
+
+
+class TestMessageCache:
+    def setup_method(self):
+        self.raw = [make_raw_email(n) for n in range(10)]
+
+    def _inbox(self, server, tmp_path, **kwargs):
+        cache = MessageCache(tmp_path / "cache", **kwargs)
+        return plain_inbox(Inbox, server, cache=cache)
+
+    def test_second_run_uses_cache(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+        with FakeIMAPServer(self.raw) as server:
+            first = self._inbox(server, tmp_path).get_emails()
+            server.state.append(make_raw_email(10))
+            server.state.reset_counters()
+            # new inbox object: the cache must come from disk
+            second = self._inbox(server, tmp_path).get_emails()
+            assert server.state.count("UID FETCH") == 1
+            assert server.state.bytes_sent < len(b"".join(self.raw))
+
+        assert [m.subject for m in second] == (
+            [m.subject for m in first] + ["Test message 10"]
+        )
+        assert second[3].get_content() == first[3].get_content()
+
+    def test_iter_emails_mixes_cached(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+        with FakeIMAPServer(self.raw) as server:
+            inbox = self._inbox(server, tmp_path)
+            inbox.batch_size = 2
+            inbox._get_emails("UID 2,5,6")
+            server.state.reset_counters()
+            emails = list(self._inbox(server, tmp_path).iter_emails())
+            assert server.state.count("UID FETCH") == 1
+
+        assert [m.uid for m in emails] == list(range(1, 11))
+        assert [m.subject for m in emails] == [f"Test message {n}"
+                                               for n in range(10)]
+
+    def test_uidvalidity_change_invalidates(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+        with FakeIMAPServer(self.raw) as server:
+            self._inbox(server, tmp_path).get_emails()
+
+        other = [make_raw_email(n, subject=f"Other {n}") for n in range(3)]
+        with FakeIMAPServer(other, uidvalidity=2) as server:
+            emails = self._inbox(server, tmp_path).get_emails()
+            assert server.state.count("UID FETCH") == 1
+
+        assert [m.subject for m in emails] == ["Other 0", "Other 1",
+                                               "Other 2"]
+
+    def test_lazy_bodies_are_cached(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+        with FakeIMAPServer(self.raw) as server:
+            inbox = self._inbox(server, tmp_path)
+            inbox.lazy_bodies = True
+            emails = inbox.get_emails()
+            inbox.hydrate(emails[:2])
+            server.state.reset_counters()
+            emails = inbox.get_emails()
+            assert server.state.count("UID FETCH") == 0
+
+        assert [m.hydrated for m in emails[:3]] == [True, True, False]
+
+    def test_cached_headers_missing_fields(self, monkeypatch, tmp_path):
+        from ticgithub.filters import HeaderCondition
+        monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+        raw = [make_raw_email(n, extra_headers={"List-Id": f"<list{n % 2}>"})
+               for n in range(4)]
+        condition = HeaderCondition("List-Id", equals="<list1>")
+        with FakeIMAPServer(raw) as server:
+            inbox = self._inbox(server, tmp_path)
+            inbox.lazy_bodies = True
+            inbox.get_emails()
+
+            # cached without List-Id: fetch the headers again, in one batch
+            server.state.reset_counters()
+            inbox = self._inbox(server, tmp_path)
+            inbox.lazy_bodies = True
+            inbox.prefetch_headers(condition.headers)
+            emails = inbox.get_emails()
+            matches = [msg.uid for msg in emails if condition(msg)]
+            assert server.state.count("UID FETCH") == 1
+            assert not any(msg.hydrated for msg in emails)
+
+            # now cached with List-Id
+            server.state.reset_counters()
+            emails = inbox.get_emails()
+            assert [msg.uid for msg in emails if condition(msg)] == matches
+            assert server.state.count("UID FETCH") == 0
+
+        assert matches == [2, 4]
+
+    def test_eviction(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+        with FakeIMAPServer(self.raw) as server:
+            inbox = self._inbox(server, tmp_path, max_entries=4)
+            inbox.get_emails()
+            mailbox_cache = inbox._mailbox_cache()
+
+        assert len(mailbox_cache.entries) == 4
+        assert len(list(mailbox_cache.directory.glob("*.eml"))) == 4
+
+    def test_from_config(self, tmp_path):
+        inbox = Inbox.from_config({
+            'type': "imap",
+            'host': "imap.example.com",
+            'user': "inbox@example.com",
+            'secret': "INBOX_PASSWORD",
+            'cache': {'path': str(tmp_path), 'max-age': {'days': 2}},
+        })
+        assert isinstance(inbox.cache, MessageCache)
+        assert inbox.cache.max_age.days == 2
+
+
+class TestIncrementalSync:
+    def _inbox(self, server, tmp_path):
+        sync_state = SyncState(tmp_path / "sync.json")
+        return plain_inbox(Inbox, server, sync_state=sync_state)
+
+    @pytest.mark.parametrize('condstore', [True, False])
+    def test_incremental(self, monkeypatch, tmp_path, condstore):
+        monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+        raw = [make_raw_email(n) for n in range(5)]
+        with FakeIMAPServer(raw, condstore=condstore) as server:
+            inbox = self._inbox(server, tmp_path)
+            assert len(inbox.get_emails(incremental=True)) == 5
+            # without saving, we see the same messages again
+            assert len(inbox.get_emails(incremental=True)) == 5
+            inbox.save_sync_state()
+
+            server.state.reset_counters()
+            inbox = self._inbox(server, tmp_path)
+            assert inbox.get_emails(incremental=True) == []
+            n_searches = 0 if condstore else 1
+            assert server.state.count("UID SEARCH") == n_searches
+
+            server.state.append(make_raw_email(5))
+            new = inbox.get_emails(incremental=True)
+            assert [msg.subject for msg in new] == ["Test message 5"]
+            # non-incremental calls are not affected
+            assert len(inbox.get_emails()) == 6
+
+    def test_uidvalidity_change_resyncs(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+        raw = [make_raw_email(n) for n in range(5)]
+        with FakeIMAPServer(raw) as server:
+            inbox = self._inbox(server, tmp_path)
+            inbox.get_emails(incremental=True)
+            inbox.save_sync_state()
+
+        with FakeIMAPServer(raw[:2], uidvalidity=7) as server:
+            inbox = self._inbox(server, tmp_path)
+            assert len(inbox.get_emails(incremental=True)) == 2
+
+
+class TestMessage:
+    def test_decoded_fields_are_cached(self, monkeypatch):
+        msg = Message(b"1 (UID 7)", make_raw_email(3))
+        assert not hasattr(msg, "__dict__")
+        assert msg.subject == "Test message 3"
+        assert msg.uid == 7
+        date = msg.date
+
+        def fail(*args):
+            raise AssertionError("decoded twice")
+
+        monkeypatch.setattr("ticgithub.inbox.decode_header", fail)
+        monkeypatch.setattr("ticgithub.inbox.parsedate_to_datetime", fail)
+        assert msg.subject == "Test message 3"
+        assert msg.date is date
+
+    def test_compact(self):
+        msg = Message(b"1 (UID 1)", make_raw_email(3))
+        content = msg.get_content()
+        msg.compact()
+        assert not msg._msg.is_multipart()
+        assert msg._msg.get_payload() is None
+        assert msg.get_content() == content
+        assert msg.get("From") == "someone@example.com"
+
+    def test_gmessage_labels(self):
+        from ticgithub.gmail import GMessage
+        extra = b'1 (UID 1 X-GM-MSGID 123 X-GM-LABELS ("\\\\Inbox" foo)'
+        msg = GMessage(extra, make_raw_email(3))
+        assert msg.unique_id == "123"
+        labels = msg.labels
+        assert labels == ["\\Inbox", "foo"]
+        labels.append("bar")
+        assert msg.labels == ["\\Inbox", "foo"]
+
+    def test_compact_messages_inbox(self, fake_server):
+        inbox = plain_inbox(Inbox, fake_server, compact_messages=True)
+        emails = inbox.get_emails()
+        assert all(msg._record is not None for msg in emails)
+        assert emails[3].get_content().strip() == (
+            "This is the body of message 3."
+        )
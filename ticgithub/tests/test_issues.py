@@ -0,0 +1,115 @@
+import pytest
+from unittest.mock import Mock
+from datetime import datetime
+
+from ticgithub.issues import Issue, NonTicketIssueError
+
+
+def _event(event, day, label=None):
+    raw_data = {'label': {'name': label}} if label else {}
+    return Mock(event=event, created_at=datetime(2023, 1, day),
+                raw_data=raw_data)
+
+
+class TestIssueTimeline:
+    def setup_method(self):
+        self.gh_issue = Mock(
+            number=1,
+            labels=[Mock()],
+            assignees=[Mock(login="alice")],
+            get_timeline=Mock(return_value=[
+                _event("assigned", 2),
+                _event("labeled", 3, "snooze"),
+                _event("assigned", 5),
+                _event("labeled", 4, "snooze"),
+                _event("labeled", 6, "other"),
+                _event("commented", 7),
+            ]),
+        )
+        self.gh_issue.labels[0].name = "snooze"
+        self.issue = Issue(self.gh_issue)
+
+    def test_timeline_fetched_once(self):
+        assert self.issue.date_last_assigned == datetime(2023, 1, 5)
+        assert self.issue.label_added("snooze") == datetime(2023, 1, 4)
+        assert self.issue.label_added("snooze") == datetime(2023, 1, 4)
+        assert self.issue.date_last_assigned == datetime(2023, 1, 5)
+        assert self.gh_issue.get_timeline.call_count == 1
+
+    def test_label_not_present(self):
+        # "other" was added at some point, but isn't on the issue now
+        assert self.issue.label_added("other") is None
+        assert self.gh_issue.get_timeline.call_count == 0
+
+    def test_labels_assignees_cached(self):
+        assert self.issue.labels == {"snooze"}
+        assert self.issue.assignees == ["alice"]
+        self.gh_issue.assignees = []
+        assert self.issue.assignees == ["alice"]
+
+    def test_refresh(self):
+        self.issue.date_last_assigned
+        self.issue.assignees
+        self.gh_issue.assignees = []
+        self.gh_issue.get_timeline.return_value = [_event("assigned", 9)]
+        self.issue.refresh()
+        self.gh_issue.update.assert_called_once()
+        assert self.issue.assignees == []
+        assert self.issue.date_last_assigned == datetime(2023, 1, 9)
+        assert self.gh_issue.get_timeline.call_count == 2
+
+
+class TestFrontmatter:
+    @pytest.mark.parametrize('body, expected', [
+        ("ticket_id: abc\nFrom: foo\n\n---\nsome: email\n", "abc"),
+        ("---\nticket_id: abc\n---\n{ not: [valid yaml\n", "abc"),
+        ("ticket_id: abc\n", "abc"),
+        ("ticket_id: abc\n--- \n---\n", "abc"),
+        ("ticket_id: '123'\n---\n--- not a separator\n", "123"),
+    ])
+    def test_get_frontmatter(self, body, expected):
+        assert Issue._get_frontmatter(body)['ticket_id'] == expected
+
+    def test_get_frontmatter_date(self):
+        body = "Date: '2023-01-02 10:00:00+00:00'\nticket_id: a\n---\n"
+        frontmatter = Issue._get_frontmatter(body)
+        assert frontmatter['Date'] == datetime.fromisoformat(
+            "2023-01-02 10:00:00+00:00"
+        )
+
+    def test_roundtrip_from_message(self):
+        message = Mock(unique_id="<abc@example.com>", subject="Hi",
+                       date=datetime(2023, 1, 2),
+                       get=Mock(return_value="someone@example.com"),
+                       get_content=Mock(return_value="---\nfoo: [bar\n"))
+        body = Issue.issue_body_from_message(message)
+        issue = Issue(Mock(body=body))
+        assert issue.unique_id == "<abc@example.com>"
+
+    def test_unique_id_cached(self):
+        gh_issue = Mock(body="ticket_id: abc\n---\n")
+        issue = Issue(gh_issue)
+        assert issue.unique_id == "abc"
+        gh_issue.body = "ticket_id: changed\n---\n"
+        assert issue.unique_id == "abc"
+        issue.refresh()
+        assert issue.unique_id == "changed"
+
+    @pytest.mark.parametrize('body', [None, "just some text", "a: [b\n"])
+    def test_not_ticket(self, body):
+        issue = Issue(Mock(number=3, body=body))
+        assert not issue.is_ticket_issue
+        with pytest.raises(NonTicketIssueError):
+            issue.unique_id
+
+    @pytest.mark.parametrize('label', ["email-ticket", "other"])
+    def test_ticket_label(self, label):
+        gh_issue = Mock(number=4, body="ticket_id: abc\n---\ncontent",
+                        labels=[Mock()])
+        gh_issue.labels[0].name = label
+        issue = Issue(gh_issue, ticket_label="email-ticket")
+        assert issue.is_ticket_issue == (label == "email-ticket")
+        assert issue.has_ticket_id
+        # the label check didn't need to parse the body
+        assert Issue(Mock(number=5, body=None, labels=[]),
+                     ticket_label="email-ticket").is_ticket_issue is False
@@ -0,0 +1,62 @@
+import pytest
+
+from email.message import EmailMessage
+
+from ticgithub.inbox import Message, Inbox
+from ticgithub.parsing import parse_record, ParserPool
+from ticgithub.tests.fakeimap import FakeIMAPServer, make_raw_email, plain_inbox
+
+
+def make_multipart(n, plain=True):
+    msg = EmailMessage()
+    msg["From"] = f"Sender {n} <sender{n}@example.com>"
+    msg["To"] = "inbox@example.com"
+    msg["Subject"] = f"Newsletter {n}"
+    msg["Date"] = "Mon, 02 Jan 2023 10:00:00 +0000"
+    msg["Message-ID"] = f"<newsletter-{n}@example.com>"
+    if plain:
+        msg.set_content(f"Plain text of newsletter {n}\n")
+    msg.add_alternative(f"<html><body><p>Newsletter {n}</p></body></html>",
+                        subtype="html")
+    msg.add_attachment(bytes(range(256)) * 10, maintype="application",
+                       subtype="octet-stream", filename="data.bin")
+    return msg.as_bytes()
+
+
+@pytest.mark.parametrize('plain', [True, False])
+def test_record_matches_message(plain):
+    raw = make_multipart(1, plain=plain)
+    record = parse_record(raw)
+    expected = Message(b"1 (UID 1)", raw)
+    from_record = Message(b"1 (UID 1)", raw, record=record)
+    assert from_record.get_content() == expected.get_content()
+    assert from_record.subject == expected.subject
+    assert from_record.get("From") == expected.get("From")
+    assert from_record.date == expected.date
+    assert record.size == len(raw)
+    with pytest.raises(ValueError):
+        record.get_content(["image/png"])
+
+
+def test_parser_pool():
+    raws = [make_multipart(n) for n in range(10)]
+    pool = ParserPool(2)
+    try:
+        assert pool.map(raws) == [parse_record(raw) for raw in raws]
+    finally:
+        pool.shutdown()
+
+
+def test_inbox_parse_workers(monkeypatch):
+    monkeypatch.setenv("FAKE_IMAP_PASSWORD", "password")
+    raws = [make_multipart(n) for n in range(4)] + [make_raw_email(4)]
+    with FakeIMAPServer(raws) as server:
+        expected = plain_inbox(Inbox, server).get_emails()
+        inbox = plain_inbox(Inbox, server, parse_workers=2)
+        with inbox.session():
+            emails = inbox.get_emails()
+
+    assert all(msg._record is not None for msg in emails)
+    assert [msg.get_content() for msg in emails] == [
+        msg.get_content() for msg in expected
+    ]
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from ticgithub.bot import Bot
+from ticgithub.ratelimit import RateLimitScheduler
+from ticgithub.tests.fakegithub import FakeGitHubServer
+
+
+def _bot(server, monkeypatch, **kwargs):
+    monkeypatch.setenv("FAKE_GITHUB_TOKEN", "token")
+    scheduler = RateLimitScheduler(**{'write_interval': 0.05,
+                                      'backoff': 0.01, **kwargs})
+    return Bot("FAKE_GITHUB_TOKEN", "owner/repo", rate_limit=scheduler,
+               base_url=server.base_url)
+
+
+class TestRateLimitScheduler:
+    def test_tracks_budget(self, monkeypatch):
+        with FakeGitHubServer(limit=100) as server:
+            bot = _bot(server, monkeypatch, reserve=10)
+            assert bot.remaining_requests() is None
+            bot.create_issue("title", "content")
+            list(bot.get_open_issues())
+
+        assert len(server.state.requests) == 3
+        assert bot.rate_limit.remaining == 97
+        assert bot.rate_limit.limit == 100
+        assert bot.remaining_requests() == 87
+
+    def test_paces_writes(self, monkeypatch):
+        with FakeGitHubServer() as server:
+            bot = _bot(server, monkeypatch)
+            for i in range(3):
+                bot.create_issue(f"Issue {i}", "content")
+            issue = bot.get_issue(1)
+            bot.make_comment(issue, "reminder")
+
+        writes = [t for verb, _, t in server.state.requests
+                  if verb == "POST"]
+        assert len(writes) == 4
+        gaps = [later - earlier for earlier, later in zip(writes, writes[1:])]
+        assert min(gaps) >= 0.04
+        assert server.state.comments == {1: ["reminder"]}
+
+    def test_retries_secondary_limit(self, monkeypatch):
+        with FakeGitHubServer() as server:
+            bot = _bot(server, monkeypatch)
+            bot.repo  # resolve the repo before the errors
+            server.state.secondary_limit(n=2)
+            issue = bot.create_issue("title", "content")
+
+        assert issue.number == 1
+        assert len(server.state.issues) == 1
+        assert bot.rate_limit.retries == 2
+
+    def test_gives_up_after_max_retries(self, monkeypatch):
+        import github
+        with FakeGitHubServer() as server:
+            bot = _bot(server, monkeypatch, max_retries=1)
+            bot.repo
+            server.state.secondary_limit(n=3)
+            with pytest.raises(github.GithubException):
+                bot.create_issue("title", "content")
+
+        # one try and one retry
+        assert len(server.state.requests) == 3
+        assert server.state.issues == []
+
+    def test_waits_for_reset_when_spent(self):
+        scheduler = RateLimitScheduler()
+        scheduler.remaining = 0
+        scheduler.reset = time.time() + 30
+        assert 29 < scheduler._delay_before() <= 30
+
+    def test_graphql_not_paced(self):
+        scheduler = RateLimitScheduler(write_interval=10)
+        request = scheduler.wrap(lambda verb, url: (200, {}, "{}"),
+                                 graphql_url="https://api/graphql")
+        start = time.monotonic()
+        for _ in range(3):
+            request("POST", "https://api/graphql")
+        assert time.monotonic() - start < 1
+
+    def test_no_retry_for_permissions(self):
+        scheduler = RateLimitScheduler()
+        headers = {'x-ratelimit-remaining': "4000"}
+        output = '{"message": "Resource not accessible by integration"}'
+        assert scheduler._retry_delay("POST", 403, headers, output, 0) is None
+        assert scheduler._retry_delay("POST", 502, {}, "", 0) is None
+        assert scheduler._retry_delay("GET", 502, {}, "", 0) is not None
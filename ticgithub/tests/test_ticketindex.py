@@ -0,0 +1,61 @@
+import pytest
+from unittest.mock import Mock, PropertyMock
+from datetime import datetime
+
+from ticgithub.issues import NonTicketIssueError
+from ticgithub.ticketindex import TicketIndex
+
+
+def _issue(number, ticket_id, updated):
+    issue = Mock(number=number, date_updated=updated)
+    if ticket_id is None:
+        err = NonTicketIssueError(f"Issue {number} has no ticket ID")
+        type(issue).unique_id = PropertyMock(side_effect=err)
+    else:
+        issue.unique_id = ticket_id
+    return issue
+
+
+class TestTicketIndex:
+    def setup_method(self):
+        self.issues = [
+            _issue(1, "ticket-1", datetime(2023, 1, 1)),
+            _issue(2, "ticket-2", datetime(2023, 1, 3)),
+            _issue(3, None, datetime(2023, 1, 2)),
+        ]
+        self.bot = Mock(get_all_issues=Mock(return_value=self.issues))
+
+    def test_update_and_reload(self, tmp_path):
+        index = TicketIndex(tmp_path / "index.json")
+        with pytest.warns(UserWarning):
+            index.update(self.bot)
+        self.bot.get_all_issues.assert_called_once_with(since=None)
+        assert index.ticket_ids == {"ticket-1", "ticket-2"}
+        assert index.last_sync == datetime(2023, 1, 3)
+        index.save()
+
+        reloaded = TicketIndex(tmp_path / "index.json")
+        assert reloaded.ticket_ids == {"ticket-1", "ticket-2"}
+        assert reloaded.last_sync == datetime(2023, 1, 3)
+
+    def test_incremental_update(self, tmp_path):
+        index = TicketIndex(tmp_path / "index.json")
+        with pytest.warns(UserWarning):
+            index.update(self.bot)
+
+        # issue 2 edited so that it is no longer a ticket; new ticket 4
+        self.bot.get_all_issues.return_value = [
+            _issue(2, None, datetime(2023, 1, 4)),
+            _issue(4, "ticket-4", datetime(2023, 1, 5)),
+        ]
+        index.update(self.bot, nonticket="ignore")
+        self.bot.get_all_issues.assert_called_with(
+            since=datetime(2023, 1, 3)
+        )
+        assert index.ticket_ids == {"ticket-1", "ticket-4"}
+        assert index.last_sync == datetime(2023, 1, 5)
+
+    def test_add(self, tmp_path):
+        index = TicketIndex(tmp_path / "index.json")
+        index.add(_issue(5, "ticket-5", datetime(2023, 1, 1)))
+        assert index.ticket_ids == {"ticket-5"}
@@ -0,0 +1,81 @@
+import json
+import pathlib
+import warnings
+from datetime import datetime
+
+from .issues import NonTicketIssueError
+from .utils.files import write_json_atomic
+
+import logging
+_logger = logging.getLogger(__name__)
+
+__all__ = ["TicketIndex"]
+
+
+class TicketIndex:
+    """Persistent map of issue number to email ticket ID.
+
+    Rather than listing every issue in the repository on every run, the
+    index remembers the most recent update time it has seen, and only asks
+    GitHub for issues updated since then.
+
+    Parameters
+    ----------
+    path : str
+        JSON file to store the index in
+    """
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.last_sync = None
+        self.tickets = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                index = json.load(f)
+            if last_sync := index.get('last_sync'):
+                self.last_sync = datetime.fromisoformat(last_sync)
+            self.tickets = {int(num): ticket_id
+                            for num, ticket_id in index['tickets'].items()}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self.path}')"
+
+    @property
+    def ticket_ids(self):
+        return set(self.tickets.values())
+
+    def add(self, issue):
+        """Add a newly created ticket issue to the index."""
+        self.tickets[issue.number] = issue.unique_id
+
+    def update(self, bot, nonticket="warn"):
+        """Bring the index up to date with issues updated since last sync.
+        """
+        _logger.info(f"Updating ticket index from {self.last_sync}")
+        n_updated = 0
+        for issue in bot.get_all_issues(since=self.last_sync):
+            n_updated += 1
+            try:
+                self.tickets[issue.number] = issue.unique_id
+            except NonTicketIssueError as e:
+                # may have been a ticket before the body was edited
+                self.tickets.pop(issue.number, None)
+                if nonticket == "warn":
+                    warnings.warn(str(e))
+                elif nonticket == "error":
+                    raise
+
+            if self.last_sync is None or issue.date_updated > self.last_sync:
+                self.last_sync = issue.date_updated
+
+        _logger.info(f"Checked {n_updated} updated issues; index has "
+                     f"{len(self.tickets)} tickets")
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        last_sync = self.last_sync.isoformat() if self.last_sync else None
+        index = {
+            'last_sync': last_sync,
+            'tickets': {str(num): ticket_id
+                        for num, ticket_id in self.tickets.items()},
+        }
+        write_json_atomic(self.path, index)
@@ -0,0 +1,16 @@
+import os
+import json
+import pathlib
+
+
+def write_json_atomic(path, data):
+    """Write ``data`` as JSON to ``path``, replacing it in one step.
+
+    The JSON is written to a temporary file next to ``path`` first, so an
+    interrupted write never leaves a partial file behind.
+    """
+    path = pathlib.Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, mode='w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)